@@ -0,0 +1,429 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""""Throughput and latency of every MockIAM operation by account size.
+
+Each operation is timed through mock_make_api_call directly and
+through a boto3 client, on accounts of each size, and the results
+are reported as JSON for regression comparison. Run it as a module
+from the project root, so mockboto3 is importable:
+
+    python -m benchmarks.endpoints --sizes 100 10000 --output out.json
+
+An account of size n has n users with one access key each, n / 10
+groups and 10 policies, every user is in one group and has one
+policy attached. Operations changing state act on extra bench users
+prepared before timing, so every call succeeds.
+"""
+
+import argparse
+import json
+import statistics
+import time
+
+from functools import partial
+from unittest.mock import patch
+
+from botocore import xform_name
+
+from mockboto3.core.clients import make_client
+from mockboto3.core.ids import SeededIds
+from mockboto3.iam.constants import POLICY_DOC, SIGNING_CERT
+from mockboto3.iam.endpoints import MockIAM
+
+ARN = 'arn:aws:iam::aws:policy/%s'
+BENCH_GROUP = 'bench-group'
+BENCH_POLICY = 'bench-policy'
+
+
+def account(size):
+    """Return fixture of an account with size users."""
+    groups = max(size // 10, 1)
+    return {
+        'policies': [{'name': 'policy%d' % index, 'document': POLICY_DOC}
+                     for index in range(10)],
+        'groups': [{'name': 'group%d' % index,
+                    'policies': ['policy%d' % (index % 10)]}
+                   for index in range(groups)],
+        'users': [{'name': 'user%d' % index,
+                   'groups': ['group%d' % (index % groups)],
+                   'policies': ['policy%d' % (index % 10)],
+                   'access_keys': 1}
+                  for index in range(size)],
+    }
+
+
+def bench_user(index):
+    return 'bench%d' % index
+
+
+def prepare_users(mocker, count, setup=None):
+    """Create bench users and run setup on each of them."""
+    call = mocker.mock_make_api_call
+    call('CreateGroup', {'GroupName': BENCH_GROUP})
+    call('CreatePolicy', {'PolicyName': BENCH_POLICY,
+                          'PolicyDocument': POLICY_DOC})
+    state = []
+    for index in range(count):
+        call('CreateUser', {'UserName': bench_user(index)})
+        state.append(setup(call, bench_user(index)) if setup else None)
+    return state
+
+
+def create_policy(call, user, versions=1):
+    """Create a policy named after the bench user with versions."""
+    call('CreatePolicy', {'PolicyName': user, 'PolicyDocument': POLICY_DOC})
+    for _ in range(versions - 1):
+        call('CreatePolicyVersion', {'PolicyArn': ARN % user,
+                                     'PolicyDocument': POLICY_DOC})
+
+
+def existing_user(size, index):
+    """Return a user of the account spread over the whole range."""
+    return 'user%d' % (index * 7919 % size)
+
+
+# Operation name to (setup run on each bench user or None,
+# kwargs for iteration index given the account size and setup results)
+CASES = {
+    'AddUserToGroup': (
+        None,
+        lambda size, state, index: {'UserName': bench_user(index),
+                                    'GroupName': BENCH_GROUP}
+    ),
+    'AttachGroupPolicy': (
+        lambda call, user: call('CreateGroup', {'GroupName': user}),
+        lambda size, state, index: {'GroupName': bench_user(index),
+                                    'PolicyArn': ARN % BENCH_POLICY}
+    ),
+    'AttachUserPolicy': (
+        None,
+        lambda size, state, index: {'UserName': bench_user(index),
+                                    'PolicyArn': ARN % BENCH_POLICY}
+    ),
+    'CreateAccessKey': (
+        None,
+        lambda size, state, index: {'UserName': bench_user(index)}
+    ),
+    'CreateGroup': (
+        None,
+        lambda size, state, index: {'GroupName': 'new%d' % index}
+    ),
+    'CreateLoginProfile': (
+        None,
+        lambda size, state, index: {'UserName': bench_user(index),
+                                    'Password': 'secret'}
+    ),
+    'CreatePolicy': (
+        None,
+        lambda size, state, index: {'PolicyName': 'new%d' % index,
+                                    'PolicyDocument': POLICY_DOC}
+    ),
+    'CreatePolicyVersion': (
+        create_policy,
+        lambda size, state, index: {'PolicyArn': ARN % bench_user(index),
+                                    'PolicyDocument': POLICY_DOC}
+    ),
+    'CreateUser': (
+        None,
+        lambda size, state, index: {'UserName': 'new%d' % index}
+    ),
+    'DeactivateMFADevice': (
+        lambda call, user: call('EnableMFADevice',
+                                {'UserName': user, 'SerialNumber': user,
+                                 'AuthenticationCode1': '123456',
+                                 'AuthenticationCode2': '654321'}),
+        lambda size, state, index: {'UserName': bench_user(index),
+                                    'SerialNumber': bench_user(index)}
+    ),
+    'DeleteAccessKey': (
+        lambda call, user: call('CreateAccessKey', {'UserName': user}),
+        lambda size, state, index: {
+            'UserName': bench_user(index),
+            'AccessKeyId': state[index]['AccessKey']['AccessKeyId']
+        }
+    ),
+    'DeleteGroup': (
+        lambda call, user: call('CreateGroup', {'GroupName': user}),
+        lambda size, state, index: {'GroupName': bench_user(index)}
+    ),
+    'DeleteLoginProfile': (
+        lambda call, user: call('CreateLoginProfile',
+                                {'UserName': user, 'Password': 'secret'}),
+        lambda size, state, index: {'UserName': bench_user(index)}
+    ),
+    'DeletePolicyVersion': (
+        partial(create_policy, versions=2),
+        lambda size, state, index: {'PolicyArn': ARN % bench_user(index),
+                                    'VersionId': 'v2'}
+    ),
+    'DeleteSigningCertificate': (
+        lambda call, user: call('UploadSigningCertificate',
+                                {'UserName': user,
+                                 'CertificateBody': SIGNING_CERT}),
+        lambda size, state, index: {
+            'UserName': bench_user(index),
+            'CertificateId': state[index]['Certificate']['CertificateId']
+        }
+    ),
+    'DeleteUser': (
+        None,
+        lambda size, state, index: {'UserName': bench_user(index)}
+    ),
+    'DetachGroupPolicy': (
+        lambda call, user: (
+            call('CreateGroup', {'GroupName': user}),
+            call('AttachGroupPolicy', {'GroupName': user,
+                                       'PolicyArn': ARN % BENCH_POLICY})
+        ),
+        lambda size, state, index: {'GroupName': bench_user(index),
+                                    'PolicyArn': ARN % BENCH_POLICY}
+    ),
+    'DetachUserPolicy': (
+        lambda call, user: call('AttachUserPolicy',
+                                {'UserName': user,
+                                 'PolicyArn': ARN % BENCH_POLICY}),
+        lambda size, state, index: {'UserName': bench_user(index),
+                                    'PolicyArn': ARN % BENCH_POLICY}
+    ),
+    'EnableMFADevice': (
+        None,
+        lambda size, state, index: {'UserName': bench_user(index),
+                                    'SerialNumber': bench_user(index),
+                                    'AuthenticationCode1': '123456',
+                                    'AuthenticationCode2': '654321'}
+    ),
+    'GetAccessKeyLastUsed': (
+        lambda call, user: call('CreateAccessKey', {'UserName': user}),
+        lambda size, state, index: {
+            'AccessKeyId': state[index]['AccessKey']['AccessKeyId']
+        }
+    ),
+    'GetLoginProfile': (
+        lambda call, user: call('CreateLoginProfile',
+                                {'UserName': user, 'Password': 'secret'}),
+        lambda size, state, index: {'UserName': bench_user(index)}
+    ),
+    'GetPolicy': (
+        None,
+        lambda size, state, index: {'PolicyArn': ARN % 'policy%d'
+                                    % (index % 10)}
+    ),
+    'GetPolicyVersion': (
+        None,
+        lambda size, state, index: {'PolicyArn': ARN % 'policy%d'
+                                    % (index % 10),
+                                    'VersionId': 'v1'}
+    ),
+    'GetUser': (
+        None,
+        lambda size, state, index: {
+            'UserName': existing_user(size, index)
+        }
+    ),
+    'GetUserPolicy': (
+        lambda call, user: call('AttachUserPolicy',
+                                {'UserName': user,
+                                 'PolicyArn': ARN % BENCH_POLICY}),
+        lambda size, state, index: {'UserName': bench_user(index),
+                                    'PolicyArn': ARN % BENCH_POLICY}
+    ),
+    'ListAccessKeys': (
+        None,
+        lambda size, state, index: {
+            'UserName': existing_user(size, index)
+        }
+    ),
+    'ListAttachedGroupPolicies': (
+        None,
+        lambda size, state, index: {'GroupName': 'group0'}
+    ),
+    'ListAttachedUserPolicies': (
+        None,
+        lambda size, state, index: {
+            'UserName': existing_user(size, index)
+        }
+    ),
+    'ListGroups': (
+        None,
+        lambda size, state, index: {}
+    ),
+    'ListGroupsForUser': (
+        None,
+        lambda size, state, index: {
+            'UserName': existing_user(size, index)
+        }
+    ),
+    'ListMFADevices': (
+        None,
+        lambda size, state, index: {
+            'UserName': existing_user(size, index)
+        }
+    ),
+    'ListPolicyVersions': (
+        None,
+        lambda size, state, index: {'PolicyArn': ARN % 'policy%d'
+                                    % (index % 10)}
+    ),
+    'ListSigningCertificates': (
+        None,
+        lambda size, state, index: {
+            'UserName': existing_user(size, index)
+        }
+    ),
+    'ListUsers': (
+        None,
+        lambda size, state, index: {}
+    ),
+    'RemoveUserFromGroup': (
+        lambda call, user: call('AddUserToGroup', {'UserName': user,
+                                                   'GroupName': BENCH_GROUP}),
+        lambda size, state, index: {'UserName': bench_user(index),
+                                    'GroupName': BENCH_GROUP}
+    ),
+    'SetDefaultPolicyVersion': (
+        partial(create_policy, versions=2),
+        lambda size, state, index: {'PolicyArn': ARN % bench_user(index),
+                                    'VersionId': 'v2'}
+    ),
+    'SimulateCustomPolicy': (
+        None,
+        lambda size, state, index: {
+            'PolicyInputList': [POLICY_DOC],
+            'ActionNames': ['iam:GetUser', 'iam:CreateUser'],
+            'ResourceArns': ['*']
+        }
+    ),
+    'SimulatePrincipalPolicy': (
+        None,
+        lambda size, state, index: {
+            'PolicySourceArn': 'arn:aws:iam::123456789012:user/%s'
+                               % existing_user(size, index),
+            'ActionNames': ['iam:GetUser', 'iam:CreateUser']
+        }
+    ),
+    'UpdateAccessKey': (
+        lambda call, user: call('CreateAccessKey', {'UserName': user}),
+        lambda size, state, index: {
+            'UserName': bench_user(index),
+            'AccessKeyId': state[index]['AccessKey']['AccessKeyId'],
+            'Status': 'Inactive'
+        }
+    ),
+    'UpdateLoginProfile': (
+        lambda call, user: call('CreateLoginProfile',
+                                {'UserName': user, 'Password': 'secret'}),
+        lambda size, state, index: {'UserName': bench_user(index),
+                                    'Password': 'changed'}
+    ),
+    'UpdateSigningCertificate': (
+        lambda call, user: call('UploadSigningCertificate',
+                                {'UserName': user,
+                                 'CertificateBody': SIGNING_CERT}),
+        lambda size, state, index: {
+            'UserName': bench_user(index),
+            'CertificateId': state[index]['Certificate']['CertificateId'],
+            'Status': 'Inactive'
+        }
+    ),
+    'UploadSigningCertificate': (
+        None,
+        lambda size, state, index: {'UserName': bench_user(index),
+                                    'CertificateBody': SIGNING_CERT}
+    ),
+}
+
+
+def client_call(method, kwargs):
+    return method(**kwargs)
+
+
+def summarize(latencies):
+    """Return ops/sec and latency percentiles in microseconds."""
+    latencies = sorted(latencies)
+    total = sum(latencies)
+    return {
+        'calls': len(latencies),
+        'ops_per_sec': round(len(latencies) / total, 1) if total else None,
+        'mean_us': round(total / len(latencies) * 1e6, 2),
+        'p50_us': round(statistics.median(latencies) * 1e6, 2),
+        'p99_us': round(latencies[int(len(latencies) * 0.99)] * 1e6, 2),
+    }
+
+
+def run_case(baseline, name, iterations, client=None):
+    """Return the timings of iterations calls of operation name.
+
+    Calls go through the client if given, else straight to the mock.
+    """
+    mocker = MockIAM(ids=SeededIds())
+    mocker.restore(baseline)
+
+    setup, make_kwargs = CASES[name]
+    state = prepare_users(mocker, iterations, setup)
+    size = len(baseline.stores['users'])
+    calls = [make_kwargs(size, state, index)
+             for index in range(iterations)]
+
+    latencies = []
+    clock = time.perf_counter
+    if client is None:
+        call = partial(mocker.mock_make_api_call, name)
+    else:
+        call = partial(client_call, getattr(client, xform_name(name)))
+
+    with patch('botocore.client.BaseClient._make_api_call',
+               new=mocker.mock_make_api_call):
+        try:
+            for kwargs in calls:
+                start = clock()
+                call(kwargs)
+                latencies.append(clock() - start)
+        except Exception as error:
+            # Reported instead of timed, e.g. a handler bug or mocked
+            # parameters the AWS API does not accept
+            return {'error': '%s: %s' % (type(error).__name__,
+                                         str(error).splitlines()[0])}
+    return summarize(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[100, 10000, 100000])
+    parser.add_argument('--iterations', type=int, default=1000,
+                        help='Direct calls per operation and size.')
+    parser.add_argument('--client-iterations', type=int, default=100,
+                        help='boto3 client calls per operation and size.')
+    parser.add_argument('--operations', nargs='+', default=sorted(CASES),
+                        help='Only benchmark these operations.')
+    parser.add_argument('--output', help='Write results to this file.')
+    args = parser.parse_args()
+
+    client = make_client('iam')
+
+    results = {}
+    for size in args.sizes:
+        builder = MockIAM(ids=SeededIds())
+        builder.load(account(size))
+        baseline = builder.snapshot()
+
+        for name in args.operations:
+            results.setdefault(name, {})[str(size)] = {
+                'direct': run_case(baseline, name, args.iterations),
+                'boto3': run_case(baseline, name, args.client_iterations,
+                                  client),
+            }
+
+    output = json.dumps({'sizes': args.sizes,
+                         'iterations': args.iterations,
+                         'client_iterations': args.client_iterations,
+                         'operations': results}, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(output)
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
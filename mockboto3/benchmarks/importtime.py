@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""""Import time of mockboto3 modules against a budget.
+
+Each module is imported in fresh interpreters with -X importtime and
+the median cumulative import time is reported as JSON. The exit
+status is 1 if a module exceeds its budget or loads a module kept
+out of the import path, so the script can gate CI. Run it as a
+module from the project root, so mockboto3 is importable:
+
+    python -m benchmarks.importtime --runs 7 --output importtime.json
+
+Budgets include the dependencies a module imports, except those
+already loaded in its context such as pytest for the plugin. They
+are meant to catch regressions such as an eager import of
+botocore.client, not to measure the module itself precisely.
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+# Module to budget of cumulative import time in milliseconds
+BUDGETS = {
+    'mockboto3': 5,
+    'mockboto3.iam.endpoints': 120,
+    'mockboto3.pytest_plugin': 10,
+}
+
+# Modules already loaded whenever the measured module is imported
+PRELOADED = {
+    'mockboto3.pytest_plugin': 'pytest',
+}
+
+# Modules only loaded when a mock or helper needing them is used
+DEFERRED = ('asyncio', 'boto3', 'botocore.client', 'sqlite3',
+            'unittest.mock')
+
+
+def measure(module):
+    """Return the import time in ms and the deferred modules loaded."""
+    preloaded = PRELOADED.get(module, 'sys')
+    script = 'import sys, %s; deferred = set(sys.modules) & set(%r); ' \
+             'import %s; print(",".join(name for name in %r ' \
+             'if name in sys.modules and name not in deferred))' \
+             % (preloaded, DEFERRED, module, DEFERRED)
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                             script],
+                            capture_output=True, check=True, text=True)
+
+    elapsed = None
+    for line in result.stderr.splitlines():
+        fields = line.split('|')
+        if len(fields) == 3 and fields[2].strip() == module:
+            elapsed = int(fields[1]) / 1000.0
+
+    loaded = [name for name in result.stdout.strip().split(',') if name]
+    return elapsed, loaded
+
+
+def check(module, budget, runs):
+    """Return the report of module, failures listed under errors."""
+    times = []
+    loaded = set()
+    for _ in range(runs):
+        elapsed, deferred = measure(module)
+        times.append(elapsed)
+        loaded.update(deferred)
+
+    median = statistics.median(times)
+    errors = []
+    if median > budget:
+        errors.append('%.1f ms over budget of %d ms' % (median, budget))
+    if loaded:
+        errors.append('loads %s' % ', '.join(sorted(loaded)))
+    return {'budget_ms': budget,
+            'median_ms': round(median, 2),
+            'min_ms': round(min(times), 2),
+            'errors': errors}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5,
+                        help='Fresh interpreters per module.')
+    parser.add_argument('--modules', nargs='+', default=sorted(BUDGETS),
+                        help='Only measure these modules.')
+    parser.add_argument('--output', help='Write results to this file.')
+    args = parser.parse_args()
+
+    results = dict((module, check(module, BUDGETS.get(module, 100),
+                                  args.runs))
+                   for module in args.modules)
+
+    output = json.dumps({'runs': args.runs, 'modules': results},
+                        indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(output)
+    print(output)
+
+    if any(result['errors'] for result in results.values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
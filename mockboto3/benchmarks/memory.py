@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""""Memory used per IAM entity.
+
+Creates entities directly from the model classes and reports the
+bytes allocated per entity as JSON, next to the same entities laid
+out as before the models used __slots__. Run it as a module from the
+project root, so mockboto3 is importable:
+
+    python -m benchmarks.memory --count 10000
+"""
+
+import argparse
+import json
+import tracemalloc
+
+from mockboto3.core.clock import utc_now
+from mockboto3.core.ids import RandomIds
+from mockboto3.iam.constants import POLICY_DOC, SIGNING_CERT
+from mockboto3.iam.models import (
+    AccessKey, AccessKeyLastUsed, Group, Policy, PolicyVersion, User
+)
+from mockboto3.iam.utils import document_key
+
+ids = RandomIds()
+
+ENTITIES = {
+    'AccessKey': lambda index: AccessKey('user%d' % index,
+                                         ids.generate('access_key'),
+                                         ids.secret()),
+    'Group': lambda index: Group('group%d' % index, ids.generate('group')),
+    'Policy': lambda index: Policy('policy%d' % index,
+                                   ids.generate('policy'),
+                                   document_key(POLICY_DOC)),
+    'User': lambda index: User('user%d' % index, ids.generate('user')),
+}
+
+
+def user_with_credentials(index):
+    """Return user with a login profile, MFA device and certificate."""
+    user = User('user%d' % index, ids.generate('user'))
+    user.create_login_profile('password')
+    user.enable_mfa_device('serial%d' % index)
+    user.upload_signing_certificate(SIGNING_CERT,
+                                    ids.generate('signing_certificate'))
+    return user
+
+
+ENTITIES['UserWithCredentials'] = user_with_credentials
+
+
+# Class without __slots__ standing in for each model class
+UNSLOTTED = {}
+
+
+def unslotted_entity(klass, attributes):
+    """Return an entity of klass keeping attributes in its __dict__.
+
+    Attributes are set one by one in the same order for each class,
+    as __init__ did, so instances share their dict keys.
+    """
+    if klass not in UNSLOTTED:
+        UNSLOTTED[klass] = type(klass.__name__, (object,), {})
+
+    entity = UNSLOTTED[klass]()
+    for name, attribute in attributes:
+        setattr(entity, name, attribute)
+    return entity
+
+
+def unslotted(value):
+    """Return value copied to the model layout before __slots__.
+
+    Attributes are kept in an instance __dict__. Access keys create
+    their usage record and users their MFA device and signing
+    certificate dicts up front, and each policy version has its own
+    create date.
+    """
+    if isinstance(value, dict):
+        return dict((key, unslotted(item)) for key, item in value.items())
+
+    slots = getattr(type(value), '__slots__', None)
+    if slots is None:
+        return value
+
+    attributes = [(name.lstrip('_'), unslotted(getattr(value, name)))
+                  for name in slots if hasattr(value, name)]
+    if isinstance(value, AccessKey):
+        last_used = unslotted_entity(AccessKeyLastUsed, [
+            ('date', utc_now()), ('region', 'us-west-1'),
+            ('service_name', 'iam')
+        ])
+        attributes = [(name, last_used if name == 'last_used' else item)
+                      for name, item in attributes]
+    elif isinstance(value, PolicyVersion):
+        attributes = [(name, utc_now() if name == 'create_date' else item)
+                      for name, item in attributes]
+    elif isinstance(value, User):
+        attributes = [(name, {} if item is None and name in (
+            'mfa_devices', 'signing_certs') else item)
+            for name, item in attributes]
+    return unslotted_entity(type(value), attributes)
+
+
+def measure(factory, count):
+    """Return bytes allocated per entity created by factory."""
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    entities = [factory(index) for index in range(count)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    allocated = sum(stat.size_diff for stat
+                    in after.compare_to(before, 'filename'))
+    del entities
+    return allocated / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=10000)
+    parser.add_argument('--output', help='Write results to this file.')
+    args = parser.parse_args()
+
+    results = {}
+    for name, factory in sorted(ENTITIES.items()):
+        slotted = measure(factory, args.count)
+        baseline = measure(lambda index: unslotted(factory(index)),
+                           args.count)
+        results[name] = {'dict': round(baseline, 1),
+                         'slots': round(slotted, 1),
+                         'saved_percent': round(
+                             100 * (1 - slotted / baseline), 1
+                         )}
+
+    output = json.dumps({'count': args.count,
+                         'bytes_per_entity': results}, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(output)
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,34 @@
 # -*- coding: utf-8 -*-
 
+import importlib
+
 __author__ = """SUSE"""
 __email__ = 'public-cloud-dev@susecloud.net'
 __version__ = '0.1.1'
+
+# Public names and their modules, imported on first access so that
+# importing mockboto3 costs nothing until a mock is used
+_LAZY = {
+    'MockIAM': 'mockboto3.iam.endpoints',
+    'Router': 'mockboto3.core.router',
+    'make_client': 'mockboto3.core.clients',
+    'mock_iam': 'mockboto3.iam.endpoints',
+    'mock_iam_async': 'mockboto3.iam.endpoints',
+}
+
+__all__ = sorted(_LAZY)
+
+
+def __getattr__(name):
+    try:
+        module = _LAZY[name]
+    except KeyError:
+        raise AttributeError('module %r has no attribute %r'
+                             % (__name__, name))
+
+    value = globals()[name] = getattr(importlib.import_module(module), name)
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+""""Asyncio entry point for mocking aiobotocore clients."""
+
+import asyncio
+
+from mockboto3.core.exceptions import MockBoto3ClientError
+from mockboto3.core.throttle import delay_for
+
+
+class AsyncAPICall(object):
+    """Awaitable replacement for AioBaseClient._make_api_call.
+
+    Calls are served by the same mock as synchronous clients after an
+    optional simulated latency, given as seconds, a dict of seconds
+    per operation name or a callable taking the operation name.
+
+    A Throttle of the mock admits the call before any latency, its
+    latency is then awaited along with it rather than slept, so it
+    does not block the event loop. Throttled calls fail at once.
+
+    The number of calls in flight and its peak are tracked so tests
+    can assert on the concurrency of the code under test.
+    """
+
+    def __init__(self, mocker, latency=None):
+        super(AsyncAPICall, self).__init__()
+        self.calls = 0
+        self.in_flight = 0
+        self.latency = latency
+        self.max_in_flight = 0
+        self.mocker = mocker
+
+    async def __call__(self, operation_name, kwargs):
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+        try:
+            delay = self.delay(operation_name)
+            throttle = self.mocker.throttle
+            if throttle is not None and \
+                    operation_name in self.mocker.operations:
+                throttle_delay = self._admit(throttle, operation_name)
+                if throttle_delay:
+                    delay = (delay or 0) + throttle_delay
+
+            if delay:
+                await asyncio.sleep(delay)
+
+            return self.mocker.mock_make_api_call(operation_name, kwargs,
+                                                  throttle=False)
+        finally:
+            self.in_flight -= 1
+
+    def _admit(self, throttle, operation_name):
+        """Return the throttle latency, recording throttled calls."""
+        try:
+            return throttle.admit(operation_name)
+        except MockBoto3ClientError as error:
+            if self.mocker.metrics is not None:
+                self.mocker.metrics.record(operation_name, 0.0,
+                                           error.response['Error']['Code'])
+            raise
+
+    def delay(self, operation_name):
+        """Return the simulated latency in seconds for the operation."""
+        return delay_for(self.latency, operation_name)
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+""""Cheap boto3 clients for mocked services.
+
+Building a client with boto3.client loads and parses the service
+model, resolves the endpoint and registers event handlers, tens of
+milliseconds per client. make_client builds the first client of each
+service and region once per process, from one shared session with
+dummy credentials, and returns copies of it afterwards:
+
+    @mock_iam
+    def test_user():
+        make_client('iam').create_user(UserName='John')
+
+Copies share the service model, endpoint and event hooks of the
+prototype, so a Stubber or handler registered on one client applies
+to all clients of its service and region. Calls are made through
+the patched _make_api_call like those of any other client.
+"""
+
+import threading
+
+import boto3
+
+DEFAULT_REGION = 'us-east-1'
+
+_lock = threading.Lock()
+_prototypes = {}
+_session = None
+
+
+def _prototype(service_name, region_name):
+    """Return the prototype client, built on first use."""
+    global _session
+
+    with _lock:
+        key = (service_name, region_name)
+        client = _prototypes.get(key)
+        if client is None:
+            if _session is None:
+                _session = boto3.session.Session(
+                    aws_access_key_id='testing',
+                    aws_secret_access_key='testing',
+                    region_name=DEFAULT_REGION
+                )
+            client = _prototypes[key] = _session.client(
+                service_name, region_name=region_name
+            )
+        return client
+
+
+def make_client(service_name, region_name=DEFAULT_REGION):
+    """Return a boto3 client of service_name, cheap after the first.
+
+    The client has its own attributes but shares everything else
+    with the prototype of the service and region.
+    """
+    try:
+        prototype = _prototypes[(service_name, region_name)]
+    except KeyError:
+        prototype = _prototype(service_name, region_name)
+
+    # copy.copy recurses through the __getattr__ of botocore clients
+    client = object.__new__(type(prototype))
+    client.__dict__.update(prototype.__dict__)
+    return client
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+""""Clocks giving mocks their notion of time.
+
+Every mock owns a clock producing the timestamps of its entities and
+responses. The real Clock is the default, virtual clocks make time
+dependent behavior testable without sleeping or patching datetime:
+
+    clock = ManualClock(datetime(2017, 1, 1, tzinfo=timezone.utc))
+    mocker = MockIAM(clock=clock)
+    ...
+    clock.advance(days=90)  # access keys are now 90 days old
+
+Pass clock.monotonic and clock.sleep to a Throttle to let its token
+buckets refill in virtual time.
+"""
+
+import threading
+import time
+
+from datetime import datetime, timedelta, timezone
+
+
+def utc_now():
+    """Return the current time in UTC."""
+    return datetime.now(timezone.utc)
+
+
+def http_date(seconds):
+    """Return the HTTP date header value of a time in seconds."""
+    return time.strftime('%a, %d %b %Y %H:%M:%S GMT', time.gmtime(seconds))
+
+
+class Clock(object):
+    """Real time."""
+
+    # Virtual clocks stamp the date header of every response
+    virtual = False
+
+    monotonic = staticmethod(time.monotonic)
+    now = staticmethod(utc_now)
+    sleep = staticmethod(time.sleep)
+    time = staticmethod(time.time)
+
+
+class FrozenClock(Clock):
+    """Clock stopped at now, the time it is created by default.
+
+    Every timestamp is the same datetime instance and sleeping
+    returns at once.
+    """
+
+    virtual = True
+
+    def __init__(self, now=None):
+        super(FrozenClock, self).__init__()
+        if now is not None and now.tzinfo is None:
+            raise ValueError('Clock time must be timezone aware.')
+
+        self._now = now or utc_now()
+        self._time = self._now.timestamp()
+
+    def monotonic(self):
+        return self._time
+
+    def now(self):
+        return self._now
+
+    def sleep(self, seconds):
+        pass
+
+    def time(self):
+        return self._time
+
+
+class ManualClock(FrozenClock):
+    """Frozen clock moved forward explicitly.
+
+    advance takes the arguments of timedelta, sleeping advances the
+    clock by the time slept.
+    """
+
+    def __init__(self, now=None):
+        super(ManualClock, self).__init__(now)
+        self._lock = threading.Lock()
+
+    def advance(self, seconds=0, **kwargs):
+        """Move the clock forward and return the new time."""
+        delta = timedelta(seconds=seconds, **kwargs)
+        if delta < timedelta(0):
+            raise ValueError('Clocks cannot go back in time.')
+
+        with self._lock:
+            self._now += delta
+            self._time = self._now.timestamp()
+            return self._now
+
+    def sleep(self, seconds):
+        self.advance(seconds)
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+""""Generators for AWS shaped entity ids and secrets."""
+
+import abc
+import base64
+import hashlib
+import os
+import threading
+
+from collections import Counter
+
+# Prefix and total length of the unique ids of each entity kind
+ID_FORMATS = {
+    'access_key': ('AKIA', 20),
+    'group': ('AGPA', 21),
+    'policy': ('ANPA', 21),
+    'signing_certificate': ('', 28),
+    'user': ('AIDA', 21),
+}
+
+SECRET_LENGTH = 40
+
+# Maps each byte to a base32 character, 256 is a multiple of 32 so
+# random bytes give evenly distributed characters
+_BASE32 = bytes(b'ABCDEFGHIJKLMNOPQRSTUVWXYZ234567'[byte % 32]
+                for byte in range(256))
+
+
+class IdGenerator(abc.ABC):
+    """Base class for id generators.
+
+    Ids use the AWS prefix of the entity kind followed by upper case
+    base32 characters, secrets are 40 base64 characters. Generators
+    are safe to share between threads.
+    """
+
+    def __init__(self):
+        super(IdGenerator, self).__init__()
+        self._lock = threading.Lock()
+
+    def generate(self, kind):
+        """Return a new unique id for an entity of kind."""
+        prefix, length = ID_FORMATS[kind]
+        return prefix + self._characters(kind, length - len(prefix))
+
+    @abc.abstractmethod
+    def secret(self):
+        """Return a new secret access key."""
+
+    @abc.abstractmethod
+    def _characters(self, kind, count):
+        """Return count id characters for an entity of kind."""
+
+
+class RandomIds(IdGenerator):
+    """Random ids drawn from a batch of random bytes.
+
+    Random bytes are mapped to base32 characters and base64 encoded a
+    batch at a time so each id is a slice of a prepared string instead
+    of one random call per character.
+    """
+
+    batch_size = 5 * 1024
+
+    def __init__(self):
+        super(RandomIds, self).__init__()
+        self._chars = ''
+        self._chars_pos = 0
+        self._secrets = ''
+        self._secrets_pos = 0
+
+    def _characters(self, kind, count):
+        with self._lock:
+            start = self._chars_pos
+            if start + count > len(self._chars):
+                self._chars = os.urandom(self.batch_size * 8).translate(
+                    _BASE32
+                ).decode()
+                start = 0
+
+            self._chars_pos = start + count
+            return self._chars[start:start + count]
+
+    def secret(self):
+        with self._lock:
+            start = self._secrets_pos
+            if start + SECRET_LENGTH > len(self._secrets):
+                self._secrets = base64.b64encode(
+                    os.urandom(self.batch_size * 6)
+                ).decode()
+                start = 0
+
+            self._secrets_pos = start + SECRET_LENGTH
+            return self._secrets[start:start + SECRET_LENGTH]
+
+
+class SeededIds(IdGenerator):
+    """Deterministic ids derived from a seed and a per kind counter.
+
+    The n-th id of a kind is a hash of (seed, kind, n), so a run can
+    be reproduced from its seed regardless of how calls for different
+    kinds interleave.
+    """
+
+    def __init__(self, seed=0):
+        super(SeededIds, self).__init__()
+        self.counters = Counter()
+        self.seed = seed
+
+    def _digest(self, kind):
+        with self._lock:
+            self.counters[kind] += 1
+            value = '%s:%s:%d' % (self.seed, kind, self.counters[kind])
+
+        return hashlib.blake2b(value.encode(), digest_size=30).digest()
+
+    def _characters(self, kind, count):
+        return base64.b32encode(self._digest(kind)).decode()[:count]
+
+    def secret(self):
+        return base64.b64encode(self._digest('secret')).decode()
@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+
+""""Change journal of a mock, with savepoints and rollback.
+
+A journaled mock records the previous value of every entity and
+relation index before its first change after a savepoint. Rolling
+back undoes those changes in O(changes), so one long lived mock on a
+large baseline can be reset after each test instead of rebuilt, and
+diffs tell exactly what a piece of code changed:
+
+    mocker = MockIAM(journal=True)
+    mocker.restore(baseline)
+    savepoint = mocker.savepoint()
+    rotate_keys()
+    assert 3 == len(mocker.diff(savepoint)['access_keys'].added)
+    mocker.rollback_to(savepoint)
+
+Entities still shared with the base of a copy-on-write store are not
+copied, rolling back just shows the base entity again. Other entities
+deleted since the savepoint come back at the end of listings.
+"""
+
+import copy
+
+from collections.abc import MutableMapping
+
+from mockboto3.core.store import Overlay
+
+# Previous value of a key which did not exist
+MISSING = object()
+
+# Previous value of a key showing the unchanged entity of an overlay base
+BASE = object()
+
+
+def _same(first, second):
+    """Return True if two entities hold equal values.
+
+    Entities are compared slot by slot, they do not define __eq__.
+    """
+    if first is second:
+        return True
+    if type(first) is not type(second):
+        return False
+
+    if isinstance(first, dict):
+        return first.keys() == second.keys() and \
+            all(_same(value, second[key]) for key, value in first.items())
+
+    slots = [name for klass in type(first).__mro__
+             for name in getattr(klass, '__slots__', ())]
+    if not slots:
+        return first == second
+    return all(_same(getattr(first, name, MISSING),
+                     getattr(second, name, MISSING)) for name in slots)
+
+
+class Changes(object):
+    """Keys added, changed and removed in a store between two points.
+
+    For relations the keys are (source, target) pairs and relations
+    are never changed, only added or removed.
+    """
+
+    __slots__ = ('added', 'changed', 'removed')
+
+    def __init__(self):
+        super(Changes, self).__init__()
+        self.added = []
+        self.changed = []
+        self.removed = []
+
+    def __bool__(self):
+        return bool(self.added or self.changed or self.removed)
+
+    def __repr__(self):
+        return 'Changes(added=%r, changed=%r, removed=%r)' % (
+            self.added, self.changed, self.removed
+        )
+
+
+class JournaledStore(MutableMapping):
+    """Store recording its changes in a journal.
+
+    Reads go straight to the wrapped store. copier makes the copy of
+    an entity about to be changed in place through writable. Stores
+    indexing a relation by source diff as its pairs, those indexing
+    it by target are left out of diffs.
+    """
+
+    def __init__(self, store, journal, name, copier=copy.deepcopy,
+                 relation=None, diffed=True):
+        super(JournaledStore, self).__init__()
+        self.copier = copier
+        self.diffed = diffed
+        self.journal = journal
+        self.name = name
+        self.relation = relation
+        self.store = store
+
+    def __contains__(self, key):
+        return key in self.store
+
+    def __delitem__(self, key):
+        self._touch(key)
+        del self.store[key]
+
+    def __getitem__(self, key):
+        return self.store[key]
+
+    def __iter__(self):
+        return iter(self.store)
+
+    def __len__(self):
+        return len(self.store)
+
+    def __setitem__(self, key, value):
+        self._touch(key)
+        self.store[key] = value
+
+    def _touch(self, key, copy_value=False):
+        """Record the value of key before its first change."""
+        journal = self.journal
+        if (self.name, key) in journal.touched:
+            return
+
+        store = self.store
+        if isinstance(store, Overlay) and key not in store.local:
+            previous = BASE if key in store else MISSING
+        else:
+            previous = store.get(key, MISSING)
+            if copy_value and previous is not MISSING:
+                previous = self.copier(previous)
+        journal.record(self, key, previous)
+
+    def get(self, key, default=None):
+        return self.store.get(key, default)
+
+    def items(self):
+        return self.store.items()
+
+    def keys(self):
+        return self.store.keys()
+
+    def restore(self, key, previous):
+        """Put back the previous value of key without recording it."""
+        store = self.store
+        if previous is BASE:
+            store.reset(key)
+        elif previous is MISSING:
+            store.pop(key, None)
+        else:
+            store[key] = previous
+
+    def value(self, previous, key):
+        """Return the entity a recorded previous value stands for."""
+        if previous is BASE:
+            return self.store.base[key]
+        return previous
+
+    def values(self):
+        return self.store.values()
+
+    def writable(self, key):
+        self._touch(key, copy_value=True)
+        return self.store.writable(key)
+
+
+class Journal(object):
+    """Undo log of the stores of a mock.
+
+    Savepoints are positions in the log. Each key is recorded once
+    per savepoint, however often it changes, so the log grows with
+    the number of entities changed rather than calls made.
+    """
+
+    def __init__(self):
+        super(Journal, self).__init__()
+        self.entries = []
+        self.touched = set()
+
+    def record(self, store, key, previous):
+        self.touched.add((store.name, key))
+        self.entries.append((store, key, previous))
+
+    def wrap(self, name, store):
+        """Return the journaled store for an entity store."""
+        return JournaledStore(store, self, name)
+
+    def wrap_relation(self, name, relation):
+        """Journal both indexes of an in-memory relation."""
+        relation.by_source = JournaledStore(
+            relation.by_source, self, '%s.by_source' % name, dict, name
+        )
+        relation.by_target = JournaledStore(
+            relation.by_target, self, '%s.by_target' % name, dict,
+            diffed=False
+        )
+        return relation
+
+    def savepoint(self):
+        """Return a savepoint of the current state."""
+        self.touched.clear()
+        return len(self.entries)
+
+    def rollback_to(self, savepoint):
+        """Undo all changes made since savepoint.
+
+        Later savepoints are no longer valid afterwards.
+        """
+        if not 0 <= savepoint <= len(self.entries):
+            raise ValueError('Unknown savepoint %r.' % savepoint)
+
+        entries = self.entries
+        for index in range(len(entries) - 1, savepoint - 1, -1):
+            store, key, previous = entries[index]
+            store.restore(key, previous)
+
+        del entries[savepoint:]
+        self.touched.clear()
+
+    def diff(self, start, end=None):
+        """Return Changes per store name between two savepoints.
+
+        end is the current state by default. Only stores with changes
+        are included, relations by their name with pairs as keys.
+        Entities changed and changed back are left out.
+        """
+        stop = len(self.entries) if end is None else end
+        if not 0 <= start <= stop <= len(self.entries):
+            raise ValueError('Invalid savepoints %r, %r.' % (start, end))
+
+        # Value of each key at start, and at end if it changed later
+        before = {}
+        for store, key, previous in self.entries[start:stop]:
+            if store.diffed:
+                before.setdefault((store.name, key), (store, previous))
+
+        after = {}
+        for store, key, previous in self.entries[stop:]:
+            if (store.name, key) in before:
+                after.setdefault((store.name, key), previous)
+
+        changes = {}
+        for (name, key), (store, previous) in before.items():
+            if (name, key) in after:
+                current = after[(name, key)]
+            else:
+                current = store.store.get(key, MISSING)
+            previous = store.value(previous, key)
+            current = store.value(current, key)
+
+            if store.relation is not None:
+                old = {} if previous is MISSING else previous
+                new = {} if current is MISSING else current
+                added = [(key, target) for target in new if target not in old]
+                removed = [(key, target) for target in old
+                           if target not in new]
+                if added or removed:
+                    entry = changes.setdefault(store.relation, Changes())
+                    entry.added.extend(added)
+                    entry.removed.extend(removed)
+            elif previous is not MISSING or current is not MISSING:
+                # Entities fetched with writable but left unchanged
+                if previous is not MISSING and current is not MISSING and \
+                        _same(previous, current):
+                    continue
+
+                entry = changes.setdefault(name, Changes())
+                if previous is MISSING:
+                    entry.added.append(key)
+                elif current is MISSING:
+                    entry.removed.append(key)
+                else:
+                    entry.changed.append(key)
+        return changes
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+""""Call counts, errors and latency histograms per mocked operation.
+
+    mocker = MockIAM(metrics=Metrics())
+    ...
+    assert mocker.metrics['GetUser'].calls < 10
+    mocker.metrics.dump('metrics.json')
+
+Mocks created without metrics only pay for one attribute check.
+"""
+
+import json
+import threading
+
+
+class OperationMetrics(object):
+    """Metrics of one operation.
+
+    Latencies are counted in a histogram with power of two buckets,
+    bucket i holds calls that took less than 2 ** i microseconds
+    and at least half that.
+    """
+
+    __slots__ = ('calls', 'errors', 'histogram', 'max_time', 'total_time')
+
+    def __init__(self):
+        super(OperationMetrics, self).__init__()
+        self.calls = 0
+        self.errors = {}
+        self.histogram = []
+        self.max_time = 0.0
+        self.total_time = 0.0
+
+    def as_dict(self):
+        return {
+            'calls': self.calls,
+            'errors': dict(self.errors),
+            'histogram_us': dict((2 ** index, count) for index, count
+                                 in enumerate(self.histogram) if count),
+            'max_us': round(self.max_time * 1e6, 2),
+            'mean_us': round(self.mean_time * 1e6, 2),
+            'p50_us': self.percentile(0.5),
+            'p99_us': self.percentile(0.99),
+        }
+
+    @property
+    def mean_time(self):
+        return self.total_time / self.calls if self.calls else 0.0
+
+    def percentile(self, fraction):
+        """Return the upper bound in microseconds of the percentile."""
+        rank = fraction * self.calls
+        seen = 0
+        for index, count in enumerate(self.histogram):
+            seen += count
+            if count and seen >= rank:
+                return 2 ** index
+        return 0
+
+    def record(self, elapsed, error_code=None):
+        self.calls += 1
+        self.total_time += elapsed
+        if elapsed > self.max_time:
+            self.max_time = elapsed
+
+        bucket = int(elapsed * 1e6).bit_length()
+        histogram = self.histogram
+        if bucket >= len(histogram):
+            histogram.extend([0] * (bucket + 1 - len(histogram)))
+        histogram[bucket] += 1
+
+        if error_code is not None:
+            self.errors[error_code] = self.errors.get(error_code, 0) + 1
+
+
+class Metrics(object):
+    """Metrics of every operation called on one or more mocks.
+
+    Safe to share between threads and between mocks, to collect the
+    metrics of a whole test session.
+    """
+
+    def __init__(self):
+        super(Metrics, self).__init__()
+        self.operations = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, operation_name):
+        return operation_name in self.operations
+
+    def __getitem__(self, operation_name):
+        return self.operations[operation_name]
+
+    def as_dict(self):
+        """Return the metrics of each operation, most called first."""
+        with self._lock:
+            ranked = sorted(self.operations.items(),
+                            key=lambda item: (-item[1].calls, item[0]))
+            return dict((name, metrics.as_dict())
+                        for name, metrics in ranked)
+
+    @property
+    def calls(self):
+        """Total number of calls of all operations."""
+        return sum(metrics.calls for metrics in self.operations.values())
+
+    def dump(self, path):
+        """Write the metrics to path as JSON."""
+        with open(path, 'w') as metrics_file:
+            json.dump(self.as_dict(), metrics_file, indent=2)
+
+    def record(self, operation_name, elapsed, error_code=None):
+        """Record a call that took elapsed seconds."""
+        with self._lock:
+            metrics = self.operations.get(operation_name)
+            if metrics is None:
+                metrics = self.operations[operation_name] = \
+                    OperationMetrics()
+            metrics.record(elapsed, error_code)
+
+    def reset(self):
+        with self._lock:
+            self.operations = {}
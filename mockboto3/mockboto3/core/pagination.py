@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+""""Marker based pagination for list endpoints."""
+
+import base64
+import binascii
+
+from itertools import islice
+
+from mockboto3.core.exceptions import client_error
+
+DEFAULT_MAX_ITEMS = 100
+
+
+def decode_marker(marker, operation):
+    """Return the offset encoded in an opaque marker."""
+    try:
+        offset = int(base64.urlsafe_b64decode(marker.encode()))
+    except (binascii.Error, ValueError):
+        offset = -1
+
+    if offset < 0:
+        raise client_error(operation,
+                           'InvalidInput',
+                           'Invalid Marker: %s.' % marker)
+
+    return offset
+
+
+def encode_marker(offset):
+    """Return an opaque marker for the offset of the next page."""
+    return base64.urlsafe_b64encode(str(offset).encode()).decode()
+
+
+def paginate(items, kwargs, operation):
+    """Return the page of items requested and the next page marker.
+
+    Items is a sized iterable (dict view, list) in a stable order.
+    Only the requested slice is materialized. Store views provide a
+    slice method to get a page without walking the items before it.
+    The marker is None when there are no more items.
+    """
+    max_items = kwargs.get('MaxItems', DEFAULT_MAX_ITEMS)
+    if max_items < 1:
+        raise client_error(operation,
+                           'InvalidInput',
+                           'MaxItems must be at least 1.')
+
+    start = 0
+    if kwargs.get('Marker'):
+        start = decode_marker(kwargs['Marker'], operation)
+
+    stop = start + max_items
+    if hasattr(items, 'slice'):
+        page = items.slice(start, stop)
+    else:
+        page = list(islice(items, start, stop))
+
+    marker = encode_marker(stop) if stop < len(items) else None
+    return page, marker
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+""""Relationships between mocked entities."""
+
+from mockboto3.core.store import Overlay, Store
+
+
+class Relation(object):
+    """Many to many relation indexed in both directions.
+
+    The targets of each source and the sources of each target are
+    kept in dicts used as insertion ordered sets. Adding, removing
+    and membership checks are O(1) and removing an entity only
+    touches the entities related to it.
+    """
+
+    def __init__(self, by_source=None, by_target=None):
+        super(Relation, self).__init__()
+        self.by_source = Store() if by_source is None else by_source
+        self.by_target = Store() if by_target is None else by_target
+
+    def __contains__(self, pair):
+        source, target = pair
+        return target in self.by_source.get(source, ())
+
+    def add(self, source, target):
+        """Relate source to target, return False if already related."""
+        targets = self.by_source.get(source)
+        if targets is None:
+            self.by_source[source] = {target: None}
+        elif target in targets:
+            return False
+        else:
+            self.by_source.writable(source)[target] = None
+
+        if target in self.by_target:
+            self.by_target.writable(target)[source] = None
+        else:
+            self.by_target[target] = {source: None}
+        return True
+
+    def count_sources(self, target):
+        return len(self.by_target.get(target, ()))
+
+    def count_targets(self, source):
+        return len(self.by_source.get(source, ()))
+
+    def discard(self, source, target):
+        """Remove relation if it exists, return False if it did not."""
+        if (source, target) not in self:
+            return False
+
+        del self.by_source.writable(source)[target]
+        del self.by_target.writable(target)[source]
+        return True
+
+    def freeze(self):
+        """Return a copy of both indexes for a snapshot."""
+        return (
+            dict((key, dict(value)) for key, value in self.by_source.items()),
+            dict((key, dict(value)) for key, value in self.by_target.items())
+        )
+
+    def remove_source(self, source):
+        """Remove source from all relations and return its targets."""
+        targets = list(self.by_source.pop(source, ()))
+        for target in targets:
+            del self.by_target.writable(target)[source]
+        return targets
+
+    def remove_target(self, target):
+        """Remove target from all relations and return its sources."""
+        sources = list(self.by_target.pop(target, ()))
+        for source in sources:
+            del self.by_source.writable(source)[target]
+        return sources
+
+    def sources(self, target):
+        """Return the sources related to target in insertion order."""
+        return self.by_target.get(target, {}).keys()
+
+    def targets(self, source):
+        """Return the targets related to source in insertion order."""
+        return self.by_source.get(source, {}).keys()
+
+    @classmethod
+    def thaw(cls, frozen):
+        """Return a copy-on-write relation over frozen indexes."""
+        by_source, by_target = frozen
+        return cls(Overlay(by_source, copier=dict),
+                   Overlay(by_target, copier=dict))
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+""""Routing of boto3 client calls to the mock of their service.
+
+The Router replaces BaseClient._make_api_call for every client. Calls
+are dispatched on the service name of the client to the mock of that
+service, created on first use from the registry of mocked services:
+
+    with patch('botocore.client.BaseClient._make_api_call',
+               new=Router()):
+        boto3.client('iam').create_user(UserName='John')  # MockIAM
+        boto3.client('s3').list_buckets()                 # real call
+
+Mock classes are registered by dotted path and only imported when a
+client of their service makes its first call. Calls of services
+without a mock go through the original _make_api_call.
+"""
+
+import importlib
+import threading
+
+from types import MethodType
+
+# Service name to the dotted path of its mock class
+SERVICES = {
+    'iam': 'mockboto3.iam.endpoints.MockIAM',
+}
+
+
+def register_service(service_name, path):
+    """Register the mock class of service_name by dotted path."""
+    SERVICES[service_name] = path
+
+
+def import_service(path):
+    """Return the mock class at dotted path."""
+    module_name, _, class_name = path.rpartition('.')
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+class Router(object):
+    """Replacement for BaseClient._make_api_call routing by service.
+
+    api_calls maps service names to the api call serving them, for
+    mocks created beforehand or wrapped in a TraceRecorder. Mocks of
+    other registered services are created on first use with options
+    and can be fetched with mock.
+    """
+
+    def __init__(self, api_calls=None, services=None, **options):
+        super(Router, self).__init__()
+        from botocore.client import BaseClient
+
+        self.api_calls = dict(api_calls or {})
+        self.mocks = {}
+        self.options = options
+        self.original = BaseClient._make_api_call
+        self.services = SERVICES if services is None else services
+        self._lock = threading.RLock()
+
+    def __get__(self, client, owner=None):
+        """Bind to the client like the method it replaces."""
+        if client is None:
+            return self
+        return MethodType(self, client)
+
+    def __call__(self, client, operation_name, kwargs):
+        service_name = client.meta.service_model.service_name
+        try:
+            api_call = self.api_calls[service_name]
+        except KeyError:
+            api_call = self._api_call(service_name)
+
+        if api_call is None:
+            return self.original(client, operation_name, kwargs)
+        return api_call(operation_name, kwargs)
+
+    def _api_call(self, service_name):
+        """Return the api call of a new mock, None if not mocked."""
+        with self._lock:
+            if service_name not in self.api_calls:
+                mocker = self.mock(service_name)
+                self.api_calls[service_name] = None if mocker is None \
+                    else mocker.mock_make_api_call
+            return self.api_calls[service_name]
+
+    def mock(self, service_name):
+        """Return the mock of service_name, created on first use.
+
+        None if the service has no registered mock.
+        """
+        with self._lock:
+            mocker = self.mocks.get(service_name)
+            if mocker is None and service_name in self.services:
+                mock_class = import_service(self.services[service_name])
+                mocker = self.mocks[service_name] = mock_class(**self.options)
+            return mocker
@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+
+""""HTTP server speaking the AWS Query protocol for a mocked service.
+
+Requests are form encoded (Action=CreateUser&UserName=John...) and
+responses are XML, so any AWS SDK or tool can use the mock through
+its endpoint url:
+
+    server = QueryServer(MockIAM(thread_safe=True), ('127.0.0.1', 5000))
+    server.serve_forever()
+
+    boto3.client('iam', endpoint_url='http://127.0.0.1:5000')
+
+Request parameters are parsed and responses serialized following the
+botocore service model. Serializers are compiled once per output
+shape with their XML tags precomputed.
+"""
+
+import base64
+import uuid
+
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+from xml.sax.saxutils import escape
+
+from botocore.session import Session
+from botocore.utils import parse_timestamp
+
+from mockboto3.core.exceptions import MockBoto3ClientError
+
+ERROR_STATUS = {
+    'EntityAlreadyExists': 409,
+    'InternalFailure': 500,
+    'NoSuchEntity': 404,
+}
+
+
+def _format_timestamp(value):
+    if isinstance(value, datetime):
+        return value.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+    return str(value)
+
+
+def _scalar_serializer(shape):
+    """Return function converting a scalar value to XML text."""
+    if shape.type_name == 'boolean':
+        return lambda value: 'true' if value else 'false'
+    if shape.type_name == 'timestamp':
+        return _format_timestamp
+    if shape.type_name == 'blob':
+        return lambda value: base64.b64encode(value).decode()
+    return lambda value: escape(str(value))
+
+
+class QueryProtocol(object):
+    """Translate Query protocol requests into mocked service calls."""
+
+    def __init__(self, mocker):
+        super(QueryProtocol, self).__init__()
+        self.mocker = mocker
+        self.model = Session().get_service_model(mocker.service_name)
+        self.namespace = self.model.metadata.get('xmlNamespace', '')
+        self._serializers = {}
+        self._templates = {}
+
+    def _compile(self, shape):
+        """Return function appending the XML of a value to a list."""
+        serializer = self._serializers.get(shape.name)
+        if serializer is not None:
+            return serializer
+
+        if shape.type_name == 'structure':
+            # Placeholder breaks cycles of recursive shapes
+            members = []
+            self._serializers[shape.name] = \
+                lambda value, parts: serialize(value, parts)
+
+            def serialize(value, parts):
+                for name, open_tag, close_tag, member in members:
+                    if value.get(name) is not None:
+                        parts.append(open_tag)
+                        member(value[name], parts)
+                        parts.append(close_tag)
+
+            for name, member in shape.members.items():
+                tag = member.serialization.get('name', name)
+                members.append((name, '<%s>' % tag, '</%s>' % tag,
+                                self._compile(member)))
+
+        elif shape.type_name == 'list':
+            tag = shape.member.serialization.get('name', 'member')
+            open_tag, close_tag = '<%s>' % tag, '</%s>' % tag
+            item = self._compile(shape.member)
+
+            def serialize(value, parts):
+                for entry in value:
+                    parts.append(open_tag)
+                    item(entry, parts)
+                    parts.append(close_tag)
+
+        elif shape.type_name == 'map':
+            key = self._compile(shape.key)
+            item = self._compile(shape.value)
+
+            def serialize(value, parts):
+                for entry_key, entry_value in value.items():
+                    parts.append('<entry><key>')
+                    key(entry_key, parts)
+                    parts.append('</key><value>')
+                    item(entry_value, parts)
+                    parts.append('</value></entry>')
+
+        else:
+            text = _scalar_serializer(shape)
+
+            def serialize(value, parts):
+                parts.append(text(value))
+
+        self._serializers[shape.name] = serialize
+        return serialize
+
+    def _parse(self, shape, params, prefix):
+        """Return value of shape from the flattened form parameters."""
+        if shape.type_name == 'structure':
+            result = {}
+            for name, member in shape.members.items():
+                key = member.serialization.get('name', name)
+                value = self._parse(member, params,
+                                    '%s.%s' % (prefix, key) if prefix
+                                    else key)
+                if value is not None:
+                    result[name] = value
+            return result if result or not prefix else None
+
+        if shape.type_name == 'list':
+            if params.get(prefix) == '':
+                return []
+
+            items = []
+            while True:
+                separator = '.' if shape.serialization.get('flattened') \
+                    else '.member.'
+                value = self._parse(shape.member, params, '%s%s%d'
+                                    % (prefix, separator, len(items) + 1))
+                if value is None:
+                    return items or None
+                items.append(value)
+
+        if shape.type_name == 'map':
+            result = {}
+            while True:
+                entry = '%s.entry.%d' % (prefix, len(result) + 1)
+                key = self._parse(shape.key, params, entry + '.key')
+                if key is None:
+                    return result or None
+                result[key] = self._parse(shape.value, params,
+                                          entry + '.value')
+
+        value = params.get(prefix)
+        if value is None:
+            return None
+        if shape.type_name in ('integer', 'long'):
+            return int(value)
+        if shape.type_name in ('float', 'double'):
+            return float(value)
+        if shape.type_name == 'boolean':
+            return value.lower() == 'true'
+        if shape.type_name == 'timestamp':
+            return parse_timestamp(value)
+        if shape.type_name == 'blob':
+            return base64.b64decode(value)
+        return value
+
+    def _template(self, operation_model):
+        """Return the response head and tail XML of the operation."""
+        template = self._templates.get(operation_model.name)
+        if template is None:
+            name = operation_model.name
+            output_shape = operation_model.output_shape
+            head = '<%sResponse xmlns="%s">' % (name, self.namespace)
+            tail = '<ResponseMetadata><RequestId>%%s</RequestId>' \
+                   '</ResponseMetadata></%sResponse>' % name
+            serializer = None
+            if output_shape is not None:
+                result = output_shape.serialization.get(
+                    'resultWrapper', '%sResult' % name
+                )
+                head += '<%s>' % result
+                tail = '</%s>' % result + tail
+                serializer = self._compile(output_shape)
+
+            template = self._templates[name] = (head, tail, serializer)
+        return template
+
+    def error(self, code, message, request_id, sender=True):
+        """Return status and XML body of an error response."""
+        body = '<ErrorResponse xmlns="%s"><Error><Type>%s</Type>' \
+               '<Code>%s</Code><Message>%s</Message></Error>' \
+               '<RequestId>%s</RequestId></ErrorResponse>' \
+               % (self.namespace, 'Sender' if sender else 'Receiver',
+                  escape(code), escape(message), request_id)
+        return ERROR_STATUS.get(code, 400), body
+
+    def handle(self, params):
+        """Return status and XML body for the request parameters."""
+        request_id = str(uuid.uuid4())
+        action = params.pop('Action', None)
+        params.pop('Version', None)
+
+        try:
+            operation_model = self.model.operation_model(action)
+        except Exception:
+            return self.error('InvalidAction',
+                              'Could not find operation %s.' % action,
+                              request_id)
+
+        kwargs = {}
+        try:
+            if operation_model.input_shape is not None:
+                kwargs = self._parse(operation_model.input_shape, params, '')
+        except ValueError as error:
+            return self.error('MalformedInput',
+                              'Invalid parameter value: %s' % error,
+                              request_id)
+
+        try:
+            response = self.mocker.mock_make_api_call(action, kwargs)
+        except MockBoto3ClientError as error:
+            return self.error(error.response['Error']['Code'],
+                              error.response['Error']['Message'],
+                              request_id)
+        except Exception as error:
+            return self.error('InternalFailure', repr(error), request_id,
+                              sender=False)
+
+        head, tail, serializer = self._template(operation_model)
+        parts = [head]
+        if serializer is not None:
+            serializer(response, parts)
+        parts.append(tail % request_id)
+        return 200, ''.join(parts)
+
+
+class QueryRequestHandler(BaseHTTPRequestHandler):
+    """Keep-alive request handler for Query protocol requests."""
+
+    # Headers and body are sent separately, without TCP_NODELAY each
+    # keep-alive response waits for the delayed ack of the client
+    disable_nagle_algorithm = True
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self._respond(dict(parse_qsl(urlsplit(self.path).query,
+                                     keep_blank_values=True)))
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode()
+        params = dict(parse_qsl(urlsplit(self.path).query,
+                                keep_blank_values=True))
+        params.update(parse_qsl(body, keep_blank_values=True))
+        self._respond(params)
+
+    def _respond(self, params):
+        status, body = self.server.protocol.handle(params)
+        payload = body.encode()
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/xml')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        """Do not log every request."""
+
+
+class QueryServer(ThreadingHTTPServer):
+    """Threaded HTTP server for a mocked service.
+
+    The mock is called from one thread per connection so it should
+    be created with thread_safe=True.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, mocker, address=('127.0.0.1', 0)):
+        super(QueryServer, self).__init__(address, QueryRequestHandler)
+        self.protocol = QueryProtocol(mocker)
+
+    @property
+    def endpoint_url(self):
+        host, port = self.server_address[:2]
+        return 'http://%s:%d' % (host, port)
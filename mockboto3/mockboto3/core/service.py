@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+
+""""Base class for mocked AWS services."""
+
+import copy
+import threading
+import time
+
+from contextlib import contextmanager
+from functools import wraps
+
+from mockboto3.core.clock import Clock, http_date
+from mockboto3.core.exceptions import MockBoto3ClientError, client_error
+from mockboto3.core.journal import Journal
+from mockboto3.core.snapshot import Snapshot
+from mockboto3.core.storage import MemoryStorage
+
+
+def operation(name, locks=()):
+    """Mark a method as the handler for the AWS operation name.
+
+    locks names the stores the handler reads or changes, including
+    both ends of any relation it uses. They are held while the
+    handler runs on a thread safe mock.
+
+    Handlers called directly rather than through mock_make_api_call
+    run in a transaction of a transactional storage, so changes to
+    entities fetched with writable are saved.
+
+    @operation('CreateUser', locks=('users',))
+    def create_user(self, kwargs):
+        ...
+    """
+    def decorator(func):
+        @wraps(func)
+        def handler(self, kwargs):
+            if not self.storage.transactional:
+                return func(self, kwargs)
+
+            with self.storage.transaction():
+                return func(self, kwargs)
+
+        handler.operation_name = name
+        handler.operation_locks = tuple(sorted(locks))
+        return handler
+    return decorator
+
+
+class MockService(object):
+    """Base class for mocking the endpoints of an AWS service.
+
+    Handlers are registered with the operation decorator and
+    collected into a dispatch table once per class.
+
+    Subclasses list the attributes holding their entity stores and
+    relations so state can be snapshot and restored generically.
+    They are created by the storage backend, in memory by default,
+    as tables named after the service and the attribute.
+
+    A thread safe mock holds one lock per store. Each call acquires
+    the locks of the stores its handler uses in sorted order, so
+    calls on unrelated entity types run in parallel without
+    deadlocks.
+
+    Pass a Metrics instance as metrics to record calls, errors and
+    latencies per operation and a Throttle to rate limit calls and
+    inject latency.
+
+    clock gives handlers the current time, the real Clock by default.
+    Responses of a mock with a virtual clock, frozen or manual, carry
+    its time in their date header.
+
+    A journaled mock records every change made to its stores so they
+    can be rolled back to a savepoint and diffed, in memory only.
+    """
+
+    operation_locks = {}
+    operations = {}
+    relations = ()
+    service_name = None
+    stores = ()
+
+    def __init_subclass__(cls, **kwargs):
+        """Build the operation dispatch table for the subclass."""
+        super(MockService, cls).__init_subclass__(**kwargs)
+
+        operation_locks = {}
+        operations = {}
+        for klass in reversed(cls.__mro__):
+            for attr, value in vars(klass).items():
+                name = getattr(value, 'operation_name', None)
+                if name:
+                    unknown = set(value.operation_locks) - set(cls.stores)
+                    if unknown:
+                        raise TypeError('%s locks unknown stores %s.'
+                                        % (name, ', '.join(sorted(unknown))))
+
+                    # Calls dispatched by mock_make_api_call already
+                    # run in a transaction, skip the wrapper
+                    handler = getattr(cls, attr)
+                    operation_locks[name] = value.operation_locks
+                    operations[name] = getattr(handler, '__wrapped__',
+                                               handler)
+
+        cls.operation_locks = operation_locks
+        cls.operations = operations
+
+    def __init__(self, thread_safe=False, storage=None, metrics=None,
+                 throttle=None, clock=None, journal=False):
+        super(MockService, self).__init__()
+        self.clock = clock or Clock()
+        self.journal = None
+        self.locks = None
+        self.metrics = metrics
+        self.throttle = throttle
+        if thread_safe:
+            self.locks = dict((name, threading.Lock())
+                              for name in self.stores)
+
+        self.storage = storage or MemoryStorage()
+        if journal:
+            if self.storage.transactional:
+                raise ValueError('Only in-memory storage can be journaled.')
+            self.journal = Journal()
+
+        for name in self.stores:
+            setattr(self, name, self.storage.store(self._table(name)))
+
+        for name in self.relations:
+            setattr(self, name, self.storage.relation(self._table(name)))
+        self._attach_journal()
+
+    def _attach_journal(self):
+        """Journal the current stores and relations, if journaled."""
+        if self.journal is None:
+            return
+
+        self.journal.entries = []
+        self.journal.touched.clear()
+        for name in self.stores:
+            setattr(self, name, self.journal.wrap(name, getattr(self, name)))
+
+        for name in self.relations:
+            self.journal.wrap_relation(name, getattr(self, name))
+
+    def _journal(self):
+        if self.journal is None:
+            raise ValueError('%s mock is not journaled.' % self.service_name)
+        return self.journal
+
+    def _table(self, name):
+        return '%s_%s' % (self.service_name, name)
+
+    def diff(self, start, end=None):
+        """Return the changes per store between two savepoints.
+
+        See Journal.diff, end is the current state by default.
+        """
+        with self.locked():
+            return self._journal().diff(start, end)
+
+    @contextmanager
+    def locked(self, names=None):
+        """Hold the locks of the named stores, all stores by default.
+
+        An empty names holds no locks. Does nothing if the mock is not
+        thread safe.
+        """
+        if self.locks is None:
+            yield
+            return
+
+        locks = [self.locks[name] for name
+                 in sorted(self.locks if names is None else names)]
+        for lock in locks:
+            lock.acquire()
+
+        try:
+            yield
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+    def mock_make_api_call(self, operation_name, kwargs, throttle=True):
+        """Entry point for mocking AWS endpoints.
+
+        Calls the mocked AWS operation and returns a parsed
+        response.
+
+        If the AWS endpoint is not mocked raise a client error.
+        throttle=False skips the throttle, for callers which admitted
+        the call with Throttle.admit themselves.
+        """
+        handler = self.operations.get(operation_name)
+        if handler is None:
+            if self.metrics is not None:
+                self.metrics.record(operation_name, 0.0, 'NoSuchMethod')
+            raise client_error(operation_name,
+                               'NoSuchMethod',
+                               'Operation not mocked.')
+
+        if self.metrics is None and self.throttle is None and \
+                self.locks is None and not self.storage.transactional \
+                and not self.clock.virtual:
+            return handler(self, kwargs)
+
+        if self.metrics is None:
+            return self._call(handler, operation_name, kwargs, throttle)
+
+        start = time.perf_counter()
+        try:
+            response = self._call(handler, operation_name, kwargs,
+                                  throttle)
+        except MockBoto3ClientError as error:
+            self.metrics.record(operation_name, time.perf_counter() - start,
+                                error.response['Error']['Code'])
+            raise
+
+        self.metrics.record(operation_name, time.perf_counter() - start)
+        return response
+
+    def _call(self, handler, operation_name, kwargs, throttle=True):
+        """Call handler holding its locks in a storage transaction."""
+        if throttle and self.throttle is not None:
+            self.throttle(operation_name)
+
+        if self.locks is None and not self.storage.transactional:
+            response = handler(self, kwargs)
+        else:
+            with self.locked(self.operation_locks[operation_name]), \
+                    self.storage.transaction():
+                response = handler(self, kwargs)
+
+        if self.clock.virtual and 'ResponseMetadata' in response:
+            response['ResponseMetadata']['HTTPHeaders']['date'] = \
+                http_date(self.clock.time())
+        return response
+
+    def restore(self, snapshot):
+        """Reset state to a copy-on-write view of the snapshot.
+
+        Restoring in memory is O(1) in the size of the snapshot, only
+        entities changed afterwards are copied. Other storage backends
+        replace their contents with a copy of the snapshot.
+        """
+        if snapshot.service != self.service_name:
+            raise ValueError('Snapshot of %s cannot be restored into %s.'
+                             % (snapshot.service, self.service_name))
+
+        with self.locked():
+            for name in self.stores:
+                setattr(self, name, self.storage.store(
+                    self._table(name), snapshot.stores[name]
+                ))
+
+            for name in self.relations:
+                setattr(self, name, self.storage.relation(
+                    self._table(name), snapshot.relations[name]
+                ))
+            self._attach_journal()
+
+    def rollback_to(self, savepoint):
+        """Undo all changes made since savepoint, in O(changes)."""
+        with self.locked():
+            self._journal().rollback_to(savepoint)
+
+    def savepoint(self):
+        """Return a savepoint for rollback_to and diff.
+
+        Restoring a snapshot clears the journal, taking earlier
+        savepoints with it.
+        """
+        with self.locked():
+            return self._journal().savepoint()
+
+    def snapshot(self):
+        """Return a frozen snapshot of the current state."""
+        with self.locked(), self.storage.transaction():
+            stores = copy.deepcopy(
+                dict((name, dict(getattr(self, name).items()))
+                     for name in self.stores)
+            )
+            relations = dict((name, getattr(self, name).freeze())
+                             for name in self.relations)
+        return Snapshot(self.service_name, stores, relations)
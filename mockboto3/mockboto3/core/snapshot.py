@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+""""Frozen snapshots of mocked service state."""
+
+import mmap
+import os
+import pickle
+import struct
+
+from collections.abc import Mapping
+
+# Trailer holding the offset of the snapshot index in a dump file
+TRAILER = struct.Struct('<Q')
+
+
+class MappedEntities(Mapping):
+    """Read-only store of a snapshot loaded from a memory-mapped file.
+
+    Entities are unpickled from the mapped file each time they are
+    read, so processes loading the same file share its pages and
+    only hold the entities they use.
+    """
+
+    def __init__(self, buffer, index):
+        super(MappedEntities, self).__init__()
+        self.buffer = buffer
+        self.index = index
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __getitem__(self, key):
+        offset, length = self.index[key]
+        return pickle.loads(self.buffer[offset:offset + length])
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+
+class Snapshot(object):
+    """Frozen copy of the stores and relations of a mocked service.
+
+    A snapshot is never changed after it is taken, restoring it
+    layers copy-on-write overlays on top so one snapshot can seed
+    any number of mocks.
+
+    A snapshot can be dumped to a file and loaded memory-mapped by
+    any number of processes.
+    """
+
+    def __init__(self, service, stores, relations):
+        super(Snapshot, self).__init__()
+        self.service = service
+        self.stores = stores
+        self.relations = relations
+
+    def dump(self, path):
+        """Write the snapshot to path, replacing it atomically.
+
+        Entities are pickled one by one followed by an index of their
+        positions, the relations and the offset of the index.
+        """
+        temp_path = '%s.%d.tmp' % (path, os.getpid())
+        index = {}
+        with open(temp_path, 'wb') as dump_file:
+            for name, store in self.stores.items():
+                positions = index[name] = {}
+                for key, value in store.items():
+                    data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+                    positions[key] = (dump_file.tell(), len(data))
+                    dump_file.write(data)
+
+            offset = dump_file.tell()
+            pickle.dump((self.service, index, self.relations), dump_file,
+                        pickle.HIGHEST_PROTOCOL)
+            dump_file.write(TRAILER.pack(offset))
+
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Return the snapshot dumped to path, memory-mapped."""
+        with open(path, 'rb') as dump_file:
+            buffer = mmap.mmap(dump_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        offset, = TRAILER.unpack(buffer[-TRAILER.size:])
+        service, index, relations = pickle.loads(
+            buffer[offset:-TRAILER.size]
+        )
+        stores = dict((name, MappedEntities(buffer, positions))
+                      for name, positions in index.items())
+        return cls(service, stores, relations)
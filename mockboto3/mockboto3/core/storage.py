@@ -0,0 +1,396 @@
+# -*- coding: utf-8 -*-
+
+""""Storage backends for the entity stores and relations of a mock.
+
+MemoryStorage keeps entities in dicts and is the default.
+SqliteStorage keeps them in SQLite tables, in memory or in a file,
+so accounts larger than RAM can be simulated and one state can be
+shared by several processes:
+
+    MockIAM(storage=SqliteStorage('account.db'))
+
+A storage creates the stores and relations of a mock by table name
+and wraps every mocked call in a transaction.
+"""
+
+import pickle
+import threading
+
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+
+from mockboto3.core.relations import Relation
+from mockboto3.core.store import Overlay, Store
+
+
+class MemoryStorage(object):
+    """Default storage keeping entities in process memory.
+
+    Calls are not transactional, a handler failing halfway keeps
+    the changes made so far.
+    """
+
+    transactional = False
+
+    def relation(self, table, frozen=None):
+        """Return an empty relation or a view of frozen indexes."""
+        if frozen is None:
+            return Relation()
+        return Relation.thaw(frozen)
+
+    def store(self, table, frozen=None):
+        """Return an empty store or a copy-on-write view of frozen."""
+        if frozen is None:
+            return Store()
+        return Overlay(frozen)
+
+    @contextmanager
+    def transaction(self):
+        yield
+
+
+class SqliteStorage(object):
+    """Storage keeping entities pickled in SQLite tables.
+
+    Each store is a table keyed by entity name or id and each
+    relation a table indexed on both columns. Entities are loaded
+    on demand, changed entities are written back when the call
+    commits and all its changes are rolled back if it fails.
+
+    path is the database file, by default the database only lives
+    in memory. Several processes can open the same file, each call
+    holds the write lock of the database while it runs.
+
+    Changes made outside of a call are written immediately, except
+    for changes to entities fetched with writable which must be
+    made inside a transaction() block to be saved. Handlers and load
+    open that block themselves when called directly.
+    """
+
+    transactional = True
+
+    def __init__(self, path=':memory:', timeout=30.0):
+        super(SqliteStorage, self).__init__()
+        import sqlite3
+
+        self.changed = {}
+        self.connection = sqlite3.connect(path,
+                                          check_same_thread=False,
+                                          isolation_level=None,
+                                          timeout=timeout)
+        self.depth = 0
+        self.lock = threading.RLock()
+        self.path = path
+
+        if path != ':memory:':
+            self.execute('PRAGMA journal_mode=WAL')
+            self.execute('PRAGMA synchronous=NORMAL')
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    def execute(self, sql, parameters=()):
+        """Run a statement and return the number of changed rows."""
+        with self.lock:
+            return self.connection.execute(sql, parameters).rowcount
+
+    def query(self, sql, parameters=()):
+        """Run a query and return all rows."""
+        with self.lock:
+            return self.connection.execute(sql, parameters).fetchall()
+
+    def relation(self, table, frozen=None):
+        relation = SqliteRelation(self, table)
+        if frozen is not None:
+            with self.transaction():
+                relation.replace(frozen)
+        return relation
+
+    def store(self, table, frozen=None):
+        store = SqliteStore(self, table)
+        if frozen is not None:
+            with self.transaction():
+                store.replace(frozen)
+        return store
+
+    def track(self, store):
+        """Remember store has changed entities to write on commit."""
+        if self.depth:
+            self.changed[id(store)] = store
+        else:
+            store.flush()
+            store.dirty.clear()
+
+    @contextmanager
+    def transaction(self):
+        """Run the block in a transaction, nested blocks join it."""
+        with self.lock:
+            if self.depth:
+                self.depth += 1
+                try:
+                    yield
+                finally:
+                    self.depth -= 1
+                return
+
+            self.connection.execute('BEGIN IMMEDIATE')
+            self.depth = 1
+            try:
+                yield
+                for store in self.changed.values():
+                    store.flush()
+            except BaseException:
+                self.connection.execute('ROLLBACK')
+                raise
+            else:
+                self.connection.execute('COMMIT')
+            finally:
+                self.depth = 0
+                for store in self.changed.values():
+                    store.dirty.clear()
+                self.changed.clear()
+
+
+class SqliteRelation(object):
+    """Relation stored in an SQLite table, see Relation.
+
+    Related names are returned as lists in insertion order.
+    """
+
+    def __init__(self, storage, table):
+        super(SqliteRelation, self).__init__()
+        self.storage = storage
+        self.table = table
+
+        storage.execute(
+            'CREATE TABLE IF NOT EXISTS %s (source TEXT NOT NULL, '
+            'target TEXT NOT NULL, PRIMARY KEY (source, target))' % table
+        )
+        storage.execute('CREATE INDEX IF NOT EXISTS %s_target '
+                        'ON %s (target)' % (table, table))
+
+    def __contains__(self, pair):
+        return bool(self.storage.query(
+            'SELECT 1 FROM %s WHERE source = ? AND target = ?' % self.table,
+            pair
+        ))
+
+    def add(self, source, target):
+        """Relate source to target, return False if already related."""
+        return 1 == self.storage.execute(
+            'INSERT OR IGNORE INTO %s (source, target) VALUES (?, ?)'
+            % self.table, (source, target)
+        )
+
+    def count_sources(self, target):
+        return self.storage.query(
+            'SELECT COUNT(*) FROM %s WHERE target = ?' % self.table, (target,)
+        )[0][0]
+
+    def count_targets(self, source):
+        return self.storage.query(
+            'SELECT COUNT(*) FROM %s WHERE source = ?' % self.table, (source,)
+        )[0][0]
+
+    def discard(self, source, target):
+        """Remove relation if it exists, return False if it did not."""
+        return 1 == self.storage.execute(
+            'DELETE FROM %s WHERE source = ? AND target = ?' % self.table,
+            (source, target)
+        )
+
+    def freeze(self):
+        """Return both indexes as dicts for a snapshot."""
+        by_source = {}
+        by_target = {}
+        for source, target in self.storage.query(
+                'SELECT source, target FROM %s ORDER BY rowid' % self.table):
+            by_source.setdefault(source, {})[target] = None
+            by_target.setdefault(target, {})[source] = None
+        return by_source, by_target
+
+    def remove_source(self, source):
+        """Remove source from all relations and return its targets."""
+        targets = self.targets(source)
+        self.storage.execute('DELETE FROM %s WHERE source = ?' % self.table,
+                             (source,))
+        return targets
+
+    def remove_target(self, target):
+        """Remove target from all relations and return its sources."""
+        sources = self.sources(target)
+        self.storage.execute('DELETE FROM %s WHERE target = ?' % self.table,
+                             (target,))
+        return sources
+
+    def replace(self, frozen):
+        """Replace all relations with the frozen indexes."""
+        self.storage.execute('DELETE FROM %s' % self.table)
+        with self.storage.lock:
+            self.storage.connection.executemany(
+                'INSERT INTO %s (source, target) VALUES (?, ?)' % self.table,
+                ((source, target) for source, targets in frozen[0].items()
+                 for target in targets)
+            )
+
+    def sources(self, target):
+        """Return the sources related to target in insertion order."""
+        return [row[0] for row in self.storage.query(
+            'SELECT source FROM %s WHERE target = ? ORDER BY rowid'
+            % self.table, (target,)
+        )]
+
+    def targets(self, source):
+        """Return the targets related to source in insertion order."""
+        return [row[0] for row in self.storage.query(
+            'SELECT target FROM %s WHERE source = ? ORDER BY rowid'
+            % self.table, (source,)
+        )]
+
+
+class SqliteStore(MutableMapping):
+    """Entity store backed by an SQLite table.
+
+    Entities stored or fetched with writable in a transaction are
+    kept in dirty and written back when it commits, so changes made
+    to them after they were stored are saved. Reads return the dirty
+    entity if there is one, otherwise a fresh unpickled copy.
+
+    Iteration follows insertion order, replacing an entity keeps its
+    position.
+    """
+
+    batch_size = 1000
+
+    def __init__(self, storage, table):
+        super(SqliteStore, self).__init__()
+        self.dirty = {}
+        self.storage = storage
+        self.table = table
+
+        storage.execute('CREATE TABLE IF NOT EXISTS %s (key TEXT PRIMARY '
+                        'KEY, value BLOB NOT NULL)' % table)
+
+    def __contains__(self, key):
+        if key in self.dirty:
+            return True
+        return bool(self.storage.query(
+            'SELECT 1 FROM %s WHERE key = ?' % self.table, (key,)
+        ))
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+
+        self.dirty.pop(key, None)
+        self.storage.execute('DELETE FROM %s WHERE key = ?' % self.table,
+                             (key,))
+
+    def __getitem__(self, key):
+        try:
+            return self.dirty[key]
+        except KeyError:
+            rows = self.storage.query(
+                'SELECT value FROM %s WHERE key = ?' % self.table, (key,)
+            )
+            if not rows:
+                raise
+            return pickle.loads(rows[0][0])
+
+    def __iter__(self):
+        for key, value in self._rows('key'):
+            yield key
+
+    def __len__(self):
+        self.flush()
+        return self.storage.query('SELECT COUNT(*) FROM %s'
+                                  % self.table)[0][0]
+
+    def __setitem__(self, key, value):
+        self.dirty[key] = value
+        self.storage.track(self)
+
+    def _rows(self, columns, start=0, stop=None):
+        """Yield (key, value) rows in insertion order, in batches.
+
+        Rows changed in the current transaction are written first and
+        their dirty entity is yielded as value.
+        """
+        self.flush()
+        position = start
+        while stop is None or position < stop:
+            limit = self.batch_size
+            if stop is not None:
+                limit = min(limit, stop - position)
+
+            rows = self.storage.query(
+                'SELECT key, %s FROM %s ORDER BY rowid LIMIT ? OFFSET ?'
+                % (columns, self.table), (limit, position)
+            )
+            for key, value in rows:
+                if key in self.dirty:
+                    value = self.dirty[key]
+                elif columns == 'value':
+                    value = pickle.loads(value)
+                yield key, value
+
+            if len(rows) < limit:
+                return
+            position += len(rows)
+
+    def flush(self):
+        """Write the dirty entities to the table."""
+        if self.dirty:
+            with self.storage.lock:
+                self.storage.connection.executemany(
+                    'INSERT INTO %s (key, value) VALUES (?, ?) ON CONFLICT '
+                    '(key) DO UPDATE SET value = excluded.value' % self.table,
+                    ((key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+                     for key, value in self.dirty.items())
+                )
+
+    def items(self):
+        return SqliteView(self, lambda row: row)
+
+    def replace(self, frozen):
+        """Replace all entities with copies of the frozen ones."""
+        self.dirty.clear()
+        self.storage.execute('DELETE FROM %s' % self.table)
+        self.update(frozen)
+
+    def values(self):
+        return SqliteView(self, lambda row: row[1])
+
+    def writable(self, key):
+        """Return the entity, saved with its changes on commit."""
+        try:
+            return self.dirty[key]
+        except KeyError:
+            value = self.dirty[key] = self[key]
+
+        self.storage.track(self)
+        return value
+
+
+class SqliteView(object):
+    """Sized view over the rows of an SQLite store.
+
+    Supports slice so pagination only loads the requested page.
+    """
+
+    def __init__(self, store, transform):
+        super(SqliteView, self).__init__()
+        self.store = store
+        self.transform = transform
+
+    def __iter__(self):
+        return map(self.transform, self.store._rows('value'))
+
+    def __len__(self):
+        return len(self.store)
+
+    def slice(self, start, stop):
+        """Return the items from position start up to stop."""
+        return list(map(self.transform,
+                        self.store._rows('value', start, stop)))
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+
+""""Entity stores backing the mocked services."""
+
+import copy
+
+from collections.abc import MutableMapping, ValuesView
+from itertools import islice
+
+
+class StoreValues(ValuesView):
+    """Values view of an in-memory store supporting slice.
+
+    Later pages are sliced from the cached key list of the store, so
+    paging through all entities is O(n) rather than O(n^2).
+    """
+
+    def slice(self, start, stop):
+        mapping = self._mapping
+        if not start:
+            return list(islice(self, stop))
+        return [mapping[key] for key in mapping.key_list()[start:stop]]
+
+
+class Store(dict):
+    """Default in-memory entity store.
+
+    Handlers fetch entities they are about to change with writable
+    so stores layered on shared state can copy them first.
+    """
+
+    _keys = None
+    writable = dict.__getitem__
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self._keys = None
+
+    def __setitem__(self, key, value):
+        if self._keys is not None and key not in self:
+            self._keys = None
+        dict.__setitem__(self, key, value)
+
+    def clear(self):
+        dict.clear(self)
+        self._keys = None
+
+    def key_list(self):
+        """Return the keys in order, cached until keys change."""
+        if self._keys is None:
+            self._keys = list(self)
+        return self._keys
+
+    def pop(self, *args):
+        self._keys = None
+        return dict.pop(self, *args)
+
+    def popitem(self):
+        self._keys = None
+        return dict.popitem(self)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        self._keys = None
+        dict.update(self, *args, **kwargs)
+
+    def values(self):
+        return StoreValues(self)
+
+
+class Overlay(MutableMapping):
+    """Copy-on-write view of a frozen base mapping.
+
+    Reads fall through to the base, writes and deletes are kept in
+    the overlay. Entities from the base are copied the first time
+    they are fetched with writable, so the base is never changed and
+    can be shared by any number of overlays.
+    """
+
+    def __init__(self, base, copier=copy.deepcopy):
+        super(Overlay, self).__init__()
+        self.base = base
+        self.copier = copier
+        self.local = {}
+        self.removed = set()
+        self._keys = None
+        self._len = len(base)
+
+    def __contains__(self, key):
+        if key in self.local:
+            return True
+        return key in self.base and key not in self.removed
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+
+        self.local.pop(key, None)
+        if key in self.base:
+            self.removed.add(key)
+        self._keys = None
+        self._len -= 1
+
+    def __getitem__(self, key):
+        try:
+            return self.local[key]
+        except KeyError:
+            if key in self.removed:
+                raise
+            return self.base[key]
+
+    def __iter__(self):
+        local = self.local
+        removed = self.removed
+        for key in self.base:
+            if key not in removed:
+                yield key
+
+        for key in local:
+            if key not in self.base:
+                yield key
+
+    def __len__(self):
+        return self._len
+
+    def __setitem__(self, key, value):
+        if key not in self:
+            self._keys = None
+            self._len += 1
+
+        self.removed.discard(key)
+        self.local[key] = value
+
+    def key_list(self):
+        """Return the keys in order, cached until keys change."""
+        if self._keys is None:
+            if self.local or self.removed:
+                self._keys = list(self)
+            else:
+                self._keys = list(self.base)
+        return self._keys
+
+    def values(self):
+        return StoreValues(self)
+
+    def writable(self, key):
+        """Return a private copy of the entity safe to change."""
+        try:
+            return self.local[key]
+        except KeyError:
+            if key in self.removed:
+                raise
+
+        value = self.local[key] = self.copier(self.base[key])
+        return value
+
+    def reset(self, key):
+        """Drop the changes of key, showing the base entity again."""
+        if key not in self:
+            self._keys = None
+            self._len += 1
+
+        self.local.pop(key, None)
+        self.removed.discard(key)
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+""""Rate limits and latency injection for mocked services.
+
+    throttle = Throttle(rates={'GetUser': 10}, account_rate=(20, 40),
+                        latency=lognormal(0.05, 0.5))
+    mocker = MockIAM(throttle=throttle)
+
+Calls beyond the token bucket of their operation or of the account
+fail with a Throttling client error, the error real IAM returns, so
+the retry and backoff of the code under test can be tuned offline.
+The same throttle can be shared by several mocks of one account.
+"""
+
+import math
+import numbers
+import random
+import threading
+import time
+
+from mockboto3.core.exceptions import client_error
+
+
+def delay_for(latency, operation_name):
+    """Return the latency in seconds of a call of operation_name.
+
+    latency is None, a number of seconds, a dict of seconds per
+    operation name or a callable taking the operation name.
+    """
+    if latency is None or isinstance(latency, numbers.Number):
+        return latency
+    if isinstance(latency, dict):
+        return latency.get(operation_name)
+    return latency(operation_name)
+
+
+def lognormal(median, sigma, seed=None):
+    """Return long tailed latencies around median seconds."""
+    generator = random.Random(seed)
+    mu = math.log(median)
+    return lambda operation_name: generator.lognormvariate(mu, sigma)
+
+
+def uniform(low, high, seed=None):
+    """Return latencies evenly spread between low and high seconds."""
+    generator = random.Random(seed)
+    return lambda operation_name: generator.uniform(low, high)
+
+
+class TokenBucket(object):
+    """Bucket of burst tokens refilled at rate tokens per second."""
+
+    def __init__(self, rate, burst=None, clock=time.monotonic):
+        super(TokenBucket, self).__init__()
+        self.burst = rate if burst is None else burst
+        self.clock = clock
+        self.rate = rate
+        self.tokens = self.burst
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def take(self):
+        """Take a token, return False if the bucket is empty."""
+        with self._lock:
+            now = self.clock()
+            self.tokens = min(self.burst,
+                              self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+    def refund(self):
+        """Give back a token taken for a call rejected elsewhere."""
+        with self._lock:
+            self.tokens = min(self.burst, self.tokens + 1)
+
+
+class Throttle(object):
+    """Token bucket rate limits and injected latency.
+
+    rates maps operation names to a rate per second or a tuple of
+    rate and burst, account_rate limits all calls together the same
+    way. The burst defaults to one second worth of calls. latency is
+    as for delay_for, use lognormal or uniform for distributions.
+
+    A call throttled by its operation bucket does not consume an
+    account token and a call throttled by the account bucket does not
+    consume an operation token. Throttled calls get no latency.
+
+    clock and sleep are real time by default, pass the monotonic and
+    sleep methods of a ManualClock to refill buckets in virtual time.
+    """
+
+    def __init__(self, rates=None, account_rate=None, latency=None,
+                 error_code='Throttling', clock=time.monotonic,
+                 sleep=time.sleep):
+        super(Throttle, self).__init__()
+        self.account = None
+        if account_rate is not None:
+            self.account = self._bucket(account_rate, clock)
+
+        self.buckets = dict((name, self._bucket(rate, clock))
+                            for name, rate in (rates or {}).items())
+        self.error_code = error_code
+        self.latency = latency
+        self.sleep = sleep
+        self.throttled = 0
+
+    def __call__(self, operation_name):
+        """Sleep for the latency of the call or raise if throttled."""
+        delay = self.admit(operation_name)
+        if delay:
+            self.sleep(delay)
+
+    def admit(self, operation_name):
+        """Take the tokens of a call and return its latency in seconds.
+
+        Raise if throttled. Callers simulating the latency themselves,
+        e.g. awaiting it in an event loop, use this instead of calling
+        the throttle.
+        """
+        bucket = self.buckets.get(operation_name)
+        throttled = bucket is not None and not bucket.take()
+        if not throttled and self.account is not None and \
+                not self.account.take():
+            throttled = True
+            if bucket is not None:
+                bucket.refund()
+
+        if throttled:
+            self.throttled += 1
+            raise client_error(operation_name, self.error_code,
+                               'Rate exceeded')
+
+        return delay_for(self.latency, operation_name)
+
+    @staticmethod
+    def _bucket(rate, clock):
+        if isinstance(rate, tuple):
+            return TokenBucket(rate[0], rate[1], clock=clock)
+        return TokenBucket(rate, clock=clock)
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+
+""""Recording of mocked calls to trace files and their replay.
+
+A trace is a stream of JSON lines, one per call, with the time since
+recording started, the operation name, its arguments and either the
+response or the error code and message:
+
+    {"t":0.0012,"op":"CreateUser","kwargs":{"UserName":"John"},
+     "response":{"User":{...}}}
+
+Traces ending in .gz are compressed. Replaying a trace re-executes its
+calls against any api call, such as a fresh MockIAM or a client of a
+mock server, as fast as possible or at the recorded pace, and reports
+calls whose outcome differs from the recording.
+"""
+
+import gzip
+import json
+import threading
+import time
+
+from datetime import datetime
+
+from botocore.exceptions import ClientError
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        return value.decode('utf-8', 'replace')
+    raise TypeError('%r is not JSON serializable' % value)
+
+
+def _encode(entry):
+    return json.dumps(entry, default=_default, separators=(',', ':')) + '\n'
+
+
+def _open(path, mode):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't')
+    return open(path, mode)
+
+
+def read_trace(path):
+    """Yield the entries of a trace file one at a time."""
+    with _open(path, 'r') as trace_file:
+        for line in trace_file:
+            if line.strip():
+                yield json.loads(line)
+
+
+class TraceRecorder(object):
+    """Replacement for _make_api_call writing every call to a trace.
+
+    Wraps api_call, usually the mock_make_api_call of a mock. Lines
+    are written as calls complete, from any number of threads.
+    Response metadata is left out as it is the same for every call.
+    """
+
+    def __init__(self, api_call, path):
+        super(TraceRecorder, self).__init__()
+        self.api_call = api_call
+        self.calls = 0
+        self.path = path
+        self.start = time.perf_counter()
+        self._file = _open(path, 'w')
+        self._lock = threading.Lock()
+
+    def __call__(self, operation_name, kwargs):
+        entry = {'t': round(time.perf_counter() - self.start, 6),
+                 'op': operation_name,
+                 'kwargs': kwargs}
+        try:
+            response = self.api_call(operation_name, kwargs)
+        except ClientError as error:
+            entry['error'] = {'Code': error.response['Error']['Code'],
+                              'Message': error.response['Error']['Message']}
+            self._write(entry)
+            raise
+
+        entry['response'] = dict((key, value)
+                                 for key, value in response.items()
+                                 if key != 'ResponseMetadata')
+        self._write(entry)
+        return response
+
+    def _write(self, entry):
+        line = _encode(entry)
+        with self._lock:
+            self._file.write(line)
+            self.calls += 1
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class ReplayResult(object):
+    """Outcome of a replay.
+
+    mismatches lists (line number, operation name, recorded error
+    code, replayed error code) of calls which succeeded or failed
+    differently than recorded, None standing for success.
+    """
+
+    def __init__(self):
+        super(ReplayResult, self).__init__()
+        self.calls = 0
+        self.elapsed = 0.0
+        self.errors = {}
+        self.mismatches = []
+
+    @property
+    def calls_per_second(self):
+        return self.calls / self.elapsed if self.elapsed else 0.0
+
+
+def _map_ids(recorded, replayed, ids):
+    """Map ids of the recorded response to those of the replay.
+
+    Ids generated by the replay differ from the recorded ones unless
+    both used the same seeded generator, later calls taking a
+    recorded id as argument are given the replayed id instead.
+    """
+    if isinstance(recorded, dict) and isinstance(replayed, dict):
+        for key, value in recorded.items():
+            other = replayed.get(key)
+            if key.endswith('Id') and isinstance(value, str):
+                if isinstance(other, str) and other != value:
+                    ids[value] = other
+            elif isinstance(value, (dict, list)):
+                _map_ids(value, other, ids)
+    elif isinstance(recorded, list) and isinstance(replayed, list):
+        for value, other in zip(recorded, replayed):
+            _map_ids(value, other, ids)
+
+
+def _replace_ids(kwargs, ids):
+    """Return kwargs with recorded ids replaced by replayed ones."""
+    if isinstance(kwargs, dict):
+        return dict((key, _replace_ids(value, ids))
+                    for key, value in kwargs.items())
+    if isinstance(kwargs, list):
+        return [_replace_ids(value, ids) for value in kwargs]
+    if isinstance(kwargs, str):
+        return ids.get(kwargs, kwargs)
+    return kwargs
+
+
+def replay(path, api_call, speed=None):
+    """Re-execute the calls of a trace and return a ReplayResult.
+
+    api_call takes the operation name and arguments, for instance
+    MockIAM().mock_make_api_call or the _make_api_call of a boto3
+    client pointed at a mock server.
+
+    Calls are made as fast as possible unless speed is given, 1.0
+    keeping the recorded pace, 2.0 replaying twice as fast.
+    """
+    result = ReplayResult()
+    ids = {}
+    clock = time.perf_counter
+    start = clock()
+
+    for number, entry in enumerate(read_trace(path), 1):
+        if speed:
+            delay = entry['t'] / speed - (clock() - start)
+            if delay > 0:
+                time.sleep(delay)
+
+        kwargs = _replace_ids(entry['kwargs'], ids) if ids \
+            else entry['kwargs']
+        expected = entry.get('error', {}).get('Code')
+        code = None
+        try:
+            response = api_call(entry['op'], kwargs)
+        except ClientError as error:
+            code = error.response['Error']['Code']
+            result.errors[code] = result.errors.get(code, 0) + 1
+        else:
+            if 'response' in entry:
+                _map_ids(entry['response'], response, ids)
+
+        result.calls += 1
+        if code != expected:
+            result.mismatches.append((number, entry['op'], expected, code))
+
+    result.elapsed = clock() - start
+    return result
@@ -1,15 +1,11 @@
 # -*- coding: utf-8 -*-
 
-import random
 import re
 
-chars = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
-
-
-def get_random_string(length=12, allowed_chars=chars):
-    return ''.join(random.choice(allowed_chars) for _ in range(length))
+from functools import lru_cache
 
 
+@lru_cache(maxsize=None)
 def inflection(name):
     """Convert camelcase names into snakecase attributes.
 
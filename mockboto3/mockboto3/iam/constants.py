@@ -2,6 +2,9 @@
 
 """"Constants."""
 
+# Versions a managed policy can have at once
+MAX_POLICY_VERSIONS = 5
+
 POLICY_DOC = '{"Version":"2012-10-17","Statement":[' \
                   '{"Effect":"Allow","Action":"*","Resource":"*"}]}'
 
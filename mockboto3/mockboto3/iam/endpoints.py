@@ -2,49 +2,109 @@
 
 """"Mocked endpoints."""
 
-from functools import wraps
-from unittest.mock import patch
+from functools import partial, wraps
 
 from mockboto3.core.exceptions import client_error
-from mockboto3.core.utils import inflection
+from mockboto3.core.ids import RandomIds
+from mockboto3.core.pagination import paginate
+from mockboto3.core.router import Router
+from mockboto3.core.service import MockService, operation
 
 from mockboto3.iam import responses
-from mockboto3.iam.models import AccessKey, Group, Policy, User
-from mockboto3.iam.utils import get_value_from_arn
+from mockboto3.iam.constants import MAX_POLICY_VERSIONS
+from mockboto3.iam.fixtures import load_fixture, read_fixture
+from mockboto3.iam.models import AccessKey, Document, Group, Policy, User
+from mockboto3.iam.policy import PolicyEvaluator, Simulation
+from mockboto3.iam.utils import document_key, get_value_from_arn
 
 
-class MockIAM(object):
+class MockIAM(MockService):
     """Class for mocking IAM endpoints."""
 
-    def __init__(self):
-        """Initialize class."""
-        super(MockIAM, self).__init__()
-        self.access_keys = {}
-        self.groups = {}
-        self.users = {}
-        self.policies = {}
+    relations = ('group_policies', 'user_access_keys',
+                 'user_groups', 'user_policies')
+    service_name = 'iam'
+    stores = ('access_keys', 'documents', 'groups', 'policies', 'users')
 
-    def mock_make_api_call(self, operation_name, kwargs):
-        """Entry point for mocking AWS endpoints.
+    def __init__(self, ids=None, **options):
+        """Initialize class.
 
-        Calls the mocked AWS operation and returns a parsed
-        response.
+        ids is the IdGenerator for entity ids and secrets, random
+        by default. Pass SeededIds for reproducible runs.
 
-        If the AWS endpoint is not mocked raise a client error.
+        Other options are those of MockService: thread_safe to share
+        the mock between threads, a storage backend such as
+        SqliteStorage to keep entities out of process memory, a
+        Metrics instance to record calls per operation, a Throttle
+        to simulate rate limits and latency, a clock such as
+        ManualClock to control the timestamps of entities and
+        journal=True to roll changes back to savepoints.
+
+        Entities are keyed by name (access keys by id) and so are
+        the relations between them. Policy documents are kept once
+        per distinct text in documents, keyed by their sha256.
         """
-        try:
-            return getattr(self, inflection(operation_name))(kwargs)
-        except AttributeError:
-            raise client_error(operation_name,
-                               'NoSuchMethod',
-                               'Operation not mocked.')
+        super(MockIAM, self).__init__(**options)
+        self.ids = ids or RandomIds()
 
-    @staticmethod
-    def _access_key_not_found(access_key_id, method):
-        raise client_error(method,
-                           'NoSuchEntity',
-                           'The Access Key with id %s cannot be found.'
-                           % access_key_id)
+    def add_document(self, text):
+        """Reference the document with text, return its key.
+
+        Identical documents of any policies and versions share one
+        Document, counting its references.
+        """
+        key = document_key(text)
+        if key in self.documents:
+            document = self.documents.writable(key)
+        else:
+            document = self.documents[key] = Document(key, text)
+
+        document.references += 1
+        return document.key
+
+    def release_document(self, key):
+        """Drop a reference to a document, delete it if unused."""
+        document = self.documents.writable(key)
+        document.references -= 1
+        if not document.references:
+            del self.documents[key]
+
+    def load(self, fixture):
+        """Bulk load a fixture dict or a JSON/YAML fixture file.
+
+        See mockboto3.iam.fixtures for the fixture format.
+        """
+        if isinstance(fixture, str):
+            fixture = read_fixture(fixture)
+
+        with self.locked(), self.storage.transaction():
+            load_fixture(self, fixture)
+
+    def policy_evaluator(self, principal_arn):
+        """Return a PolicyEvaluator for a user or group ARN.
+
+        For evaluating many actions and resources from Python without
+        building simulation responses.
+        """
+        with self.locked(('documents', 'groups', 'policies', 'users')):
+            return self._evaluator(
+                self._principal_policies(principal_arn,
+                                         'SimulatePrincipalPolicy'),
+                'SimulatePrincipalPolicy'
+            )
+
+    def _check_access_key_exists(self, access_key_id, method,
+                                 user_name=None):
+        """Return access key, optionally only if it belongs to the user."""
+        access_key = self.access_keys.get(access_key_id)
+        if access_key is None or \
+                (user_name and access_key.username != user_name):
+            raise client_error(method,
+                               'NoSuchEntity',
+                               'The Access Key with id %s cannot be found.'
+                               % access_key_id)
+
+        return access_key
 
     def _check_group_exists(self, group, method):
         try:
@@ -74,6 +134,16 @@ class MockIAM(object):
 
         return policy
 
+    @staticmethod
+    def _check_policy_version_exists(policy, version_id, method):
+        try:
+            return policy.versions[version_id]
+        except KeyError:
+            raise client_error(method,
+                               'NoSuchEntity',
+                               'Policy %s version %s does not exist or is '
+                               'not attachable.' % (policy.arn, version_id))
+
     def _check_signing_certificate_exists(self, user, cert_id, method):
         try:
             self.users[user].signing_certs[cert_id]
@@ -92,46 +162,116 @@ class MockIAM(object):
                                'The user with name %s cannot be found.'
                                % user)
 
-    @staticmethod
-    def _check_user_has_policy(policy, user, method):
-        if policy not in user.attached_policies:
+    def _check_group_has_policy(self, policy, group, method):
+        if (group, policy) not in self.group_policies:
+            raise client_error(method,
+                               'NoSuchEntity',
+                               'The policy with name %s '
+                               'is not attached to the group with name '
+                               '%s.' % (policy, group))
+
+    def _check_user_has_policy(self, policy, user, method):
+        if (user.username, policy) not in self.user_policies:
             raise client_error(method,
                                'NoSuchEntity',
                                'The policy with name %s '
                                'is not attached to the user with name '
                                '%s.' % (policy, user.username))
 
+    def _evaluator(self, policies, method):
+        """Return PolicyEvaluator of policies or a malformed error."""
+        try:
+            return PolicyEvaluator(policies)
+        except ValueError as error:
+            raise client_error(method, 'MalformedPolicyDocument', str(error))
+
+    def _principal_policies(self, arn, method):
+        """Return the policies in effect for a user or group ARN.
+
+        A user is subject to its own policies and those of its groups.
+        """
+        kind, _, path = arn.split(':', 5)[-1].partition('/')
+        name = path.rpartition('/')[2]
+
+        if kind == 'user':
+            self._check_user_exists(name, method)
+            names = list(self.user_policies.targets(name))
+            for group in self.user_groups.targets(name):
+                names.extend(self.group_policies.targets(group))
+        elif kind == 'group':
+            self._check_group_exists(name, method)
+            names = list(self.group_policies.targets(name))
+        else:
+            raise client_error(method,
+                               'InvalidInput',
+                               'Invalid PolicySourceArn %s.' % arn)
+
+        return [(policy_name, 'user-managed',
+                 self._policy_document(self.policies[policy_name]))
+                for policy_name in dict.fromkeys(names)]
+
+    def _policy_document(self, policy):
+        """Return the text of the default version of policy."""
+        return self.documents[policy.default_version.document_key].text
+
+    def _simulate(self, evaluator, kwargs, method):
+        simulation = Simulation(evaluator,
+                                kwargs['ActionNames'],
+                                kwargs.get('ResourceArns') or ['*'])
+        results, marker = paginate(simulation, kwargs, method)
+        return responses.simulate_policy_response(results, marker)
+
+    def _detach_policies(self, relation, name):
+        """Remove all policy attachments of a deleted user or group."""
+        for policy_name in relation.remove_source(name):
+            self.policies.writable(policy_name).attachment_count -= 1
+
+    @operation('AddUserToGroup', locks=('groups', 'users'))
     def add_user_to_group(self, kwargs):
         """Add user to the group if user and group exist."""
         self._check_user_exists(kwargs['UserName'], 'AddUserToGroup')
         self._check_group_exists(kwargs['GroupName'], 'AddUserToGroup')
 
-        user = self.users[kwargs['UserName']]
-        group = self.groups[kwargs['GroupName']]
-
-        group.add_user(user.username)
-        user.add_group(group.name)
+        self.user_groups.add(kwargs['UserName'], kwargs['GroupName'])
         return responses.user_group_response()
 
+    @operation('AttachGroupPolicy', locks=('groups', 'policies'))
+    def attach_group_policy(self, kwargs):
+        """Attach policy to group if group and policy exist."""
+        self._check_group_exists(kwargs['GroupName'], 'AttachGroupPolicy')
+
+        policy_name = get_value_from_arn(kwargs['PolicyArn'])
+        self._check_policy_exists(policy_name, 'AttachGroupPolicy')
+
+        if self.group_policies.add(kwargs['GroupName'], policy_name):
+            self.policies.writable(policy_name).attachment_count += 1
+        return responses.generic_response()
+
+    @operation('AttachUserPolicy', locks=('policies', 'users'))
     def attach_user_policy(self, kwargs):
         self._check_user_exists(kwargs['UserName'], 'AttachUserPolicy')
-        user = self.users[kwargs['UserName']]
 
         policy_name = get_value_from_arn(kwargs['PolicyArn'])
-        policy = self._check_policy_exists(policy_name, 'AttachUserPolicy')
+        self._check_policy_exists(policy_name, 'AttachUserPolicy')
 
-        user.attach_policy(policy_name)
-        policy.attach_user(user.username)
+        if self.user_policies.add(kwargs['UserName'], policy_name):
+            self.policies.writable(policy_name).attachment_count += 1
         return responses.generic_response()
 
+    @operation('CreateAccessKey', locks=('access_keys', 'users'))
     def create_access_key(self, kwargs):
         """Create access key for user if user exists."""
         self._check_user_exists(kwargs['UserName'], 'CreateAccessKey')
 
-        access_key = AccessKey(kwargs['UserName'])
+        access_key = AccessKey(kwargs['UserName'],
+                               self.ids.generate('access_key'),
+                               self.ids.secret(),
+                               now=self.clock.now())
         self.access_keys[access_key.id] = access_key
+        self.user_access_keys.add(access_key.username, access_key.id)
         return responses.access_key_response(access_key)
 
+    @operation('CreateGroup', locks=('groups',))
     def create_group(self, kwargs):
         """Create group if it does not exist."""
         if kwargs['GroupName'] in self.groups:
@@ -140,15 +280,18 @@ class MockIAM(object):
                                'Group with name %s already exists.'
                                % kwargs['GroupName'])
 
-        group = Group(kwargs['GroupName'])
+        group = Group(kwargs['GroupName'],
+                      self.ids.generate('group'),
+                      now=self.clock.now())
         self.groups[group.name] = group
         return responses.group_response(group)
 
+    @operation('CreateLoginProfile', locks=('users',))
     def create_login_profile(self, kwargs):
         """Create login profile for user if user has no password."""
         self._check_user_exists(kwargs['UserName'], 'CreateLoginProfile')
 
-        user = self.users[kwargs['UserName']]
+        user = self.users.writable(kwargs['UserName'])
         if user.login_profile:
             raise client_error('CreateLoginProfile',
                                'EntityAlreadyExists',
@@ -157,9 +300,11 @@ class MockIAM(object):
 
         reset_required = kwargs.get('PasswordResetRequired', None)
         user.create_login_profile(kwargs['Password'],
-                                  reset_required=reset_required)
+                                  reset_required=reset_required,
+                                  now=self.clock.now())
         return responses.login_profile_response(user, create=True)
 
+    @operation('CreatePolicy', locks=('documents', 'policies'))
     def create_policy(self, kwargs):
         """Create policy given policy document."""
         if kwargs['PolicyName'] in self.policies:
@@ -169,12 +314,38 @@ class MockIAM(object):
                                'exists.' % kwargs['PolicyName'])
 
         policy = Policy(kwargs.get('PolicyName'),
-                        kwargs.get('PolicyDocument'),
+                        self.ids.generate('policy'),
+                        self.add_document(kwargs['PolicyDocument']),
                         kwargs.get('Description', None),
-                        kwargs.get('Path', None))
+                        kwargs.get('Path', None),
+                        now=self.clock.now())
         self.policies[policy.name] = policy
         return responses.create_policy_response(policy)
 
+    @operation('CreatePolicyVersion', locks=('documents', 'policies'))
+    def create_policy_version(self, kwargs):
+        """Add a version to policy if it has less than the maximum."""
+        policy_name = get_value_from_arn(kwargs['PolicyArn'])
+        self._check_policy_exists(policy_name, 'CreatePolicyVersion')
+
+        policy = self.policies.writable(policy_name)
+        if len(policy.versions) >= MAX_POLICY_VERSIONS:
+            raise client_error('CreatePolicyVersion',
+                               'LimitExceeded',
+                               'A managed policy can have up to %d '
+                               'versions. Before you create a new version, '
+                               'you must delete an existing version.'
+                               % MAX_POLICY_VERSIONS)
+
+        now = self.clock.now()
+        version = policy.create_new_version(
+            self.add_document(kwargs['PolicyDocument']), now
+        )
+        if kwargs.get('SetAsDefault'):
+            policy.set_default_version(version.version, now)
+        return responses.policy_version_response(version)
+
+    @operation('CreateUser', locks=('users',))
     def create_user(self, kwargs):
         """Create user if user does not exist."""
         if kwargs['UserName'] in self.users:
@@ -183,28 +354,34 @@ class MockIAM(object):
                                'User with name %s already exists.'
                                % kwargs['UserName'])
 
-        self.users[kwargs['UserName']] = User(kwargs['UserName'])
-        return responses.user_response(kwargs['UserName'])
+        user = self.users[kwargs['UserName']] = User(
+            kwargs['UserName'],
+            self.ids.generate('user'),
+            now=self.clock.now()
+        )
+        return responses.user_response(user)
 
+    @operation('EnableMFADevice', locks=('users',))
     def enable_mfa_device(self, kwargs):
         """Enable MFA Device for user."""
         self._check_user_exists(kwargs['UserName'], 'EnableMFADevice')
 
-        user = self.users[kwargs['UserName']]
+        user = self.users.writable(kwargs['UserName'])
         if kwargs['SerialNumber'] in user.mfa_devices:
             raise client_error('EnableMFADevice',
                                'EntityAlreadyExists',
                                'Device with serial number %s already '
                                'exists.' % kwargs['SerialNumber'])
 
-        user.enable_mfa_device(kwargs['SerialNumber'])
+        user.enable_mfa_device(kwargs['SerialNumber'], self.clock.now())
         return responses.generic_response()
 
+    @operation('DeactivateMFADevice', locks=('users',))
     def deactivate_mfa_device(self, kwargs):
         """Deactivate and detach MFA Device from user if device exists."""
         self._check_user_exists(kwargs['UserName'], 'DeactivateMFADevice')
 
-        user = self.users[kwargs['UserName']]
+        user = self.users.writable(kwargs['UserName'])
         if kwargs['SerialNumber'] not in user.mfa_devices:
             raise client_error('DeactivateMFADevice',
                                'NoSuchEntity',
@@ -214,37 +391,61 @@ class MockIAM(object):
         user.deactivate_mfa_device(kwargs['SerialNumber'])
         return responses.generic_response()
 
+    @operation('DeleteAccessKey', locks=('access_keys', 'users'))
     def delete_access_key(self, kwargs):
         """Delete access key if access key exists."""
-        try:
-            self.access_keys.pop(kwargs['AccessKeyId'])
-        except KeyError:
-            self._access_key_not_found(kwargs['AccessKeyId'],
-                                       'DeleteAccessKey')
+        access_key = self._check_access_key_exists(kwargs['AccessKeyId'],
+                                                   'DeleteAccessKey',
+                                                   kwargs.get('UserName'))
+
+        self.access_keys.pop(access_key.id)
+        self.user_access_keys.discard(access_key.username, access_key.id)
 
         return responses.generic_response()
 
+    @operation('DeleteGroup', locks=('groups', 'policies', 'users'))
     def delete_group(self, kwargs):
         """Delete group if group exists."""
         self._check_group_exists(kwargs['GroupName'], 'DeleteGroup')
 
-        for key, user in self.users.items():
-            if kwargs['GroupName'] in user.groups:
-                user.remove_group(kwargs['GroupName'])
+        self.user_groups.remove_target(kwargs['GroupName'])
+        self._detach_policies(self.group_policies, kwargs['GroupName'])
 
         self.groups.pop(kwargs['GroupName'], None)
         return responses.generic_response()
 
+    @operation('DeleteLoginProfile', locks=('users',))
     def delete_login_profile(self, kwargs):
         """Delete login profile (password) from user if users has password."""
         self._check_user_exists(kwargs['UserName'], 'DeleteLoginProfile')
 
-        user = self.users[kwargs['UserName']]
+        user = self.users.writable(kwargs['UserName'])
         self._check_login_profile_exists(user, 'DeleteLoginProfile')
 
         user.delete_login_profile()
         return responses.generic_response()
 
+    @operation('DeletePolicyVersion', locks=('documents', 'policies'))
+    def delete_policy_version(self, kwargs):
+        """Delete policy version if it is not the default version."""
+        policy_name = get_value_from_arn(kwargs['PolicyArn'])
+        self._check_policy_exists(policy_name, 'DeletePolicyVersion')
+
+        policy = self.policies.writable(policy_name)
+        self._check_policy_version_exists(policy,
+                                          kwargs['VersionId'],
+                                          'DeletePolicyVersion')
+        if kwargs['VersionId'] == policy.default_version_id:
+            raise client_error('DeletePolicyVersion',
+                               'DeleteConflict',
+                               'Cannot delete the default version of a '
+                               'policy.')
+
+        version = policy.delete_version(kwargs['VersionId'])
+        self.release_document(version.document_key)
+        return responses.generic_response()
+
+    @operation('DeleteSigningCertificate', locks=('users',))
     def delete_signing_certificate(self, kwargs):
         """Delete signing cert if cert exists."""
         self._check_user_exists(kwargs['UserName'], 'DeleteSigningCertificate')
@@ -252,21 +453,41 @@ class MockIAM(object):
                                                kwargs['CertificateId'],
                                                'DeleteSigningCertificate')
 
-        user = self.users[kwargs['UserName']]
+        user = self.users.writable(kwargs['UserName'])
         user.delete_signing_certificate(kwargs['CertificateId'])
         return responses.generic_response()
 
+    @operation('DeleteUser',
+               locks=('access_keys', 'groups', 'policies', 'users'))
     def delete_user(self, kwargs):
         """Delete user if user exists."""
         self._check_user_exists(kwargs['UserName'], 'DeleteUser')
 
-        for group in self.groups:
-            if kwargs['UserName'] in group.users:
-                group.remove_user(kwargs['UserName'])
+        self.user_groups.remove_source(kwargs['UserName'])
+        self._detach_policies(self.user_policies, kwargs['UserName'])
+
+        for key_id in self.user_access_keys.remove_source(kwargs['UserName']):
+            self.access_keys.pop(key_id)
 
         self.users.pop(kwargs['UserName'], None)
         return responses.generic_response()
 
+    @operation('DetachGroupPolicy', locks=('groups', 'policies'))
+    def detach_group_policy(self, kwargs):
+        """Detach group policy if policy is attached."""
+        self._check_group_exists(kwargs['GroupName'], 'DetachGroupPolicy')
+
+        policy_name = get_value_from_arn(kwargs['PolicyArn'])
+        self._check_group_has_policy(policy_name,
+                                     kwargs['GroupName'],
+                                     'DetachGroupPolicy')
+        self._check_policy_exists(policy_name, 'DetachGroupPolicy')
+
+        self.group_policies.discard(kwargs['GroupName'], policy_name)
+        self.policies.writable(policy_name).attachment_count -= 1
+        return responses.generic_response()
+
+    @operation('DetachUserPolicy', locks=('policies', 'users'))
     def detach_user_policy(self, kwargs):
         """Detach user policy if policy exists."""
         self._check_user_exists(kwargs['UserName'], 'DetachUserPolicy')
@@ -274,21 +495,20 @@ class MockIAM(object):
 
         policy_name = get_value_from_arn(kwargs['PolicyArn'])
         self._check_user_has_policy(policy_name, user, 'DetachUserPolicy')
-        policy = self._check_policy_exists(policy_name, 'DetachUserPolicy')
+        self._check_policy_exists(policy_name, 'DetachUserPolicy')
 
-        user.detach_policy(policy_name)
-        policy.detach_user(user.username)
+        self.user_policies.discard(user.username, policy_name)
+        self.policies.writable(policy_name).attachment_count -= 1
         return responses.generic_response()
 
+    @operation('GetAccessKeyLastUsed', locks=('access_keys',))
     def get_access_key_last_used(self, kwargs):
-        try:
-            access_key = self.access_keys.get(kwargs['AccessKeyId'])
-        except KeyError:
-            self._access_key_not_found(kwargs['AccessKeyId'],
-                                       'GetAccessKeyLastUsed')
+        access_key = self._check_access_key_exists(kwargs['AccessKeyId'],
+                                                   'GetAccessKeyLastUsed')
 
         return responses.access_key_last_used_response(access_key)
 
+    @operation('GetLoginProfile', locks=('users',))
     def get_login_profile(self, kwargs):
         """Get login profile (password) for user if users has password."""
         self._check_user_exists(kwargs['UserName'], 'GetLoginProfile')
@@ -298,12 +518,35 @@ class MockIAM(object):
 
         return responses.login_profile_response(user)
 
+    @operation('GetPolicy', locks=('policies',))
+    def get_policy(self, kwargs):
+        """Get policy if policy exists."""
+        policy = self._check_policy_exists(
+            get_value_from_arn(kwargs['PolicyArn']), 'GetPolicy'
+        )
+        return responses.create_policy_response(policy)
+
+    @operation('GetPolicyVersion', locks=('documents', 'policies'))
+    def get_policy_version(self, kwargs):
+        """Get policy version with its document if it exists."""
+        policy = self._check_policy_exists(
+            get_value_from_arn(kwargs['PolicyArn']), 'GetPolicyVersion'
+        )
+        version = self._check_policy_version_exists(policy,
+                                                    kwargs['VersionId'],
+                                                    'GetPolicyVersion')
+
+        document = self.documents[version.document_key].text
+        return responses.policy_version_response(version, document)
+
+    @operation('GetUser', locks=('users',))
     def get_user(self, kwargs):
         """Get user if user exists."""
         self._check_user_exists(kwargs['UserName'], 'GetUser')
 
-        return responses.user_response(kwargs['UserName'])
+        return responses.user_response(self.users[kwargs['UserName']])
 
+    @operation('GetUserPolicy', locks=('documents', 'policies', 'users'))
     def get_user_policy(self, kwargs):
         """Get attached policy for user."""
         self._check_user_exists(kwargs['UserName'], 'GetUserPolicy')
@@ -313,82 +556,181 @@ class MockIAM(object):
         self._check_user_has_policy(policy_name, user, 'GetUserPolicy')
         policy = self._check_policy_exists(policy_name, 'GetUserPolicy')
 
-        return responses.get_user_policy_response(policy, user.username)
+        return responses.get_user_policy_response(
+            policy, user.username, self._policy_document(policy)
+        )
 
+    @operation('ListAccessKeys', locks=('access_keys', 'users'))
     def list_access_keys(self, kwargs):
         """List all of the users access keys if user exists."""
         self._check_user_exists(kwargs['UserName'], 'ListAccessKeys')
 
-        keys = dict((access_key.id, access_key) for key, access_key
-                    in self.access_keys.items()
-                    if access_key.username == kwargs['UserName'])
-        return responses.list_access_keys_response(keys)
+        key_ids, marker = paginate(
+            self.user_access_keys.targets(kwargs['UserName']),
+            kwargs,
+            'ListAccessKeys'
+        )
+        keys = [self.access_keys[key_id] for key_id in key_ids]
+        return responses.list_access_keys_response(keys, marker)
+
+    @operation('ListAttachedGroupPolicies', locks=('groups', 'policies'))
+    def list_attached_group_policies(self, kwargs):
+        """List all of the groups attached policies if group exists."""
+        self._check_group_exists(kwargs['GroupName'],
+                                 'ListAttachedGroupPolicies')
+
+        policy_names, marker = paginate(
+            self.group_policies.targets(kwargs['GroupName']),
+            kwargs,
+            'ListAttachedGroupPolicies'
+        )
+        policies = [self.policies[name] for name in policy_names]
+        return responses.list_attached_group_policies_response(policies,
+                                                               marker)
 
+    @operation('ListAttachedUserPolicies', locks=('policies', 'users'))
     def list_attached_user_policies(self, kwargs):
         """List all of the users attached policies if user exists."""
         self._check_user_exists(kwargs['UserName'], 'ListAttachedUserPolicies')
 
-        policy_names = self.users[kwargs['UserName']].attached_policies
+        policy_names, marker = paginate(
+            self.user_policies.targets(kwargs['UserName']),
+            kwargs,
+            'ListAttachedUserPolicies'
+        )
         policies = [self.policies[name] for name in policy_names]
-        return responses.list_attached_user_policies_response(policies)
+        return responses.list_attached_user_policies_response(policies,
+                                                              marker)
 
+    @operation('ListGroups', locks=('groups',))
     def list_groups(self, kwargs):
         """List all groups"""
-        return responses.list_groups_response(self.groups)
+        groups, marker = paginate(self.groups.values(), kwargs, 'ListGroups')
+        return responses.list_groups_response(groups, marker)
 
+    @operation('ListGroupsForUser', locks=('groups', 'users'))
     def list_groups_for_user(self, kwargs):
         """List all of the users groups if user exists."""
         self._check_user_exists(kwargs['UserName'], 'ListGroupsForUser')
 
-        groups = [self.groups[name] for name in
-                  self.users[kwargs['UserName']].groups]
-        return responses.list_groups_for_user_response(groups)
+        group_names, marker = paginate(
+            self.user_groups.targets(kwargs['UserName']),
+            kwargs,
+            'ListGroupsForUser'
+        )
+        groups = [self.groups[name] for name in group_names]
+        return responses.list_groups_for_user_response(groups, marker)
 
+    @operation('ListMFADevices', locks=('users',))
     def list_mfa_devices(self, kwargs):
         """List all of the users MFA devices if user exists."""
         self._check_user_exists(kwargs['UserName'], 'ListMFADevices')
 
-        devices = self.users[kwargs['UserName']].mfa_devices
-        return responses.list_mfa_devices_response(kwargs['UserName'], devices)
+        devices, marker = paginate(
+            self.users[kwargs['UserName']].mfa_devices.values(),
+            kwargs,
+            'ListMFADevices'
+        )
+        return responses.list_mfa_devices_response(kwargs['UserName'],
+                                                   devices,
+                                                   marker)
+
+    @operation('ListPolicyVersions', locks=('policies',))
+    def list_policy_versions(self, kwargs):
+        """List versions of policy if policy exists."""
+        policy = self._check_policy_exists(
+            get_value_from_arn(kwargs['PolicyArn']), 'ListPolicyVersions'
+        )
+
+        versions, marker = paginate(policy.versions.values(),
+                                    kwargs,
+                                    'ListPolicyVersions')
+        return responses.list_policy_versions_response(versions, marker)
 
+    @operation('ListSigningCertificates', locks=('users',))
     def list_signing_certificates(self, kwargs):
         """List all of the users signing certs if the user exists."""
         self._check_user_exists(kwargs['UserName'], 'ListSigningCertificates')
 
-        certs = self.users[kwargs['UserName']].signing_certs
-        return responses.list_signing_certs_response(kwargs['UserName'], certs)
+        certs, marker = paginate(
+            self.users[kwargs['UserName']].signing_certs.values(),
+            kwargs,
+            'ListSigningCertificates'
+        )
+        return responses.list_signing_certs_response(kwargs['UserName'],
+                                                     certs,
+                                                     marker)
 
+    @operation('ListUsers', locks=('users',))
     def list_users(self, kwargs):
         """List all users."""
-        return responses.list_users_response(self.users)
+        users, marker = paginate(self.users.values(), kwargs, 'ListUsers')
+        return responses.list_users_response(users, marker)
 
+    @operation('RemoveUserFromGroup', locks=('groups', 'users'))
     def remove_user_from_group(self, kwargs):
         """Remove user from group if user exists."""
         self._check_user_exists(kwargs['UserName'], 'RemoveUserFromGroup')
         self._check_group_exists(kwargs['GroupName'], 'RemoveUserFromGroup')
 
-        group = self.groups[kwargs['GroupName']]
-        user = self.users[kwargs['UserName']]
+        self.user_groups.discard(kwargs['UserName'], kwargs['GroupName'])
+        return responses.generic_response()
+
+    @operation('SetDefaultPolicyVersion', locks=('policies',))
+    def set_default_policy_version(self, kwargs):
+        """Set the default version of policy if the version exists."""
+        policy_name = get_value_from_arn(kwargs['PolicyArn'])
+        self._check_policy_exists(policy_name, 'SetDefaultPolicyVersion')
+
+        policy = self.policies.writable(policy_name)
+        self._check_policy_version_exists(policy,
+                                          kwargs['VersionId'],
+                                          'SetDefaultPolicyVersion')
 
-        group.remove_user(kwargs['UserName'])
-        user.remove_group(kwargs['GroupName'])
+        policy.set_default_version(kwargs['VersionId'], self.clock.now())
         return responses.generic_response()
 
+    @operation('SimulateCustomPolicy')
+    def simulate_custom_policy(self, kwargs):
+        """Evaluate actions on resources against the given policies."""
+        policies = [('PolicyInputList.%d' % index, 'none', document)
+                    for index, document
+                    in enumerate(kwargs['PolicyInputList'], 1)]
+        evaluator = self._evaluator(policies, 'SimulateCustomPolicy')
+        return self._simulate(evaluator, kwargs, 'SimulateCustomPolicy')
+
+    @operation('SimulatePrincipalPolicy',
+               locks=('documents', 'groups', 'policies', 'users'))
+    def simulate_principal_policy(self, kwargs):
+        """Evaluate actions on resources for a user or group.
+
+        Extra policies in PolicyInputList are evaluated along with
+        those of the principal.
+        """
+        policies = self._principal_policies(kwargs['PolicySourceArn'],
+                                            'SimulatePrincipalPolicy')
+        policies.extend(('PolicyInputList.%d' % index, 'none', document)
+                        for index, document
+                        in enumerate(kwargs.get('PolicyInputList', ()), 1))
+        evaluator = self._evaluator(policies, 'SimulatePrincipalPolicy')
+        return self._simulate(evaluator, kwargs, 'SimulatePrincipalPolicy')
+
+    @operation('UpdateAccessKey', locks=('access_keys',))
     def update_access_key(self, kwargs):
-        try:
-            access_key = self.access_keys.get(kwargs['AccessKeyId'])
-        except KeyError:
-            self._access_key_not_found(kwargs['AccessKeyId'],
-                                       'UpdateAccessKey')
+        access_key = self._check_access_key_exists(kwargs['AccessKeyId'],
+                                                   'UpdateAccessKey',
+                                                   kwargs.get('UserName'))
 
+        access_key = self.access_keys.writable(access_key.id)
         access_key.status = kwargs['Status']
         return responses.generic_response()
 
+    @operation('UpdateLoginProfile', locks=('users',))
     def update_login_profile(self, kwargs):
         """Update login profile for user."""
         self._check_user_exists(kwargs['UserName'], 'UpdateLoginProfile')
 
-        user = self.users[kwargs['UserName']]
+        user = self.users.writable(kwargs['UserName'])
         self._check_login_profile_exists(user, 'UpdateLoginProfile')
 
         reset_required = kwargs.get('PasswordResetRequired', None)
@@ -397,6 +739,7 @@ class MockIAM(object):
                                   reset_required=reset_required)
         return responses.generic_response()
 
+    @operation('UpdateSigningCertificate', locks=('users',))
     def update_signing_certificate(self, kwargs):
         """Update signing certificate status."""
         self._check_user_exists(kwargs['UserName'], 'UpdateSigningCertificate')
@@ -404,33 +747,102 @@ class MockIAM(object):
                                                kwargs['CertificateId'],
                                                'UpdateSigningCertificate')
 
-        user = self.users[kwargs['UserName']]
+        user = self.users.writable(kwargs['UserName'])
         user.update_signing_certificate(kwargs['CertificateId'],
                                         kwargs['Status'])
         return responses.generic_response()
 
+    @operation('UploadSigningCertificate', locks=('users',))
     def upload_signing_certificate(self, kwargs):
         self._check_user_exists(kwargs['UserName'], 'UploadSigningCertificate')
 
-        user = self.users[kwargs['UserName']]
+        user = self.users.writable(kwargs['UserName'])
         for key, cert in user.signing_certs.items():
             if kwargs['CertificateBody'] == cert.body:
                 raise client_error('UploadSigningCertificate',
                                    'DuplicateCertificate',
                                    'A duplicate certificate already exists.')
 
-        cert = user.upload_signing_certificate(kwargs['CertificateBody'])
+        cert = user.upload_signing_certificate(
+            kwargs['CertificateBody'],
+            self.ids.generate('signing_certificate'),
+            self.clock.now()
+        )
         return responses.upload_signing_certificate_response(
             kwargs['UserName'],
             cert
         )
 
 
-def mock_iam(test):
+def mock_iam(test=None, snapshot=None, trace=None, **options):
+    """Run test with IAM calls routed to a fresh MockIAM.
+
+    Use as @mock_iam or as @mock_iam(snapshot=baseline) to start
+    every run from a copy-on-write view of a frozen baseline. Clients
+    of other services are routed to their registered mocks, if any,
+    or make real calls. With
+    trace=path every call is recorded to that trace file, see
+    mockboto3.core.trace. Other options such as thread_safe=True are
+    passed to MockIAM.
+    """
+    if test is None:
+        return partial(mock_iam, snapshot=snapshot, trace=trace, **options)
+
     @wraps(test)
     def wrapper(*args, **kwargs):
-        mocker = MockIAM()
-        with patch('botocore.client.BaseClient._make_api_call',
-                   new=mocker.mock_make_api_call):
-            test(*args, **kwargs)
+        from unittest.mock import patch
+
+        mocker = MockIAM(**options)
+        if snapshot is not None:
+            mocker.restore(snapshot)
+
+        api_call = mocker.mock_make_api_call
+        if trace is not None:
+            from mockboto3.core.trace import TraceRecorder
+            api_call = TraceRecorder(api_call, trace)
+
+        try:
+            with patch('botocore.client.BaseClient._make_api_call',
+                       new=Router({'iam': api_call})):
+                test(*args, **kwargs)
+        finally:
+            if trace is not None:
+                api_call.close()
+    return wrapper
+
+
+def mock_iam_async(test=None, snapshot=None, latency=None, **options):
+    """Run test with aiobotocore IAM calls routed to a fresh MockIAM.
+
+    Decorates coroutine or plain test functions. Calls are awaited
+    after the simulated latency, see AsyncAPICall. Other arguments
+    are the same as for mock_iam.
+    """
+    if test is None:
+        return partial(mock_iam_async, snapshot=snapshot,
+                       latency=latency, **options)
+
+    import asyncio
+    from unittest.mock import patch
+
+    from mockboto3.core.aio import AsyncAPICall
+
+    def api_call():
+        mocker = MockIAM(**options)
+        if snapshot is not None:
+            mocker.restore(snapshot)
+
+        return patch('aiobotocore.client.AioBaseClient._make_api_call',
+                     new=AsyncAPICall(mocker, latency))
+
+    if asyncio.iscoroutinefunction(test):
+        @wraps(test)
+        async def wrapper(*args, **kwargs):
+            with api_call():
+                return await test(*args, **kwargs)
+    else:
+        @wraps(test)
+        def wrapper(*args, **kwargs):
+            with api_call():
+                return test(*args, **kwargs)
     return wrapper
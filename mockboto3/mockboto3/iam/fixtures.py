@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+
+""""Bulk loading of IAM accounts from declarative fixtures.
+
+A fixture is a dict (or a JSON/YAML file) such as:
+
+    policies:
+      - name: Admins
+        document: {"Version": "2012-10-17", "Statement": [...]}
+    groups:
+      - name: Admins
+        policies: [Admins]
+    users:
+      - name: John
+        groups: [Admins]
+        policies: [Admins]
+        access_keys: 2
+        login_profile: {password: secret}
+        mfa_devices: ['44324234213']
+      - Jane
+
+Entities are written straight into the stores and relations of the
+mock, references are validated once up front and no responses are
+built.
+"""
+
+import gc
+import json
+
+from collections import Counter
+from contextlib import contextmanager
+
+from mockboto3.iam.models import AccessKey, Group, Policy, User
+
+
+@contextmanager
+def _paused_gc():
+    """Pause the cyclic garbage collector.
+
+    Loading allocates hundreds of thousands of long lived objects,
+    each of which would otherwise trigger collections rescanning the
+    ones loaded so far.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _entries(fixture, kind):
+    """Return entries of kind as dicts, bare strings are names."""
+    entries = fixture.get(kind) or ()
+    if not isinstance(entries, (list, tuple)):
+        raise ValueError('Invalid fixture: %s is not a list.' % kind)
+    return [{'name': entry} if isinstance(entry, str) else entry
+            for entry in entries]
+
+
+def _validate_shapes(groups, policies, users):
+    """Return a list of problems with the shape of the entries."""
+    errors = []
+    for kind, entries in (('group', groups), ('policy', policies),
+                          ('user', users)):
+        for entry in entries:
+            if not isinstance(entry, dict) or \
+                    not isinstance(entry.get('name'), str):
+                errors.append('%s %r is not a name or a mapping with a '
+                              'name' % (kind, entry))
+
+    for entry in policies:
+        if isinstance(entry, dict) and not entry.get('document'):
+            errors.append('policy %s has no document' % entry.get('name'))
+
+    for entry in users:
+        if not isinstance(entry, dict):
+            continue
+
+        keys = entry.get('access_keys', ())
+        if not isinstance(keys, (int, list, tuple)) or \
+                isinstance(keys, (list, tuple)) and \
+                not all(isinstance(key, dict) for key in keys):
+            errors.append('user %s access_keys is not a count or a list '
+                          'of mappings' % entry.get('name'))
+
+        profile = entry.get('login_profile')
+        if profile and (not isinstance(profile, dict) or
+                        'password' not in profile):
+            errors.append('user %s login_profile has no password'
+                          % entry.get('name'))
+    return errors
+
+
+def _validate(mocker, groups, policies, users):
+    """Return a list of problems with the fixture references."""
+    errors = _validate_shapes(groups, policies, users)
+    if errors:
+        return errors
+
+    key_ids = set()
+    for entry in users:
+        keys = entry.get('access_keys', ())
+        for key in keys if isinstance(keys, (list, tuple)) else ():
+            key_id = key.get('id')
+            if key_id is None:
+                continue
+            if key_id in key_ids or key_id in mocker.access_keys:
+                errors.append('access key %s already exists' % key_id)
+            key_ids.add(key_id)
+
+    for kind, entries, store in (('group', groups, mocker.groups),
+                                 ('policy', policies, mocker.policies),
+                                 ('user', users, mocker.users)):
+        seen = set()
+        for entry in entries:
+            if entry['name'] in seen or entry['name'] in store:
+                errors.append('%s %s already exists' % (kind, entry['name']))
+            seen.add(entry['name'])
+
+    group_names = set(entry['name'] for entry in groups)
+    policy_names = set(entry['name'] for entry in policies)
+    for kind, entries in (('group', groups), ('user', users)):
+        for entry in entries:
+            for name in entry.get('groups', ()):
+                if name not in group_names and name not in mocker.groups:
+                    errors.append('%s %s references unknown group %s'
+                                  % (kind, entry['name'], name))
+            for name in entry.get('policies', ()):
+                if name not in policy_names and name not in mocker.policies:
+                    errors.append('%s %s references unknown policy %s'
+                                  % (kind, entry['name'], name))
+    return errors
+
+
+def load_fixture(mocker, fixture):
+    """Load users, groups, policies, keys and memberships into mocker.
+
+    Raise ValueError without changing the mock if the fixture is
+    malformed, has duplicate names or access key ids or references
+    unknown groups or policies.
+    """
+    if not isinstance(fixture, dict):
+        raise ValueError('Invalid fixture: not a mapping.')
+
+    groups = _entries(fixture, 'groups')
+    policies = _entries(fixture, 'policies')
+    users = _entries(fixture, 'users')
+
+    errors = _validate(mocker, groups, policies, users)
+    if errors:
+        raise ValueError('Invalid fixture: %s.' % '; '.join(errors))
+
+    with _paused_gc():
+        _load(mocker, groups, policies, users)
+
+
+def _load(mocker, groups, policies, users):
+    """Write the validated entries into the stores and relations."""
+    ids = mocker.ids
+    # One timestamp for the whole fixture, as if created at once
+    now = mocker.clock.now()
+
+    for entry in policies:
+        document = entry['document']
+        if not isinstance(document, str):
+            document = json.dumps(document)
+
+        mocker.policies[entry['name']] = Policy(
+            entry['name'],
+            entry.get('id') or ids.generate('policy'),
+            mocker.add_document(document),
+            entry.get('description'),
+            entry.get('path', '/'),
+            now
+        )
+
+    attach = []
+    for entry in groups:
+        mocker.groups[entry['name']] = Group(
+            entry['name'],
+            entry.get('id') or ids.generate('group'),
+            entry.get('path', '/'),
+            now
+        )
+        for policy in entry.get('policies', ()):
+            attach.append((mocker.group_policies, entry['name'], policy))
+
+    # Locals for the attributes used once per user
+    access_keys = mocker.access_keys
+    add_access_key = mocker.user_access_keys.add
+    add_group = mocker.user_groups.add
+    generate = ids.generate
+    user_policies = mocker.user_policies
+    users_store = mocker.users
+
+    for entry in users:
+        name = entry['name']
+        user = users_store[name] = User(
+            name,
+            entry.get('id') or generate('user'),
+            now
+        )
+
+        for group in entry.get('groups', ()):
+            add_group(name, group)
+        for policy in entry.get('policies', ()):
+            attach.append((user_policies, name, policy))
+
+        keys = entry.get('access_keys', ())
+        if isinstance(keys, int):
+            keys = [{}] * keys
+        for key in keys:
+            access_key = AccessKey(name,
+                                   key.get('id') or generate('access_key'),
+                                   key.get('secret') or ids.secret(),
+                                   now)
+            access_key.status = key.get('status', access_key.status)
+            access_keys[access_key.id] = access_key
+            add_access_key(name, access_key.id)
+
+        profile = entry.get('login_profile')
+        if profile:
+            user.create_login_profile(profile['password'],
+                                      profile.get('reset_required', False),
+                                      now)
+
+        for serial_number in entry.get('mfa_devices', ()):
+            user.enable_mfa_device(serial_number, now)
+
+    # Policies are shared by many entities, count then write each once
+    attachments = Counter()
+    for relation, source, policy in attach:
+        if relation.add(source, policy):
+            attachments[policy] += 1
+
+    for policy, count in attachments.items():
+        mocker.policies.writable(policy).attachment_count += count
+
+
+def read_fixture(path):
+    """Read a fixture from a JSON or YAML file.
+
+    YAML requires PyYAML to be installed.
+    """
+    with open(path) as fixture_file:
+        if path.endswith(('.yaml', '.yml')):
+            import yaml
+            return yaml.safe_load(fixture_file)
+
+        return json.load(fixture_file)
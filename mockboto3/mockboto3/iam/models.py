@@ -1,145 +1,179 @@
 # -*- coding: utf-8 -*-
 
-""""IAM Classes."""
+""""IAM Classes.
 
-from datetime import datetime, timezone
+Timestamps are given as now by the clock of the mock, they default
+to the current time for entities created on their own.
+"""
 
-from mockboto3.core.utils import get_random_string
+from types import MappingProxyType
+
+from mockboto3.core.clock import utc_now
 from mockboto3.iam.utils import get_arn
 
+# Shared read-only stand in for collections not created yet
+EMPTY = MappingProxyType({})
+
 
 class AccessKey(object):
     """Access Key class used for mocking AWS backend"""
 
-    def __init__(self, user_name):
+    __slots__ = ('id', 'create_date', 'key', 'status', 'username',
+                 '_last_used')
+
+    def __init__(self, user_name, key_id, secret, now=None):
         super(AccessKey, self).__init__()
-        self.id = get_random_string(length=20)
-        self.create_date = datetime.now(timezone.utc)
-        self.key = get_random_string(length=40)
-        self.last_used = AccessKeyLastUsed()
+        self.id = key_id
+        self.create_date = now or utc_now()
+        self.key = secret
         self.status = "Active"
         self.username = user_name
+        self._last_used = None
+
+    @property
+    def last_used(self):
+        """Usage record, created the first time it is read.
+
+        Keys are never used against the mock, the record dates from
+        the creation of the key.
+        """
+        if self._last_used is None:
+            self._last_used = AccessKeyLastUsed(self.create_date)
+        return self._last_used
 
 
 class AccessKeyLastUsed(object):
     """Access Key Last Used for tracking how and when a key was used."""
 
-    def __init__(self):
+    __slots__ = ('date', 'region', 'service_name')
+
+    def __init__(self, now=None):
         super(AccessKeyLastUsed, self).__init__()
-        self.date = datetime.now(timezone.utc)
+        self.date = now or utc_now()
         self.region = 'us-west-1'
         self.service_name = 'iam'
 
 
+class Document(object):
+    """Policy document shared by every version with the same text.
+
+    Stored once under its key, the sha256 digest of the text, and
+    counting the policy versions referencing it.
+    """
+
+    __slots__ = ('key', 'references', 'text')
+
+    def __init__(self, key, text):
+        super(Document, self).__init__()
+        self.key = key
+        self.references = 0
+        self.text = text
+
+
 class Group(object):
     """Group class used for mocking AWS backend group objects"""
 
-    def __init__(self, name, path="/"):
+    __slots__ = ('id', 'create_date', 'name', 'path')
+
+    def __init__(self, name, group_id, path="/", now=None):
         super(Group, self).__init__()
-        self.id = get_random_string(length=10)
-        self.attached_policies = []
-        self.create_date = datetime.now(timezone.utc)
+        self.id = group_id
+        self.create_date = now or utc_now()
         self.name = name
         self.path = path
-        self.users = []
-
-    def add_user(self, user):
-        self.users.append(user)
 
     @property
     def arn(self):
         return get_arn("group", self.name)
 
-    def attach_policy(self, policy):
-        self.attached_policies.append(policy)
-
-    def detach_policy(self, policy):
-        self.attached_policies.remove(policy)
-
-    def remove_user(self, user):
-        self.users.remove(user)
-
 
 class LoginProfile(object):
     """Login profile (password) for AWS User."""
 
-    def __init__(self, password, reset_required=False):
+    __slots__ = ('password', 'create_date', 'reset_required')
+
+    def __init__(self, password, reset_required=False, now=None):
         super(LoginProfile, self).__init__()
         self.password = password
-        self.create_date = datetime.now(timezone.utc)
+        self.create_date = now or utc_now()
         self.reset_required = reset_required
 
 
 class MFADevice(object):
     """MFA Device class."""
 
-    def __init__(self, serial_number):
+    __slots__ = ('enable_date', 'serial_number')
+
+    def __init__(self, serial_number, now=None):
         super(MFADevice, self).__init__()
-        self.enable_date = datetime.now(timezone.utc)
+        self.enable_date = now or utc_now()
         self.serial_number = serial_number
 
 
 class Policy(object):
-    """Policy documents."""
+    """Policy with its versions.
+
+    Versions are keyed by version id and hold the key of their
+    document in the documents store, not the text.
+    """
 
-    def __init__(self, name, document, description="", path="/"):
+    __slots__ = ('id', 'attachment_count', 'create_date',
+                 'default_version_id', 'description', 'is_attachable',
+                 'name', 'next_version', 'path', 'update_date', 'versions')
+
+    def __init__(self, name, policy_id, document_key, description="",
+                 path="/", now=None):
         super(Policy, self).__init__()
-        self.id = get_random_string(length=16)
+        self.id = policy_id
         self.attachment_count = 0
-        self.create_date = datetime.now(timezone.utc)
+        self.create_date = now or utc_now()
         self.default_version_id = "v1"
         self.description = description
-        self.groups = []
         self.is_attachable = True
         self.name = name
+        self.next_version = 1
         self.path = path
         self.update_date = self.create_date
-        self.users = []
-        self.versions = []
+        self.versions = {}
 
         # Create initial version of policy (v1)
-        self.create_new_version(document)
+        self.create_new_version(document_key, self.create_date)
 
     @property
     def arn(self):
         return get_arn("policy", self.name)
 
-    def attach_group(self, group):
-        self.groups.append(group)
-        self.attachment_count += 1
-
-    def attach_user(self, user):
-        self.users.append(user)
-        self.attachment_count += 1
-
-    def create_new_version(self, document):
-        self.versions.append(
-            PolicyVersion(document, len(self.versions) + 1)
-        )
-
-    def detach_group(self, group):
-        self.groups.remove(group)
-        self.attachment_count -= 1
-
-    def detach_user(self, user):
-        self.users.remove(user)
-        self.attachment_count -= 1
+    def create_new_version(self, document_key, create_date=None):
+        """Add a version, ids are never reused once deleted."""
+        version = PolicyVersion(document_key, self.next_version, create_date)
+        self.versions[version.version] = version
+        self.next_version += 1
+        return version
 
     @property
-    def document(self):
-        return self.versions[self.default_version_id[1] - 1].document
+    def default_version(self):
+        return self.versions[self.default_version_id]
+
+    def delete_version(self, version_id):
+        return self.versions.pop(version_id)
 
-    def set_default_version(self, version_id):
+    def set_default_version(self, version_id, now=None):
+        self.default_version.is_default_version = False
+        self.versions[version_id].is_default_version = True
         self.default_version_id = version_id
+        self.update_date = now or utc_now()
 
 
 class PolicyVersion(object):
     """Versions of a policy object."""
 
-    def __init__(self, document, version):
+    __slots__ = ('create_date', 'document_key', 'is_default_version',
+                 'version_number')
+
+    def __init__(self, document_key, version, create_date=None):
         super(PolicyVersion, self).__init__()
-        self.create_date = datetime.now(timezone.utc)
-        self.document = document
+        self.create_date = create_date or utc_now()
+        self.document_key = document_key
         self.is_default_version = True if version == 1 else False
         self.version_number = version
 
@@ -151,55 +185,61 @@ class PolicyVersion(object):
 class SigningCertificate(object):
     """Signing certificate class."""
 
-    def __init__(self, body):
+    __slots__ = ('id', 'body', 'status', 'upload_date')
+
+    def __init__(self, cert_id, body, now=None):
         super(SigningCertificate, self).__init__()
-        self.id = get_random_string(length=24)
+        self.id = cert_id
         self.body = body
         self.status = 'Active'
-        self.upload_date = datetime.now(timezone.utc)
+        self.upload_date = now or utc_now()
 
 
 class User(object):
-    """User class used for mocking AWS backend user objects."""
+    """User class used for mocking AWS backend user objects.
+
+    MFA devices and signing certificates are rarely used, their dicts
+    are only created when the first one is added.
+    """
+
+    __slots__ = ('id', 'create_date', 'login_profile', 'password_last_used',
+                 'username', '_mfa_devices', '_signing_certs')
 
-    def __init__(self, user_name):
+    def __init__(self, user_name, user_id, now=None):
         super(User, self).__init__()
-        self.id = get_random_string(length=10)
-        self.attached_policies = []
-        self.create_date = datetime.now(timezone.utc)
-        self.groups = []
+        self.id = user_id
+        self.create_date = now or utc_now()
         self.login_profile = None
-        self.mfa_devices = {}
         self.password_last_used = None
-        self.signing_certs = {}
         self.username = user_name
+        self._mfa_devices = None
+        self._signing_certs = None
 
-    def add_group(self, group):
-        self.groups.append(group)
+    @property
+    def mfa_devices(self):
+        return self._mfa_devices or EMPTY
 
-    def attach_policy(self, policy):
-        self.attached_policies.append(policy)
+    @property
+    def signing_certs(self):
+        return self._signing_certs or EMPTY
 
-    def create_login_profile(self, password, reset_required=False):
-        self.login_profile = LoginProfile(password, reset_required)
+    def create_login_profile(self, password, reset_required=False,
+                             now=None):
+        self.login_profile = LoginProfile(password, reset_required, now)
 
     def deactivate_mfa_device(self, serial_number):
-        self.mfa_devices.pop(serial_number)
+        self._mfa_devices.pop(serial_number)
 
     def delete_login_profile(self):
         self.login_profile = None
 
     def delete_signing_certificate(self, cert_id):
-        self.signing_certs.pop(cert_id)
-
-    def detach_policy(self, policy):
-        self.attached_policies.remove(policy)
-
-    def enable_mfa_device(self, serial_number):
-        self.mfa_devices[serial_number] = MFADevice(serial_number)
+        self._signing_certs.pop(cert_id)
 
-    def remove_group(self, group):
-        self.groups.remove(group)
+    def enable_mfa_device(self, serial_number, now=None):
+        if self._mfa_devices is None:
+            self._mfa_devices = {}
+        self._mfa_devices[serial_number] = MFADevice(serial_number, now)
 
     def update_login_profile(self, password=None, reset_required=None):
         if password:
@@ -210,7 +250,9 @@ class User(object):
     def update_signing_certificate(self, cert_id, status):
         self.signing_certs.get(cert_id).status = status
 
-    def upload_signing_certificate(self, body):
-        certificate = SigningCertificate(body)
-        self.signing_certs[certificate.id] = certificate
+    def upload_signing_certificate(self, body, cert_id, now=None):
+        certificate = SigningCertificate(cert_id, body, now)
+        if self._signing_certs is None:
+            self._signing_certs = {}
+        self._signing_certs[certificate.id] = certificate
         return certificate
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+
+""""Evaluation of IAM policy documents.
+
+Documents are parsed once and compiled into statements whose Action
+and Resource patterns are matchers: exact names are looked up in a
+set, wildcard patterns (* and ?) are joined into one regular
+expression. Compiled policies are cached by document, so every
+version of every policy sharing a document is compiled once.
+
+    evaluator = PolicyEvaluator([('Admins', 'user-managed', document)])
+    evaluator.evaluate('iam:GetUser', 'arn:aws:iam::123456789012:user/J')
+
+Decisions follow IAM: an explicit deny wins over an allow, without
+a matching allow access is implicitly denied. Statements with a
+Condition are not evaluated as no context is available, they never
+match.
+"""
+
+import json
+import re
+
+from functools import lru_cache
+
+ALLOWED = 'allowed'
+EXPLICIT_DENY = 'explicitDeny'
+IMPLICIT_DENY = 'implicitDeny'
+
+
+class Matcher(object):
+    """Match names against a list of IAM wildcard patterns."""
+
+    __slots__ = ('any', 'exact', 'ignore_case', 'regex')
+
+    def __init__(self, patterns, ignore_case=False):
+        super(Matcher, self).__init__()
+        self.any = '*' in patterns
+        self.ignore_case = ignore_case
+
+        if ignore_case:
+            patterns = [pattern.lower() for pattern in patterns]
+
+        self.exact = frozenset(pattern for pattern in patterns
+                               if '*' not in pattern and '?' not in pattern)
+        wildcards = [re.escape(pattern).replace(r'\*', '.*')
+                     .replace(r'\?', '.')
+                     for pattern in patterns if pattern not in self.exact]
+        self.regex = None
+        if wildcards and not self.any:
+            self.regex = re.compile('(?:%s)' % '|'.join(wildcards),
+                                    re.DOTALL).fullmatch
+
+    def __call__(self, name):
+        """Return True if name matches one of the patterns.
+
+        Names of a matcher ignoring case must be given lower case.
+        """
+        if self.any or name in self.exact:
+            return True
+        return self.regex is not None and self.regex(name) is not None
+
+
+class Statement(object):
+    """Compiled policy statement."""
+
+    __slots__ = ('actions', 'allow', 'index', 'not_actions',
+                 'not_resources', 'resources')
+
+    def __init__(self, statement, index):
+        super(Statement, self).__init__()
+        self.allow = statement.get('Effect') == 'Allow'
+        self.index = index
+        self.actions = self._matcher(statement, 'Action', True)
+        self.not_actions = self._matcher(statement, 'NotAction', True)
+        self.resources = self._matcher(statement, 'Resource')
+        self.not_resources = self._matcher(statement, 'NotResource')
+
+        if statement.get('Effect') not in ('Allow', 'Deny') or \
+                (self.actions is None) == (self.not_actions is None):
+            raise ValueError('Statement %d needs an Effect and one of '
+                             'Action or NotAction.' % index)
+
+    @staticmethod
+    def _matcher(statement, key, ignore_case=False):
+        patterns = statement.get(key)
+        if patterns is None:
+            return None
+        if isinstance(patterns, str):
+            patterns = [patterns]
+        if not isinstance(patterns, list) or \
+                not all(isinstance(pattern, str) for pattern in patterns):
+            raise ValueError('%s must be a string or a list of strings.'
+                             % key)
+        return Matcher(patterns, ignore_case)
+
+    def matches(self, action, resource):
+        """Return True if the statement applies, action lower case."""
+        if self.actions is not None and not self.actions(action) or \
+                self.not_actions is not None and self.not_actions(action):
+            return False
+
+        if self.resources is not None:
+            return self.resources(resource)
+        if self.not_resources is not None:
+            return not self.not_resources(resource)
+        return True
+
+
+class CompiledPolicy(object):
+    """Allow and deny statements of a policy document."""
+
+    __slots__ = ('allow', 'deny')
+
+    def __init__(self, document):
+        super(CompiledPolicy, self).__init__()
+        try:
+            parsed = json.loads(document)
+            statements = parsed['Statement']
+        except (KeyError, TypeError, ValueError):
+            raise ValueError('Policy document is not a JSON object with '
+                             'a Statement.')
+
+        if isinstance(statements, dict):
+            statements = [statements]
+        if not isinstance(statements, list):
+            raise ValueError('Statement must be an object or a list.')
+
+        self.allow = []
+        self.deny = []
+        for index, statement in enumerate(statements):
+            if not isinstance(statement, dict):
+                raise ValueError('Statement %d is not an object.' % index)
+            if 'Condition' in statement:
+                continue
+
+            compiled = Statement(statement, index)
+            if compiled.allow:
+                self.allow.append(compiled)
+            else:
+                self.deny.append(compiled)
+
+
+@lru_cache(maxsize=4096)
+def compile_policy(document):
+    """Return the CompiledPolicy of a document string, cached.
+
+    Raise ValueError if the document is malformed.
+    """
+    return CompiledPolicy(document)
+
+
+class PolicyEvaluator(object):
+    """Decide access for the combined policies of a principal.
+
+    policies is a list of (source id, source type, document), the
+    source is reported in the matched statements of a decision.
+    """
+
+    def __init__(self, policies):
+        super(PolicyEvaluator, self).__init__()
+        self.allow = []
+        self.deny = []
+        for source_id, source_type, document in policies:
+            compiled = compile_policy(document)
+            self.allow.extend((source_id, source_type, statement)
+                              for statement in compiled.allow)
+            self.deny.extend((source_id, source_type, statement)
+                             for statement in compiled.deny)
+
+    def evaluate(self, action, resource):
+        """Return the decision and the statements deciding it."""
+        action = action.lower()
+        denied = [(source_id, source_type, statement.index)
+                  for source_id, source_type, statement in self.deny
+                  if statement.matches(action, resource)]
+        if denied:
+            return EXPLICIT_DENY, denied
+
+        allowed = [(source_id, source_type, statement.index)
+                   for source_id, source_type, statement in self.allow
+                   if statement.matches(action, resource)]
+        if allowed:
+            return ALLOWED, allowed
+        return IMPLICIT_DENY, []
+
+    def is_allowed(self, action, resource):
+        """Return True if the action is allowed on resource.
+
+        Faster than evaluate as it stops at the first match.
+        """
+        action = action.lower()
+        for source_id, source_type, statement in self.deny:
+            if statement.matches(action, resource):
+                return False
+        for source_id, source_type, statement in self.allow:
+            if statement.matches(action, resource):
+                return True
+        return False
+
+    def evaluate_many(self, pairs):
+        """Yield whether each (action, resource) pair is allowed."""
+        is_allowed = self.is_allowed
+        for action, resource in pairs:
+            yield is_allowed(action, resource)
+
+
+class Simulation(object):
+    """Decisions of every action on every resource, made on demand.
+
+    Sized and sliceable so a page of a large simulation only
+    evaluates the pairs it returns.
+    """
+
+    def __init__(self, evaluator, actions, resources):
+        super(Simulation, self).__init__()
+        self.actions = actions
+        self.evaluator = evaluator
+        self.resources = resources
+
+    def __len__(self):
+        return len(self.actions) * len(self.resources)
+
+    def slice(self, start, stop):
+        """Return (action, resource, decision, matched) of a range."""
+        results = []
+        count = len(self.resources)
+        for position in range(start, min(stop, len(self))):
+            action = self.actions[position // count]
+            resource = self.resources[position % count]
+            decision, matched = self.evaluator.evaluate(action, resource)
+            results.append((action, resource, decision, matched))
+        return results
@@ -2,38 +2,54 @@
 
 """"Mocked responses for AWS endpoints."""
 
-from datetime import datetime, timezone
+import time
 
+from mockboto3.core.clock import http_date
 
-def get_time_now():
-    """Return the time as a datetime object and string."""
-    now = datetime.now(timezone.utc)
-    now_str = now.strftime('%a, %d %b %Y %H:%M:%S GMT')
-    return now, now_str
+REQUEST_ID = '2614a68d-ada7-11e6-8c37-b3baab09bf37'
 
+# Envelope template shared by every response, copied per call
+HTTP_HEADERS = {
+    'content-length': '450',
+    'content-type': 'text/xml',
+    'x-amzn-requestid': REQUEST_ID
+}
+METADATA = {
+    'RequestId': REQUEST_ID,
+    'HTTPStatusCode': 200,
+    'RetryAttempts': 0
+}
 
-def response_metadata(now_str):
+# (second, formatted date header) of the last response
+_http_date = (None, None)
+
+
+def get_http_date():
+    """Return the date header, formatted at most once per second."""
+    global _http_date
+
+    second = int(time.time())
+    if _http_date[0] != second:
+        _http_date = (second, http_date(second))
+    return _http_date[1]
+
+
+def response_metadata():
     """Return the default metadata response."""
-    metadata = {
-        'ResponseMetadata':
-            {'RequestId': '2614a68d-ada7-11e6-8c37-b3baab09bf37',
-             'HTTPStatusCode': 200,
-             'RetryAttempts': 0,
-             'HTTPHeaders':
-                 {'content-length': '450',
-                  'content-type': 'text/xml',
-                  'date': now_str,
-                  'x-amzn-requestid': '2614a68d-ada7-11e6-8c37-b3baab09bf37'
-                  }
-             }
-    }
-    return metadata
+    headers = dict(HTTP_HEADERS, date=get_http_date())
+    return {'ResponseMetadata': dict(METADATA, HTTPHeaders=headers)}
+
+
+def set_truncated(parsed_response, marker):
+    """Set the pagination fields of a list response."""
+    parsed_response['IsTruncated'] = marker is not None
+    if marker is not None:
+        parsed_response['Marker'] = marker
 
 
 def access_key_response(access_key):
     """Response for create/get access key."""
-    now, now_str = get_time_now()
-    parsed_response = response_metadata(now_str)
+    parsed_response = response_metadata()
     parsed_response['AccessKey'] = {
         'Status': access_key.status,
         'AccessKeyId': access_key.id,
@@ -45,8 +61,7 @@ def access_key_response(access_key):
 
 def access_key_last_used_response(access_key):
     """Response for create/get access key."""
-    now, now_str = get_time_now()
-    parsed_response = response_metadata(now_str)
+    parsed_response = response_metadata()
     parsed_response['AccessKeyLastUsed'] = {
         'Region': access_key.last_used.region,
         'LastUsedDate': access_key.last_used.date,
@@ -57,9 +72,8 @@ def access_key_last_used_response(access_key):
 
 
 def create_policy_response(policy):
-    """Response for create policy."""
-    now, now_str = get_time_now()
-    parsed_response = response_metadata(now_str)
+    """Response for create/get policy."""
+    parsed_response = response_metadata()
     parsed_response['Policy'] = {
         'PolicyName': policy.name,
         'DefaultVersionId': policy.default_version_id,
@@ -75,25 +89,21 @@ def create_policy_response(policy):
 
 def generic_response():
     """Generic response for deletion endpoints."""
-    now, now_str = get_time_now()
-    parsed_response = response_metadata(now_str)
-    return parsed_response
+    return response_metadata()
 
 
-def get_user_policy_response(policy, username):
+def get_user_policy_response(policy, username, document):
     """Response for get attached policy for user endpoint."""
-    now, now_str = get_time_now()
-    parsed_response = response_metadata(now_str)
+    parsed_response = response_metadata()
     parsed_response['UserName'] = username
     parsed_response['PolicyName'] = policy.name
-    parsed_response['PolicyDocument'] = policy.document
+    parsed_response['PolicyDocument'] = document
     return parsed_response
 
 
 def group_response(group):
     """Response for create/get group."""
-    now, now_str = get_time_now()
-    parsed_response = response_metadata(now_str)
+    parsed_response = response_metadata()
     parsed_response['Group'] = {
         'GroupId': group.id,
         'GroupName': group.name,
@@ -103,24 +113,34 @@ def group_response(group):
     return parsed_response
 
 
-def list_access_keys_response(keys):
+def list_access_keys_response(keys, marker=None):
     """Response for list user access keys endpoint."""
-    now, now_str = get_time_now()
-    parsed_response = response_metadata(now_str)
-    parsed_response['IsTruncated'] = False
+    parsed_response = response_metadata()
+    set_truncated(parsed_response, marker)
     keys_response = [{'Status': access_key.status,
                       'AccessKeyId': access_key.id,
                       'UserName': access_key.username
-                      } for key, access_key in keys.items()]
+                      } for access_key in keys]
     parsed_response['AccessKeyMetadata'] = keys_response
     return parsed_response
 
 
-def list_attached_user_policies_response(policies):
+def list_attached_group_policies_response(policies, marker=None):
+    """Response for list group attached policies endpoint."""
+    parsed_response = response_metadata()
+    set_truncated(parsed_response, marker)
+    policies_response = [
+        {'PolicyArn': policy.arn,
+         'PolicyName': policy.name
+         } for policy in policies]
+    parsed_response['AttachedPolicies'] = policies_response
+    return parsed_response
+
+
+def list_attached_user_policies_response(policies, marker=None):
     """Response for list user attached policies endpoint."""
-    now, now_str = get_time_now()
-    parsed_response = response_metadata(now_str)
-    parsed_response['IsTruncated'] = False
+    parsed_response = response_metadata()
+    set_truncated(parsed_response, marker)
     policies_response = [
         {'PolicyArn': policy.arn,
          'PolicyName': policy.name
@@ -129,26 +149,24 @@ def list_attached_user_policies_response(policies):
     return parsed_response
 
 
-def list_groups_response(groups):
+def list_groups_response(groups, marker=None):
     """Response for list groups"""
-    now, now_str = get_time_now()
-    parsed_response = response_metadata(now_str)
-    parsed_response['IsTruncated'] = False
+    parsed_response = response_metadata()
+    set_truncated(parsed_response, marker)
     groups_response = [{
         'GroupId': group.id,
         'GroupName': group.name,
         'Arn': 'arn:aws:iam::123456789123:group/openbare/%s' % group.name,
         'Path': '/openbare/',
-    } for key, group in groups.items()]
+    } for group in groups]
     parsed_response['Groups'] = groups_response
     return parsed_response
 
 
-def list_groups_for_user_response(groups):
+def list_groups_for_user_response(groups, marker=None):
     """Response for list user groups."""
-    now, now_str = get_time_now()
-    parsed_response = response_metadata(now_str)
-    parsed_response['IsTruncated'] = False
+    parsed_response = response_metadata()
+    set_truncated(parsed_response, marker)
     groups_response = [{'Path': '/openbare/',
                         'Arn': 'arn:aws:iam::123456789012:group/%s' % group.id,
                         'GroupName': group.name,
@@ -157,39 +175,48 @@ def list_groups_for_user_response(groups):
     return parsed_response
 
 
-def list_mfa_devices_response(username, devices):
+def list_mfa_devices_response(username, devices, marker=None):
     """Response for list user MFA Devices endpoint."""
-    now, now_str = get_time_now()
-    parsed_response = response_metadata(now_str)
-    parsed_response['IsTruncated'] = False
+    parsed_response = response_metadata()
+    set_truncated(parsed_response, marker)
     devices_response = [
         {'SerialNumber': device.serial_number,
          'UserName': username
-         } for key, device in devices.items()]
+         } for device in devices]
     parsed_response['MFADevices'] = devices_response
     return parsed_response
 
 
-def list_signing_certs_response(username, certs):
+def list_policy_versions_response(versions, marker=None):
+    """Response for list policy versions."""
+    parsed_response = response_metadata()
+    set_truncated(parsed_response, marker)
+    parsed_response['Versions'] = [{
+        'VersionId': version.version,
+        'IsDefaultVersion': version.is_default_version,
+        'CreateDate': version.create_date
+    } for version in versions]
+    return parsed_response
+
+
+def list_signing_certs_response(username, certs, marker=None):
     """Response for list user signing certificates."""
-    now, now_str = get_time_now()
-    parsed_response = response_metadata(now_str)
-    parsed_response['IsTruncated'] = False
+    parsed_response = response_metadata()
+    set_truncated(parsed_response, marker)
     certs_response = [
         {'UserName': username,
          'CertificateId': cert.id,
          'CertificateBody': cert.body,
          'Status': cert.status
-         } for key, cert in certs.items()]
+         } for cert in certs]
     parsed_response['Certificates'] = certs_response
     return parsed_response
 
 
-def list_users_response(users):
+def list_users_response(users, marker=None):
     """Response for list users"""
-    now, now_str = get_time_now()
-    parsed_response = response_metadata(now_str)
-    parsed_response['IsTruncated'] = False
+    parsed_response = response_metadata()
+    set_truncated(parsed_response, marker)
     users_response = [{
         'UserId': user.id,
         'CreateDate': user.create_date,
@@ -197,15 +224,14 @@ def list_users_response(users):
         'Arn': 'arn:aws:iam::123456789123:user/openbare/%s' % user.username,
         'Path': '/openbare/',
         'PasswordLastUsed': user.password_last_used
-    } for key, user in users.items()]
+    } for user in users]
     parsed_response['Users'] = users_response
     return parsed_response
 
 
 def login_profile_response(user, create=False):
     """Response for list user login profiles."""
-    now, now_str = get_time_now()
-    parsed_response = response_metadata(now_str)
+    parsed_response = response_metadata()
     parsed_response['LoginProfile'] = {
         'CreateDate': user.login_profile.create_date,
         'UserName': user.username
@@ -217,10 +243,43 @@ def login_profile_response(user, create=False):
     return parsed_response
 
 
+def policy_version_response(version, document=None):
+    """Response for create/get policy version.
+
+    The document is only returned by get policy version.
+    """
+    parsed_response = response_metadata()
+    parsed_response['PolicyVersion'] = {
+        'VersionId': version.version,
+        'IsDefaultVersion': version.is_default_version,
+        'CreateDate': version.create_date
+    }
+
+    if document is not None:
+        parsed_response['PolicyVersion']['Document'] = document
+    return parsed_response
+
+
+def simulate_policy_response(results, marker=None):
+    """Response for simulate custom/principal policy."""
+    parsed_response = response_metadata()
+    set_truncated(parsed_response, marker)
+    parsed_response['EvaluationResults'] = [{
+        'EvalActionName': action,
+        'EvalResourceName': resource,
+        'EvalDecision': decision,
+        'MatchedStatements': [
+            {'SourcePolicyId': source_id, 'SourcePolicyType': source_type}
+            for source_id, source_type, index in matched
+        ],
+        'MissingContextValues': []
+    } for action, resource, decision, matched in results]
+    return parsed_response
+
+
 def upload_signing_certificate_response(username, cert):
     """Response for upload signing certificate."""
-    now, now_str = get_time_now()
-    parsed_response = response_metadata(now_str)
+    parsed_response = response_metadata()
     parsed_response['Certificate'] = {
         'UserName': username,
         'CertificateId': cert.id,
@@ -230,15 +289,14 @@ def upload_signing_certificate_response(username, cert):
     return parsed_response
 
 
-def user_response(username):
+def user_response(user):
     """Response for create/get user."""
-    now, now_str = get_time_now()
-    parsed_response = response_metadata(now_str)
+    parsed_response = response_metadata()
     parsed_response['User'] = {
-        'UserId': 'AIDAJKBPJ3KLDYBUV64DE',
-        'CreateDate': now,
-        'UserName': username,
-        'Arn': 'arn:aws:iam::123456789123:user/openbare/%s' % username,
+        'UserId': user.id,
+        'CreateDate': user.create_date,
+        'UserName': user.username,
+        'Arn': 'arn:aws:iam::123456789123:user/openbare/%s' % user.username,
         'Path': '/openbare/'
     }
     return parsed_response
@@ -246,6 +304,4 @@ def user_response(username):
 
 def user_group_response():
     """Response for add user to group."""
-    now, now_str = get_time_now()
-    parsed_response = response_metadata(now_str)
-    return parsed_response
+    return response_metadata()
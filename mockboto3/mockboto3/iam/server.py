@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+""""Run a mocked IAM account as a local HTTP server.
+
+    python -m mockboto3.iam.server --port 5000 --fixture account.yaml
+
+With --database the account is kept in an SQLite file which several
+servers can share.
+
+Clients in any process point their endpoint url at the server:
+
+    boto3.client('iam', endpoint_url='http://127.0.0.1:5000')
+"""
+
+import argparse
+
+from mockboto3.core.ids import SeededIds
+from mockboto3.core.server import QueryServer
+from mockboto3.core.storage import SqliteStorage
+from mockboto3.iam.endpoints import MockIAM
+
+
+def main(args=None):
+    """Serve a thread safe MockIAM until interrupted."""
+    parser = argparse.ArgumentParser(
+        description='Serve a mocked IAM account over the Query API.'
+    )
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', default=5000, type=int)
+    parser.add_argument('--fixture', help='JSON or YAML fixture to load.')
+    parser.add_argument('--seed', help='Seed for reproducible ids.')
+    parser.add_argument('--database', help='SQLite file for the account.')
+    options = parser.parse_args(args)
+
+    ids = SeededIds(options.seed) if options.seed is not None else None
+    storage = SqliteStorage(options.database) if options.database else None
+    mocker = MockIAM(ids=ids, thread_safe=True, storage=storage)
+    if options.fixture:
+        mocker.load(options.fixture)
+
+    server = QueryServer(mocker, (options.host, options.port))
+    print('Serving IAM on %s' % server.endpoint_url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 
+import hashlib
+
 
 def get_arn(obj, value):
     return "arn:aws:iam::123456789012:{obj}/{value}".format(
@@ -8,5 +10,10 @@ def get_arn(obj, value):
     )
 
 
+def document_key(document):
+    """Return the content address of a policy document."""
+    return hashlib.sha256(document.encode('utf-8')).hexdigest()
+
+
 def get_value_from_arn(arn):
     return arn.split('/')[1]
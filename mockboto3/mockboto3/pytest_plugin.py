@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+
+""""pytest plugin providing mocked IAM accounts to tests.
+
+The plugin is registered through the pytest11 entry point when
+mockboto3 is installed. The iam_mock fixture routes boto3 IAM calls
+to a MockIAM for the duration of a test and yields it, clients of
+other services are left to their own mocks or make real calls:
+
+    def test_user(iam_mock):
+        boto3.client('iam').create_user(UserName='John')
+        assert 'John' in iam_mock.users
+
+Every test starts from a session baseline loaded from the fixture
+file named by the mockboto3_iam_fixture ini option, or returned by
+an iam_fixture fixture overriding the default. The baseline is built
+once per session, also under pytest-xdist, and shared read-only by
+all workers through a memory-mapped snapshot. Each test gets its own
+copy-on-write view of it.
+
+Tests marked iam_shared instead share one account stored in SQLite
+by all workers of the session, for contention scenarios:
+
+    @pytest.mark.iam_shared
+    def test_concurrent_keys(iam_mock):
+        ...
+
+The shared account starts from the baseline and keeps the changes
+of every shared test.
+
+With the mockboto3_metrics ini option set, the calls of all tests are
+recorded in one Metrics instance, the iam_metrics fixture, dumped as
+JSON to that path at the end of the session. Each xdist worker dumps
+to its own file, named after the worker.
+
+The plugin is loaded by every pytest run with mockboto3 installed,
+mocks are only imported once a test uses one of the fixtures.
+"""
+
+import os
+
+from contextlib import contextmanager
+
+import pytest
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+
+@contextmanager
+def _exclusive(path):
+    """Hold an exclusive lock on path between processes.
+
+    Without fcntl every worker may build the baseline, dump replaces
+    the file atomically so they never see a partial one.
+    """
+    if fcntl is None:  # pragma: no cover
+        yield
+        return
+
+    with open(path, 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _worker_id(config):
+    """Return the id of the xdist worker of config, None outside one.
+
+    Nested sessions such as pytester runs inherit the environment of
+    the worker, so the id is taken from the config, not from
+    PYTEST_XDIST_WORKER.
+    """
+    if hasattr(config, 'workerinput'):
+        return config.workerinput['workerid']
+    return None
+
+
+def pytest_addoption(parser):
+    parser.addini('mockboto3_iam_fixture',
+                  'JSON or YAML fixture loaded into the IAM baseline.')
+    parser.addini('mockboto3_metrics',
+                  'Path of the JSON call metrics dumped after the session.')
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        'markers',
+        'iam_shared: iam_mock is one account shared by all xdist workers.'
+    )
+
+
+@pytest.fixture(scope='session')
+def iam_fixture(pytestconfig):
+    """Fixture dict or file loaded into the baseline, None for none."""
+    path = pytestconfig.getini('mockboto3_iam_fixture')
+    if not path:
+        return None
+    return os.path.join(str(pytestconfig.rootpath), path)
+
+
+@pytest.fixture(scope='session')
+def iam_metrics(pytestconfig):
+    """Metrics of the session, None unless mockboto3_metrics is set."""
+    path = pytestconfig.getini('mockboto3_metrics')
+    if not path:
+        yield None
+        return
+
+    from mockboto3.core.metrics import Metrics
+
+    metrics = Metrics()
+    yield metrics
+
+    worker = _worker_id(pytestconfig)
+    if worker:
+        root, extension = os.path.splitext(path)
+        path = '%s.%s%s' % (root, worker, extension)
+    metrics.dump(os.path.join(str(pytestconfig.rootpath), path))
+
+
+@pytest.fixture(scope='session')
+def iam_session_dir(pytestconfig, tmp_path_factory):
+    """Directory shared by all xdist workers of the session."""
+    base = tmp_path_factory.getbasetemp()
+    if _worker_id(pytestconfig):
+        base = base.parent
+    return base
+
+
+@pytest.fixture(scope='session')
+def iam_baseline(iam_fixture, iam_session_dir):
+    """Snapshot of the baseline account, built once per session."""
+    from mockboto3.core.ids import SeededIds
+    from mockboto3.core.snapshot import Snapshot
+    from mockboto3.iam.endpoints import MockIAM
+
+    path = str(iam_session_dir / 'mockboto3-iam-baseline.snapshot')
+
+    with _exclusive(path + '.lock'):
+        if not os.path.exists(path):
+            mocker = MockIAM(ids=SeededIds())
+            if iam_fixture is not None:
+                mocker.load(iam_fixture)
+            mocker.snapshot().dump(path)
+
+    return Snapshot.load(path)
+
+
+@pytest.fixture
+def iam_mock(request, iam_baseline, iam_metrics, iam_session_dir):
+    """MockIAM receiving the boto3 IAM calls of the test."""
+    from unittest.mock import patch
+
+    from mockboto3.core.router import Router
+    from mockboto3.core.storage import SqliteStorage
+    from mockboto3.iam.endpoints import MockIAM
+
+    storage = None
+    if request.node.get_closest_marker('iam_shared'):
+        path = str(iam_session_dir / 'mockboto3-iam-shared.db')
+        with _exclusive(path + '.lock'):
+            exists = os.path.exists(path)
+            storage = SqliteStorage(path)
+            if not exists:
+                MockIAM(storage=storage).restore(iam_baseline)
+
+    mocker = MockIAM(thread_safe=True, storage=storage, metrics=iam_metrics)
+    if storage is None:
+        mocker.restore(iam_baseline)
+
+    try:
+        with patch('botocore.client.BaseClient._make_api_call',
+                   new=Router({'iam': mocker.mock_make_api_call})):
+            yield mocker
+    finally:
+        if storage is not None:
+            storage.close()
@@ -14,11 +14,15 @@ setup_requirements = [
     'pytest-runner',
 ]
 
+yaml_requirements = [
+    'PyYAML',
+]
+
 test_requirements = [
     'coverage',
     'pytest-cov',
     'pytest',
-]
+] + yaml_requirements
 
 dev_requirements = [
     'bumpversion',
@@ -35,6 +39,9 @@ setup(
     author="SUSE",
     author_email='public-cloud-dev@susecloud.net',
     url='https://github.com/SUSE/Enceladus/mockboto3',
+    entry_points={
+        'pytest11': ['mockboto3 = mockboto3.pytest_plugin']
+    },
     packages=find_packages(),
     package_dir={'mockboto3':
                  'mockboto3'},
@@ -43,7 +50,8 @@ setup(
     setup_requires=setup_requirements,
     tests_require=test_requirements,
     extras_require={
-        'dev': dev_requirements
+        'dev': dev_requirements,
+        'yaml': yaml_requirements
     },
     license="BSD license",
     zip_safe=False,
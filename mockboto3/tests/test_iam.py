@@ -1,13 +1,54 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import asyncio
 import boto3
+import http.client
+import json
+import subprocess
+import sys
+import time
 import pytest
+import threading
+import yaml
 
+from botocore.client import BaseClient
+from botocore.exceptions import ClientError
+from botocore.stub import Stubber
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+from mockboto3.core.aio import AsyncAPICall
+from mockboto3.core.clients import make_client
+from mockboto3.core.clock import Clock, FrozenClock, ManualClock
 from mockboto3.core.exceptions import MockBoto3ClientError
+from mockboto3.core.journal import Changes
+from mockboto3.core.ids import (
+    ID_FORMATS, IdGenerator, RandomIds, SECRET_LENGTH, SeededIds
+)
+from mockboto3.core.metrics import Metrics, OperationMetrics
+from mockboto3.core.server import QueryServer
+from mockboto3.core.snapshot import Snapshot
+from mockboto3.core.router import Router, import_service
+from mockboto3.core.service import MockService, operation
+from mockboto3.core.storage import SqliteStorage
+from mockboto3.core.throttle import (
+    Throttle, TokenBucket, delay_for, lognormal, uniform
+)
+from mockboto3.core.trace import read_trace, replay
 from mockboto3.core.utils import inflection
+from mockboto3.iam import responses
 from mockboto3.iam.constants import POLICY_DOC, SIGNING_CERT
-from mockboto3.iam.endpoints import MockIAM, mock_iam
+from mockboto3.iam.endpoints import MockIAM, mock_iam, mock_iam_async
+from mockboto3.iam.models import AccessKey, Group, Policy, User
+from mockboto3.iam.policy import (
+    ALLOWED, EXPLICIT_DENY, IMPLICIT_DENY, PolicyEvaluator, compile_policy
+)
+from mockboto3.iam.server import main as server_main
+
+pytest_plugins = ['pytester']
 
 
 class TestIAM:
@@ -29,6 +70,23 @@ class TestIAM:
         except MockBoto3ClientError as e:
             assert msg == str(e)
 
+    def test_operations_table(self):
+        """Test operation names map to their handlers."""
+        assert MockIAM.operations['CreateUser'] is \
+            MockIAM.create_user.__wrapped__
+        assert MockIAM.operations['EnableMFADevice'] is \
+            MockIAM.enable_mfa_device.__wrapped__
+
+        for name, handler in MockIAM.operations.items():
+            assert inflection(name) == handler.__name__
+
+    def test_handler_error_not_masked(self):
+        """Test errors raised inside a handler are not hidden."""
+        mocker = MockIAM()
+
+        with pytest.raises(KeyError):
+            mocker.mock_make_api_call('CreateUser', {})
+
 
 class TestExceptions:
     @classmethod
@@ -214,6 +272,37 @@ class TestAccessKey:
         response = self.client.list_access_keys(UserName=self.user)
         assert 0 == len(response['AccessKeyMetadata'])
 
+    def test_access_key_index(self):
+        """Test access keys are indexed per user."""
+        mocker = MockIAM()
+        for user in ('John', 'Jane'):
+            mocker.create_user({'UserName': user})
+
+        john_key = mocker.create_access_key({'UserName': 'John'})
+        john_key = john_key['AccessKey']['AccessKeyId']
+        mocker.create_access_key({'UserName': 'Jane'})
+
+        response = mocker.list_access_keys({'UserName': 'Jane'})
+        assert 1 == len(response['AccessKeyMetadata'])
+        assert 'Jane' == response['AccessKeyMetadata'][0]['UserName']
+
+        msg = 'An error occurred (NoSuchEntity) when calling the ' \
+              'UpdateAccessKey operation: The Access Key with id ' \
+              '%s cannot be found.' % john_key
+
+        with pytest.raises(MockBoto3ClientError) as e:
+            # Assert key of another user cannot be updated
+            mocker.update_access_key({'AccessKeyId': john_key,
+                                      'UserName': 'Jane',
+                                      'Status': 'Inactive'})
+
+        assert msg == str(e.value)
+
+        # Deleting user removes the users keys
+        mocker.delete_user({'UserName': 'John'})
+        assert john_key not in mocker.access_keys
+        assert 1 == len(mocker.access_keys)
+
 
 class TestLoginProfile:
 
@@ -441,3 +530,1740 @@ class TestUserPolicy:
         )
         assert 0 == len(response['AttachedPolicies'])
 
+
+class TestGroupPolicy:
+
+    @classmethod
+    def setup_class(cls):
+        cls.client = boto3.client('iam')
+        cls.group = 'Admins'
+        cls.policy = 'arn:aws:iam::aws:policy/AdminAccess'
+
+    @mock_iam
+    def test_detach_group_policy_exception(self):
+        """Test detach non existent group policy raises exception."""
+        msg = 'An error occurred (NoSuchEntity) when calling the ' \
+              'DetachGroupPolicy operation: The policy with' \
+              ' name AdminAccess is not attached to the group with' \
+              ' name Admins.'
+
+        self.client.create_group(GroupName=self.group)
+
+        with pytest.raises(MockBoto3ClientError) as e:
+            # Assert detach non existent group policy exception
+            self.client.detach_group_policy(GroupName=self.group,
+                                            PolicyArn=self.policy)
+
+        assert msg == str(e.value)
+
+    @mock_iam
+    def test_group_policy(self):
+        """Test group policy endpoints."""
+        self.client.create_group(GroupName=self.group)
+
+        # Attach group policy
+        self.client.create_policy(PolicyName='AdminAccess',
+                                  PolicyDocument=POLICY_DOC)
+        self.client.attach_group_policy(GroupName=self.group,
+                                        PolicyArn=self.policy)
+
+        # Lists attached group policies
+        response = self.client.list_attached_group_policies(
+            GroupName=self.group
+        )
+
+        assert 'AdminAccess' == response['AttachedPolicies'][0]['PolicyName']
+        assert 1 == len(response['AttachedPolicies'])
+
+        # Detach attached policy
+        self.client.detach_group_policy(GroupName=self.group,
+                                        PolicyArn=self.policy)
+
+        # Confirm policy detached
+        response = self.client.list_attached_group_policies(
+            GroupName=self.group
+        )
+        assert 0 == len(response['AttachedPolicies'])
+
+
+class TestRelations:
+
+    def test_cascading_deletes(self):
+        """Test deleting users and groups removes their relations."""
+        mocker = MockIAM()
+        arn = 'arn:aws:iam::aws:policy/Admins'
+        mocker.create_policy({'PolicyName': 'Admins',
+                              'PolicyDocument': POLICY_DOC})
+
+        for group in ('Admins', 'Users'):
+            mocker.create_group({'GroupName': group})
+            mocker.attach_group_policy({'GroupName': group, 'PolicyArn': arn})
+
+        for user in ('John', 'Jane'):
+            mocker.create_user({'UserName': user})
+            mocker.attach_user_policy({'UserName': user, 'PolicyArn': arn})
+            mocker.add_user_to_group({'UserName': user, 'GroupName': 'Admins'})
+            mocker.add_user_to_group({'UserName': user, 'GroupName': 'Users'})
+
+        # Attaching twice is a no-op
+        mocker.attach_user_policy({'UserName': 'John', 'PolicyArn': arn})
+        policy = mocker.policies['Admins']
+        assert 4 == policy.attachment_count
+
+        mocker.delete_user({'UserName': 'John'})
+        assert ['Jane'] == list(mocker.user_groups.sources('Admins'))
+        assert 3 == policy.attachment_count
+
+        mocker.delete_group({'GroupName': 'Admins'})
+        assert ['Users'] == list(mocker.user_groups.targets('Jane'))
+        assert ('Admins', 'Admins') not in mocker.group_policies
+        assert 2 == policy.attachment_count
+
+
+class TestPagination:
+
+    @classmethod
+    def setup_class(cls):
+        cls.client = boto3.client('iam')
+
+    @mock_iam
+    def test_list_pagination(self):
+        """Test list endpoints honor MaxItems and Marker."""
+        for index in range(5):
+            self.client.create_user(UserName='user%d' % index)
+
+        response = self.client.list_users(MaxItems=2)
+        assert ['user0', 'user1'] == [user['UserName']
+                                      for user in response['Users']]
+        assert response['IsTruncated']
+
+        response = self.client.list_users(MaxItems=3,
+                                          Marker=response['Marker'])
+        assert ['user2', 'user3', 'user4'] == [user['UserName']
+                                               for user in response['Users']]
+        assert not response['IsTruncated']
+        assert 'Marker' not in response
+
+    @mock_iam
+    def test_paginator(self):
+        """Test botocore paginators iterate all pages."""
+        self.client.create_user(UserName='John')
+        for index in range(7):
+            self.client.create_access_key(UserName='John')
+
+        paginator = self.client.get_paginator('list_access_keys')
+        pages = list(paginator.paginate(UserName='John',
+                                        PaginationConfig={'PageSize': 3}))
+
+        assert [3, 3, 1] == [len(page['AccessKeyMetadata'])
+                             for page in pages]
+
+    @mock_iam
+    def test_invalid_marker(self):
+        """Test invalid marker raises exception."""
+        msg = 'An error occurred (InvalidInput) when calling the ' \
+              'ListGroups operation: Invalid Marker: gecko.'
+
+        with pytest.raises(MockBoto3ClientError) as e:
+            self.client.list_groups(Marker='gecko')
+
+        assert msg == str(e.value)
+
+    def test_max_items_below_one(self):
+        """Test MaxItems below 1 is rejected instead of looping."""
+        mocker = MockIAM()
+        for max_items in (0, -1):
+            with pytest.raises(MockBoto3ClientError) as e:
+                mocker.list_users({'MaxItems': max_items})
+            assert 'InvalidInput' == e.value.response['Error']['Code']
+
+    def test_page_slices(self):
+        """Test later pages follow key changes of plain and restored stores."""
+        for snapshot in (None, BASELINE):
+            mocker = MockIAM()
+            if snapshot is not None:
+                mocker.restore(snapshot)
+            for index in range(5):
+                mocker.create_user({'UserName': 'user%d' % index})
+
+            def names(max_items, **kwargs):
+                kwargs['MaxItems'] = max_items
+                response = mocker.list_users(kwargs)
+                return [user['UserName'] for user in response['Users']], \
+                    response.get('Marker')
+
+            expected = list(mocker.users)
+            page, marker = names(2)
+            assert expected[:2] == page
+            assert expected[2:4] == names(2, Marker=marker)[0]
+
+            mocker.delete_user({'UserName': expected[0]})
+            mocker.create_user({'UserName': 'Jane'})
+            assert list(mocker.users)[2:5] == names(3, Marker=marker)[0]
+
+
+def build_baseline():
+    """Return snapshot of an account with a user, group and policy."""
+    mocker = MockIAM()
+    arn = 'arn:aws:iam::aws:policy/Admins'
+    mocker.create_user({'UserName': 'John'})
+    mocker.create_group({'GroupName': 'Admins'})
+    mocker.create_policy({'PolicyName': 'Admins',
+                          'PolicyDocument': POLICY_DOC})
+    mocker.add_user_to_group({'UserName': 'John', 'GroupName': 'Admins'})
+    mocker.attach_user_policy({'UserName': 'John', 'PolicyArn': arn})
+    mocker.create_access_key({'UserName': 'John'})
+    mocker.create_login_profile({'UserName': 'John', 'Password': 'secret'})
+    return mocker.snapshot()
+
+
+BASELINE = build_baseline()
+
+
+class TestSnapshot:
+
+    @classmethod
+    def setup_class(cls):
+        cls.client = boto3.client('iam')
+
+    def test_restore_copy_on_write(self):
+        """Test changes to a restored mock do not leak into the snapshot."""
+        mocker = MockIAM()
+        mocker.restore(BASELINE)
+        arn = 'arn:aws:iam::aws:policy/Admins'
+
+        key_id = list(mocker.access_keys)[0]
+        mocker.update_access_key({'AccessKeyId': key_id,
+                                  'Status': 'Inactive'})
+        mocker.update_login_profile({'UserName': 'John',
+                                     'PasswordResetRequired': True})
+        mocker.detach_user_policy({'UserName': 'John', 'PolicyArn': arn})
+        mocker.create_user({'UserName': 'Jane'})
+        mocker.add_user_to_group({'UserName': 'Jane', 'GroupName': 'Admins'})
+        mocker.delete_user({'UserName': 'John'})
+
+        assert ['Jane'] == list(mocker.users)
+        assert 1 == len(mocker.users)
+        assert ['Jane'] == list(mocker.user_groups.sources('Admins'))
+        assert 0 == mocker.policies['Admins'].attachment_count
+        assert 0 == len(mocker.access_keys)
+
+        # A second mock restored from the same snapshot is untouched
+        other = MockIAM()
+        other.restore(BASELINE)
+        assert ['John'] == list(other.users)
+        assert ['John'] == list(other.user_groups.sources('Admins'))
+        assert 'Active' == other.access_keys[key_id].status
+        assert not other.users['John'].login_profile.reset_required
+        assert 1 == other.policies['Admins'].attachment_count
+
+        # Re-creating a deleted user keeps its position
+        mocker.create_user({'UserName': 'John'})
+        assert ['John', 'Jane'] == list(mocker.users)
+
+        # Snapshot of a restored mock flattens the overlay
+        snapshot = mocker.snapshot()
+        assert ['John', 'Jane'] == list(snapshot.stores['users'])
+
+    def test_restore_wrong_service(self):
+        """Test restoring a snapshot of another service fails."""
+        mocker = MockIAM()
+        snapshot = mocker.snapshot()
+        snapshot.service = 's3'
+
+        with pytest.raises(ValueError):
+            mocker.restore(snapshot)
+
+    @mock_iam(snapshot=BASELINE)
+    def test_mock_iam_snapshot(self):
+        """Test mock_iam starts from the baseline snapshot."""
+        response = self.client.list_groups_for_user(UserName='John')
+        assert 'Admins' == response['Groups'][0]['GroupName']
+
+        self.client.delete_group(GroupName='Admins')
+        assert 0 == len(self.client.list_groups()['Groups'])
+        assert 'Admins' in BASELINE.stores['groups']
+
+
+class TestFixtures:
+
+    fixture = {
+        'policies': [{'name': 'Admins', 'document': json.loads(POLICY_DOC)}],
+        'groups': [{'name': 'Admins', 'policies': ['Admins']}, 'Users'],
+        'users': [
+            {'name': 'John',
+             'groups': ['Admins', 'Users'],
+             'policies': ['Admins'],
+             'access_keys': [{'id': 'AKIAJOHN', 'status': 'Inactive'}],
+             'login_profile': {'password': 'secret'},
+             'mfa_devices': ['44324234213']},
+            {'name': 'Jane', 'groups': ['Users'], 'access_keys': 2}
+        ]
+    }
+
+    def test_load(self):
+        """Test fixture is loaded into stores and relations."""
+        mocker = MockIAM()
+        mocker.load(self.fixture)
+
+        assert ['John', 'Jane'] == list(mocker.users)
+        assert ['John', 'Jane'] == list(mocker.user_groups.sources('Users'))
+        assert 2 == mocker.policies['Admins'].attachment_count
+        version = mocker.policies['Admins'].versions['v1']
+        assert json.loads(POLICY_DOC) == json.loads(
+            mocker.documents[version.document_key].text)
+
+        response = mocker.list_access_keys({'UserName': 'John'})
+        assert 'AKIAJOHN' == response['AccessKeyMetadata'][0]['AccessKeyId']
+        assert 'Inactive' == response['AccessKeyMetadata'][0]['Status']
+        assert 2 == len(mocker.user_access_keys.targets('Jane'))
+
+        response = mocker.get_login_profile({'UserName': 'John'})
+        assert 'John' == response['LoginProfile']['UserName']
+        assert '44324234213' in mocker.users['John'].mfa_devices
+
+    def test_load_file(self, tmp_path):
+        """Test fixture is loaded from JSON and YAML files."""
+        for name, dump in (('fixture.json', json.dumps),
+                           ('fixture.yaml', yaml.safe_dump)):
+            path = tmp_path / name
+            path.write_text(dump(self.fixture))
+
+            mocker = MockIAM()
+            mocker.load(str(path))
+            assert 3 == len(mocker.access_keys)
+
+    def test_load_invalid(self):
+        """Test invalid references are rejected before loading."""
+        mocker = MockIAM()
+        mocker.create_user({'UserName': 'John'})
+
+        fixture = {'groups': ['Admins', 'Admins'],
+                   'users': [{'name': 'John', 'groups': ['Users']},
+                             {'name': 'Jane', 'policies': ['Admins']}]}
+
+        with pytest.raises(ValueError) as e:
+            mocker.load(fixture)
+
+        assert 'Invalid fixture: group Admins already exists; ' \
+               'user John already exists; ' \
+               'user John references unknown group Users; ' \
+               'user Jane references unknown policy Admins.' == str(e.value)
+        assert 0 == len(mocker.groups)
+
+    def test_load_malformed(self):
+        """Test malformed entries are rejected without changing the mock."""
+        mocker = MockIAM()
+        mocker.load({'users': [{'name': 'John',
+                                'access_keys': [{'id': 'AKIAJOHN'}]}]})
+
+        for fixture, error in (
+                ([], 'not a mapping'),
+                ({'users': 'John'}, 'users is not a list'),
+                ({'users': ['Jane', 42]}, 'user 42 is not a name'),
+                ({'policies': ['Admins']}, 'policy Admins has no document'),
+                ({'users': [{'name': 'Jane', 'login_profile': {}},
+                            {'name': 'Joe',
+                             'login_profile': {'reset_required': True}}]},
+                 'user Joe login_profile has no password'),
+                ({'users': [{'name': 'Jane', 'access_keys': ['AKIA']}]},
+                 'user Jane access_keys is not a count or a list'),
+                ({'users': [{'name': 'Jane',
+                             'access_keys': [{'id': 'AKIAJANE'},
+                                             {'id': 'AKIAJANE'},
+                                             {'id': 'AKIAJOHN'}]}]},
+                 'access key AKIAJANE already exists; '
+                 'access key AKIAJOHN already exists')):
+            with pytest.raises(ValueError) as e:
+                mocker.load(fixture)
+            assert error in str(e.value)
+
+        assert ['John'] == list(mocker.users)
+        assert ['AKIAJOHN'] == list(mocker.access_keys)
+
+
+class TestModels:
+
+    def test_compact_models(self):
+        """Test models have no instance dict and lazy sub objects."""
+        user = User('John', 'AIDAJOHN')
+        access_key = AccessKey('John', 'AKIAJOHN', 'secret')
+
+        for entity in (user, access_key, Group('Admins', 'AGPAADMINS'),
+                       Policy('Admins', 'ANPAADMINS', POLICY_DOC)):
+            assert not hasattr(entity, '__dict__')
+
+        assert access_key._last_used is None
+        assert 'iam' == access_key.last_used.service_name
+        assert access_key.last_used is access_key._last_used
+
+        assert 0 == len(user.mfa_devices)
+        assert user._mfa_devices is None
+        user.enable_mfa_device('44324234213')
+        assert ['44324234213'] == list(user.mfa_devices)
+
+
+class TestResponses:
+
+    def test_response_metadata(self):
+        """Test envelopes are independent copies with a date header."""
+        first = responses.response_metadata()
+        second = responses.response_metadata()
+
+        first['ResponseMetadata']['HTTPHeaders']['date'] = 'changed'
+        assert second['ResponseMetadata']['HTTPHeaders']['date'].endswith(
+            ' GMT'
+        )
+        assert 200 == second['ResponseMetadata']['HTTPStatusCode']
+        assert 'date' not in responses.HTTP_HEADERS
+
+    def test_user_response(self):
+        """Test user response reflects the stored user."""
+        mocker = MockIAM()
+        created = mocker.create_user({'UserName': 'John'})['User']
+        user = mocker.get_user({'UserName': 'John'})['User']
+
+        assert created == user
+        assert mocker.users['John'].id == user['UserId']
+        assert mocker.users['John'].create_date == user['CreateDate']
+
+
+class TestIds:
+
+    @pytest.mark.parametrize("ids", [RandomIds(), SeededIds(7)])
+    def test_id_formats(self, ids):
+        """Test ids have the AWS prefix and length of their kind."""
+        for kind, (prefix, length) in ID_FORMATS.items():
+            generated = set(ids.generate(kind) for _ in range(2000))
+            assert 2000 == len(generated)
+
+            for entity_id in generated:
+                assert entity_id.startswith(prefix)
+                assert length == len(entity_id)
+                assert entity_id.isalnum() and entity_id.isupper()
+
+        assert SECRET_LENGTH == len(ids.secret())
+
+    def test_abstract_generator(self):
+        """Test generators must implement secrets and characters."""
+        with pytest.raises(TypeError):
+            IdGenerator()
+
+        class PartialIds(IdGenerator):
+            def secret(self):
+                return 'secret'
+
+        with pytest.raises(TypeError):
+            PartialIds()
+
+    def test_seeded_ids(self):
+        """Test seeded mocks produce the same ids."""
+        results = []
+        for _ in range(2):
+            mocker = MockIAM(ids=SeededIds(42))
+            user = mocker.create_user({'UserName': 'John'})['User']
+            key = mocker.create_access_key({'UserName': 'John'})['AccessKey']
+            results.append((user['UserId'], key['AccessKeyId'],
+                            key['SecretAccessKey']))
+
+        assert results[0] == results[1]
+        assert results[0][0].startswith('AIDA')
+        assert results[0][1].startswith('AKIA')
+        assert results[0] != MockIAM(ids=SeededIds(43)).create_user(
+            {'UserName': 'John'})['User']['UserId']
+
+
+class TestThreadSafety:
+
+    @classmethod
+    def setup_class(cls):
+        cls.client = boto3.client('iam')
+
+    def test_stress(self):
+        """Test concurrent calls from many threads stay consistent."""
+        mocker = MockIAM(thread_safe=True)
+        call = mocker.mock_make_api_call
+        call('CreateGroup', {'GroupName': 'Admins'})
+        call('CreatePolicy', {'PolicyName': 'Admins',
+                              'PolicyDocument': POLICY_DOC})
+        arn = 'arn:aws:iam::aws:policy/Admins'
+
+        def worker(index):
+            user = 'user%d' % index
+            call('CreateUser', {'UserName': user})
+            call('AddUserToGroup', {'UserName': user, 'GroupName': 'Admins'})
+            call('AttachUserPolicy', {'UserName': user, 'PolicyArn': arn})
+
+            keys = [call('CreateAccessKey', {'UserName': user})
+                    ['AccessKey']['AccessKeyId'] for _ in range(3)]
+            call('DeleteAccessKey', {'AccessKeyId': keys[0]})
+            call('UpdateAccessKey', {'AccessKeyId': keys[1],
+                                     'Status': 'Inactive'})
+
+            # Page through collections other threads are changing
+            response = {'Marker': None}
+            while 'Marker' in response:
+                kwargs = {'MaxItems': 7}
+                if response['Marker']:
+                    kwargs['Marker'] = response['Marker']
+                response = call('ListUsers', kwargs)
+
+            call('ListGroupsForUser', {'UserName': user})
+            if index % 2:
+                call('DeleteUser', {'UserName': user})
+
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            with ThreadPoolExecutor(max_workers=16) as executor:
+                list(executor.map(worker, range(200)))
+        finally:
+            sys.setswitchinterval(interval)
+
+        assert 100 == len(mocker.users)
+        assert 200 == len(mocker.access_keys)
+        assert 100 == len(mocker.user_groups.sources('Admins'))
+        assert 100 == mocker.policies['Admins'].attachment_count
+
+    @mock_iam(thread_safe=True)
+    def test_concurrent_clients(self):
+        """Test boto3 clients in threads share the mocked state."""
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(
+                lambda index: self.client.create_user(UserName='u%d' % index),
+                range(50)
+            ))
+
+        response = self.client.list_users(MaxItems=100)
+        assert 50 == len(response['Users'])
+
+    def test_lock_free_handler(self):
+        """Test handlers locking no stores run while all are held."""
+        mocker = MockIAM(thread_safe=True)
+        with ThreadPoolExecutor(max_workers=1) as executor, mocker.locked():
+            future = executor.submit(
+                mocker.mock_make_api_call, 'SimulateCustomPolicy',
+                {'PolicyInputList': [POLICY_DOC],
+                 'ActionNames': ['iam:GetUser']}
+            )
+            response = future.result(timeout=5)
+
+        assert 1 == len(response['EvaluationResults'])
+
+    def test_unknown_lock(self):
+        """Test handlers can only lock stores of their service."""
+        with pytest.raises(TypeError):
+            class MockGecko(MockIAM):
+                @operation('CreateGecko', locks=('geckos',))
+                def create_gecko(self, kwargs):
+                    pass
+
+
+class TestAsync:
+
+    def test_async_api_call(self):
+        """Test concurrent coroutines share the mock with latency."""
+        api_call = AsyncAPICall(MockIAM(), latency=0.01)
+
+        async def scenario():
+            await asyncio.gather(*[
+                api_call('CreateUser', {'UserName': 'user%d' % index})
+                for index in range(20)
+            ])
+            return await api_call('ListUsers', {})
+
+        loop_start = time.monotonic()
+        response = asyncio.run(scenario())
+
+        assert 20 == len(response['Users'])
+        assert 21 == api_call.calls
+        assert 20 == api_call.max_in_flight
+        assert 0 == api_call.in_flight
+        assert time.monotonic() - loop_start < 0.15
+
+    def test_async_latency(self):
+        """Test latency per operation name."""
+        api_call = AsyncAPICall(MockIAM(), latency={'GetUser': 0.5})
+        assert 0.5 == api_call.delay('GetUser')
+        assert api_call.delay('ListUsers') is None
+
+        api_call.latency = lambda operation_name: len(operation_name)
+        assert 7 == api_call.delay('GetUser')
+
+        async def scenario():
+            await api_call('GetUser', {'UserName': 'John'})
+
+        api_call.latency = None
+        with pytest.raises(MockBoto3ClientError):
+            asyncio.run(scenario())
+        assert 0 == api_call.in_flight
+
+    def test_async_throttle_latency(self):
+        """Test throttle latency is awaited after admitting the call."""
+        slept = []
+        awaited = []
+        metrics = Metrics()
+        throttle = Throttle(rates={'CreateUser': (1, 1)},
+                            latency={'CreateUser': 0.05}, sleep=slept.append)
+        api_call = AsyncAPICall(MockIAM(throttle=throttle, metrics=metrics),
+                                latency=0.01)
+
+        async def sleep(delay):
+            awaited.append(delay)
+
+        async def scenario():
+            return await asyncio.gather(*[
+                api_call('CreateUser', {'UserName': 'user%d' % index})
+                for index in range(2)
+            ], return_exceptions=True)
+
+        with patch('mockboto3.core.aio.asyncio.sleep', new=sleep):
+            first, second = asyncio.run(scenario())
+
+        assert 'user0' == first['User']['UserName']
+        assert 'Throttling' == second.response['Error']['Code']
+        assert [pytest.approx(0.06)] == awaited
+        assert [] == slept
+        assert {'Throttling': 1} == metrics['CreateUser'].errors
+
+    def test_mock_iam_async(self):
+        """Test aiobotocore clients are routed to the mock."""
+        session = pytest.importorskip('aiobotocore.session')
+
+        @mock_iam_async(latency=0.001)
+        async def scenario():
+            async with session.get_session().create_client(
+                    'iam',
+                    region_name='us-east-1',
+                    aws_access_key_id='testing',
+                    aws_secret_access_key='testing') as client:
+                await asyncio.gather(*[
+                    client.create_user(UserName='user%d' % index)
+                    for index in range(10)
+                ])
+                return await client.list_users()
+
+        assert 10 == len(asyncio.run(scenario())['Users'])
+
+        @mock_iam_async
+        def create_user():
+            async def create():
+                async with session.get_session().create_client(
+                        'iam',
+                        region_name='us-east-1',
+                        aws_access_key_id='testing',
+                        aws_secret_access_key='testing') as client:
+                    return await client.create_user(UserName='John')
+            return asyncio.run(create())
+
+        assert 'John' == create_user()['User']['UserName']
+
+
+class TestServer:
+
+    @classmethod
+    def setup_class(cls):
+        cls.server = QueryServer(MockIAM(thread_safe=True))
+        cls.thread = threading.Thread(target=cls.server.serve_forever,
+                                      daemon=True)
+        cls.thread.start()
+        cls.client = boto3.client('iam',
+                                  endpoint_url=cls.server.endpoint_url,
+                                  region_name='us-east-1',
+                                  aws_access_key_id='testing',
+                                  aws_secret_access_key='testing')
+
+    @classmethod
+    def teardown_class(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def test_server_round_trip(self):
+        """Test real client calls are served over HTTP."""
+        user = self.client.create_user(UserName='John')['User']
+        assert 'John' == user['UserName']
+        assert user['UserId'].startswith('AIDA')
+        assert user['CreateDate'].tzinfo is not None
+
+        self.client.create_group(GroupName='Admins')
+        self.client.add_user_to_group(GroupName='Admins', UserName='John')
+        self.client.create_access_key(UserName='John')
+
+        groups = self.client.list_groups_for_user(UserName='John')
+        assert ['Admins'] == [group['GroupName']
+                              for group in groups['Groups']]
+
+        keys = self.client.list_access_keys(UserName='John')
+        assert 1 == len(keys['AccessKeyMetadata'])
+        assert not keys['IsTruncated']
+
+        profile = self.client.create_login_profile(
+            UserName='John', Password='secret', PasswordResetRequired=True
+        )
+        assert profile['LoginProfile']['PasswordResetRequired']
+
+    def test_server_pagination(self):
+        """Test integer parameters and markers survive the wire."""
+        for index in range(5):
+            self.client.create_user(UserName='paged%d' % index)
+
+        paginator = self.client.get_paginator('list_users')
+        pages = list(paginator.paginate(PaginationConfig={'PageSize': 2}))
+        assert len(pages) > 2
+        names = [user['UserName'] for page in pages for user in page['Users']]
+        assert set('paged%d' % index for index in range(5)) <= set(names)
+
+    def test_server_errors(self):
+        """Test mock errors are returned as Query error responses."""
+        with pytest.raises(ClientError) as error:
+            self.client.get_user(UserName='Nobody')
+
+        assert 'NoSuchEntity' == error.value.response['Error']['Code']
+        assert 404 == \
+            error.value.response['ResponseMetadata']['HTTPStatusCode']
+        assert 'Nobody' in error.value.response['Error']['Message']
+
+        status, body = self.server.protocol.handle({'Action': 'Gecko'})
+        assert 400 == status
+        assert '<Code>InvalidAction</Code>' in body
+
+    def test_server_malformed_input(self):
+        """Test malformed parameters return a sender error."""
+        connection = http.client.HTTPConnection(
+            *self.server.server_address[:2]
+        )
+        for body, status in (('Action=ListUsers&MaxItems=abc', 400),
+                             ('Action=ListUsers&MaxItems=1', 200)):
+            connection.request(
+                'POST', '/', body=body,
+                headers={'Content-Type': 'application/x-www-form-urlencoded'}
+            )
+            response = connection.getresponse()
+            response.read()
+            assert status == response.status
+
+        connection.close()
+        status, body = self.server.protocol.handle(
+            {'Action': 'ListUsers', 'MaxItems': 'abc'}
+        )
+        assert 400 == status
+        assert '<Type>Sender</Type><Code>MalformedInput</Code>' in body
+
+    def test_server_keep_alive(self):
+        """Test requests reuse one connection."""
+        connection = http.client.HTTPConnection(
+            *self.server.server_address[:2]
+        )
+        for _ in range(3):
+            connection.request(
+                'POST', '/', body='Action=ListUsers&Version=2010-05-08',
+                headers={'Content-Type': 'application/x-www-form-urlencoded'}
+            )
+            response = connection.getresponse()
+            response_body = response.read().decode()
+            assert 200 == response.status
+            assert response_body.startswith(
+                '<ListUsersResponse xmlns="https://iam.amazonaws.com/'
+            )
+        connection.close()
+
+    def test_server_parse_lists(self):
+        """Test flattened member lists are parsed with the model."""
+        protocol = self.server.protocol
+        shape = protocol.model.operation_model(
+            'SimulateCustomPolicy'
+        ).input_shape
+        kwargs = protocol._parse(shape, {
+            'PolicyInputList.member.1': '{}',
+            'PolicyInputList.member.2': '{"Version": "2012-10-17"}',
+            'ActionNames.member.1': 'iam:GetUser',
+            'ResourceArns': '',
+            'MaxItems': '10',
+        }, '')
+
+        assert 2 == len(kwargs['PolicyInputList'])
+        assert ['iam:GetUser'] == kwargs['ActionNames']
+        assert [] == kwargs['ResourceArns']
+        assert 10 == kwargs['MaxItems']
+
+    def test_server_main(self, monkeypatch, tmpdir, capsys):
+        """Test the command line server loads fixtures and stops."""
+        fixture = tmpdir.join('account.json')
+        fixture.write(json.dumps({'users': ['John']}))
+        servers = []
+
+        def serve_forever(server):
+            servers.append(server)
+            raise KeyboardInterrupt
+
+        monkeypatch.setattr(QueryServer, 'serve_forever', serve_forever)
+        server_main(['--port', '0', '--fixture', str(fixture),
+                     '--seed', '1'])
+        server_main(['--port', '0',
+                     '--database', str(tmpdir.join('account.db'))])
+
+        assert 'John' in servers[0].protocol.mocker.users
+        assert isinstance(servers[1].protocol.mocker.storage, SqliteStorage)
+        assert 'Serving IAM on http://127.0.0.1:' in capsys.readouterr().out
+
+
+class TestSqliteStorage:
+
+    @classmethod
+    def setup_class(cls):
+        cls.client = boto3.client('iam')
+
+    @mock_iam(storage=SqliteStorage())
+    def test_sqlite_round_trip(self):
+        """Test handlers read and write through SQLite tables."""
+        arn = 'arn:aws:iam::aws:policy/Admins'
+        self.client.create_policy(PolicyName='Admins',
+                                  PolicyDocument=POLICY_DOC)
+        self.client.create_group(GroupName='Admins')
+        self.client.attach_group_policy(GroupName='Admins', PolicyArn=arn)
+
+        for index in range(5):
+            user = 'user%d' % index
+            self.client.create_user(UserName=user)
+            self.client.add_user_to_group(GroupName='Admins', UserName=user)
+            self.client.attach_user_policy(UserName=user, PolicyArn=arn)
+
+        self.client.create_login_profile(UserName='user0', Password='secret')
+        self.client.update_login_profile(UserName='user0',
+                                         PasswordResetRequired=True)
+        profile = self.client.get_login_profile(UserName='user0')
+        assert 'user0' == profile['LoginProfile']['UserName']
+
+        key_id = self.client.create_access_key(
+            UserName='user1'
+        )['AccessKey']['AccessKeyId']
+        self.client.update_access_key(UserName='user1', AccessKeyId=key_id,
+                                      Status='Inactive')
+        keys = self.client.list_access_keys(UserName='user1')
+        assert 'Inactive' == keys['AccessKeyMetadata'][0]['Status']
+
+        users = self.client.list_users(MaxItems=2)
+        assert ['user0', 'user1'] == [user['UserName']
+                                      for user in users['Users']]
+        users = self.client.list_users(Marker=users['Marker'])
+        assert ['user2', 'user3', 'user4'] == [user['UserName']
+                                               for user in users['Users']]
+
+        self.client.delete_user(UserName='user1')
+        assert not self.client.list_access_keys(
+            UserName='user0'
+        )['AccessKeyMetadata']
+        groups = self.client.list_groups_for_user(UserName='user2')
+        assert ['Admins'] == [group['GroupName']
+                              for group in groups['Groups']]
+
+    def test_sqlite_rollback(self):
+        """Test a failing call leaves the tables unchanged."""
+        mocker = MockIAM(storage=SqliteStorage())
+        mocker.mock_make_api_call('CreateUser', {'UserName': 'John'})
+
+        with pytest.raises(RuntimeError):
+            with mocker.storage.transaction():
+                mocker.users.writable('John').username = 'Jane'
+                mocker.user_groups.add('John', 'Admins')
+                mocker.users['Jane'] = User('Jane', 'AIDA1')
+                raise RuntimeError
+
+        assert ['John'] == list(mocker.users)
+        assert 'John' == mocker.users['John'].username
+        assert ('John', 'Admins') not in mocker.user_groups
+
+    def test_sqlite_direct_handlers(self):
+        """Test handlers called directly save their changes."""
+        mocker = MockIAM(storage=SqliteStorage())
+        mocker.create_user({'UserName': 'John'})
+        mocker.create_login_profile({'UserName': 'John',
+                                     'Password': 'secret'})
+        mocker.update_login_profile({'UserName': 'John',
+                                     'PasswordResetRequired': True})
+
+        assert mocker.users['John'].login_profile.reset_required
+
+    def test_sqlite_persistence(self, tmpdir):
+        """Test state is shared through the database file."""
+        path = str(tmpdir.join('account.db'))
+        mocker = MockIAM(storage=SqliteStorage(path))
+        mocker.load({'groups': ['Admins'],
+                     'users': [{'name': 'John', 'groups': ['Admins'],
+                                'access_keys': 1,
+                                'mfa_devices': ['44324234213']}]})
+
+        other = MockIAM(storage=SqliteStorage(path))
+        assert 1 == other.user_groups.count_sources('Admins')
+        assert 1 == other.user_access_keys.count_targets('John')
+        assert '44324234213' in other.users['John'].mfa_devices
+
+        other.mock_make_api_call('DeleteUser', {'UserName': 'John'})
+        other.storage.close()
+        assert 'John' not in mocker.users
+        assert 0 == len(mocker.access_keys)
+
+    def test_sqlite_snapshot(self):
+        """Test snapshots restore into and are taken from SQLite."""
+        mocker = MockIAM(storage=SqliteStorage(), thread_safe=True)
+        mocker.restore(BASELINE)
+        mocker.mock_make_api_call('CreateUser', {'UserName': 'Jane'})
+
+        assert ['Admins'] == mocker.user_groups.targets('John')
+        assert 1 == mocker.policies['Admins'].attachment_count
+
+        snapshot = mocker.snapshot()
+        assert ['John', 'Jane'] == list(snapshot.stores['users'])
+        assert {'John': {'Admins': None}} == \
+            snapshot.relations['user_groups'][0]
+
+        mocker.restore(BASELINE)
+        assert 'Jane' not in mocker.users
+
+
+class TestPytestPlugin:
+
+    def test_snapshot_dump_load(self, tmpdir):
+        """Test a dumped snapshot restores from the mapped file."""
+        path = str(tmpdir.join('baseline.snapshot'))
+        BASELINE.dump(path)
+        snapshot = Snapshot.load(path)
+
+        assert ['John'] == list(snapshot.stores['users'])
+        assert 'Admins' in snapshot.stores['groups']
+        assert 1 == len(snapshot.stores['access_keys'])
+
+        mocker = MockIAM()
+        mocker.restore(snapshot)
+        mocker.mock_make_api_call('DeleteUser', {'UserName': 'John'})
+        assert 0 == mocker.policies['Admins'].attachment_count
+        assert 1 == snapshot.stores['policies']['Admins'].attachment_count
+
+        other = MockIAM()
+        other.restore(snapshot)
+        assert ['Admins'] == list(other.user_groups.targets('John'))
+        assert other.users['John'].login_profile is not None
+
+    @staticmethod
+    def make_plugin_tests(pytester, monkeypatch):
+        """Write the tests of a session using the plugin fixtures."""
+        monkeypatch.delenv('PYTEST_XDIST_WORKER', raising=False)
+        pytester.makefile('.json', account=json.dumps(
+            {'groups': ['Admins'],
+             'users': [{'name': 'John', 'groups': ['Admins']}]}
+        ))
+        pytester.makeini('[pytest]\nmockboto3_iam_fixture = account.json\n'
+                         'mockboto3_metrics = metrics.json\n')
+        pytester.makepyfile("""
+            import boto3
+            import pytest
+
+            client = boto3.client('iam', region_name='us-east-1')
+
+            @pytest.mark.parametrize('index', range(4))
+            def test_isolated(iam_mock, index):
+                client.create_user(UserName='user%d' % index)
+                client.delete_user(UserName='John')
+                assert ['user%d' % index] == [
+                    user['UserName'] for user in client.list_users()['Users']
+                ]
+
+            @pytest.mark.parametrize('index', range(4))
+            @pytest.mark.iam_shared
+            def test_shared(iam_mock, index):
+                client.create_user(UserName='shared%d' % index)
+                client.add_user_to_group(UserName='shared%d' % index,
+                                         GroupName='Admins')
+
+            @pytest.mark.iam_shared
+            def test_shared_total(iam_mock):
+                assert 5 == len(iam_mock.user_groups.sources('Admins'))
+        """)
+
+    def test_plugin(self, pytester, monkeypatch):
+        """Test tests get isolated views of the session baseline."""
+        self.make_plugin_tests(pytester, monkeypatch)
+        result = pytester.runpytest('-p', 'mockboto3.pytest_plugin',
+                                    '-p', 'no:cacheprovider')
+        result.assert_outcomes(passed=9)
+
+        metrics = json.loads(pytester.path.joinpath('metrics.json')
+                             .read_text())
+        assert 8 == metrics['CreateUser']['calls']
+        assert 4 == metrics['DeleteUser']['calls']
+
+    def test_plugin_xdist(self, pytester, monkeypatch):
+        """Test xdist workers share the baseline and the shared account."""
+        pytest.importorskip('xdist')
+        self.make_plugin_tests(pytester, monkeypatch)
+        result = pytester.runpytest('-p', 'mockboto3.pytest_plugin',
+                                    '-p', 'no:cacheprovider',
+                                    '-p', 'xdist', '-n', '2',
+                                    '-k', 'not total')
+        result.assert_outcomes(passed=8)
+
+        # Shared tests of both workers changed one account, pytester
+        # puts the basetemp of the run next to its directory
+        storage = SqliteStorage(str(
+            pytester.path.parent / 'basetemp' / 'mockboto3-iam-shared.db'
+        ))
+        mocker = MockIAM(storage=storage)
+        assert 5 == mocker.user_groups.count_sources('Admins')
+        storage.close()
+
+        calls = 0
+        for worker in ('gw0', 'gw1'):
+            metrics = json.loads(pytester.path.joinpath(
+                'metrics.%s.json' % worker
+            ).read_text())
+            calls += metrics['CreateUser']['calls']
+        assert 8 == calls
+
+
+class TestMetrics:
+
+    @classmethod
+    def setup_class(cls):
+        cls.client = boto3.client('iam')
+
+    def test_metrics(self, tmpdir):
+        """Test calls, errors and latencies are recorded per operation."""
+        metrics = Metrics()
+        mocker = MockIAM(metrics=metrics)
+        call = mocker.mock_make_api_call
+
+        call('CreateUser', {'UserName': 'John'})
+        for _ in range(5):
+            call('GetUser', {'UserName': 'John'})
+        with pytest.raises(MockBoto3ClientError):
+            call('GetUser', {'UserName': 'Jane'})
+        with pytest.raises(MockBoto3ClientError):
+            call('CreateGecko', {})
+
+        assert 8 == metrics.calls
+        assert 6 == metrics['GetUser'].calls
+        assert {'NoSuchEntity': 1} == metrics['GetUser'].errors
+        assert {'NoSuchMethod': 1} == metrics['CreateGecko'].errors
+        assert 'ListUsers' not in metrics
+        assert 6 == sum(metrics['GetUser'].histogram)
+        assert 0 < metrics['GetUser'].mean_time <= \
+            metrics['GetUser'].max_time
+        assert metrics['GetUser'].percentile(0.5) <= \
+            metrics['GetUser'].percentile(0.99)
+
+        path = str(tmpdir.join('metrics.json'))
+        metrics.dump(path)
+        with open(path) as metrics_file:
+            dumped = json.load(metrics_file)
+
+        assert ['GetUser', 'CreateGecko', 'CreateUser'] == list(dumped)
+        assert 6 == sum(dumped['GetUser']['histogram_us'].values())
+
+        metrics.reset()
+        assert 0 == metrics.calls
+        assert 0 == OperationMetrics().percentile(0.5)
+
+    def test_metrics_shared(self):
+        """Test one Metrics collects the calls of several mocks."""
+        metrics = Metrics()
+
+        @mock_iam(metrics=metrics, thread_safe=True)
+        def create_user():
+            self.client.create_user(UserName='John')
+
+        create_user()
+        create_user()
+        assert 2 == metrics['CreateUser'].calls
+        assert not metrics['CreateUser'].errors
+
+
+class TestTrace:
+
+    @classmethod
+    def setup_class(cls):
+        cls.client = boto3.client('iam')
+
+    def record(self, path):
+        @mock_iam(trace=path)
+        def workflow():
+            self.client.create_user(UserName='John')
+            key_id = self.client.create_access_key(
+                UserName='John'
+            )['AccessKey']['AccessKeyId']
+            self.client.update_access_key(UserName='John',
+                                          AccessKeyId=key_id,
+                                          Status='Inactive')
+            with pytest.raises(ClientError):
+                self.client.get_user(UserName='Jane')
+            self.client.delete_access_key(UserName='John',
+                                          AccessKeyId=key_id)
+            self.client.list_users()
+
+        workflow()
+
+    @pytest.mark.parametrize('name', ['trace.jsonl', 'trace.jsonl.gz'])
+    def test_record_replay(self, tmpdir, name):
+        """Test a recorded workflow replays on a fresh mock."""
+        path = str(tmpdir.join(name))
+        self.record(path)
+
+        entries = list(read_trace(path))
+        assert ['CreateUser', 'CreateAccessKey', 'UpdateAccessKey',
+                'GetUser', 'DeleteAccessKey', 'ListUsers'] == \
+            [entry['op'] for entry in entries]
+        assert 'NoSuchEntity' == entries[3]['error']['Code']
+        assert 'ResponseMetadata' not in entries[0]['response']
+        assert entries[0]['response']['User']['CreateDate']
+
+        # Access key ids of the replay are mapped to recorded ones
+        mocker = MockIAM()
+        result = replay(path, mocker.mock_make_api_call)
+        assert 6 == result.calls
+        assert {'NoSuchEntity': 1} == result.errors
+        assert [] == result.mismatches
+        assert 0 == len(mocker.access_keys)
+        assert result.calls_per_second > 0
+
+        # Replaying on the same mock fails to create John again
+        result = replay(path, mocker.mock_make_api_call)
+        assert (1, 'CreateUser', None, 'EntityAlreadyExists') == \
+            result.mismatches[0]
+
+    def test_replay_pacing(self, tmpdir):
+        """Test replay keeps the recorded pace scaled by speed."""
+        path = str(tmpdir.join('trace.jsonl'))
+        with open(path, 'w') as trace_file:
+            for index in range(3):
+                trace_file.write(json.dumps(
+                    {'t': index * 0.05, 'op': 'CreateUser',
+                     'kwargs': {'UserName': 'user%d' % index},
+                     'response': {}}
+                ) + '\n')
+
+        result = replay(path, MockIAM().mock_make_api_call, speed=1.0)
+        assert result.elapsed >= 0.1
+        result = replay(path, MockIAM().mock_make_api_call, speed=10.0)
+        assert result.elapsed < 0.05
+
+
+class TestThrottle:
+
+    @classmethod
+    def setup_class(cls):
+        cls.client = boto3.client('iam')
+
+    def test_token_bucket(self):
+        """Test buckets refill at their rate up to the burst."""
+        now = [0.0]
+        bucket = TokenBucket(2, burst=3, clock=lambda: now[0])
+
+        assert [True, True, True, False] == [bucket.take()
+                                             for _ in range(4)]
+        now[0] = 0.5
+        assert bucket.take()
+        assert not bucket.take()
+        now[0] = 100.0
+        assert 3 == sum(bucket.take() for _ in range(10))
+
+    def test_throttle(self):
+        """Test operation and account limits raise Throttling."""
+        now = [0.0]
+        delays = []
+        metrics = Metrics()
+        throttle = Throttle(rates={'GetUser': 2}, account_rate=(100, 5),
+                            latency={'CreateUser': 0.25},
+                            clock=lambda: now[0], sleep=delays.append)
+
+        @mock_iam(throttle=throttle, metrics=metrics)
+        def calls():
+            self.client.create_user(UserName='John')
+            self.client.get_user(UserName='John')
+            self.client.get_user(UserName='John')
+            with pytest.raises(ClientError) as error:
+                self.client.get_user(UserName='John')
+            assert 'Throttling' == error.value.response['Error']['Code']
+
+            # Account bucket allows bursts of 5 calls, throttled calls
+            # do not count
+            self.client.list_users()
+            self.client.list_users()
+            with pytest.raises(ClientError):
+                self.client.list_users()
+
+            now[0] = 1.0
+            self.client.get_user(UserName='John')
+
+        calls()
+        assert [0.25] == delays
+        assert 2 == throttle.throttled
+        assert {'Throttling': 1} == metrics['GetUser'].errors
+        assert {'Throttling': 1} == metrics['ListUsers'].errors
+
+    def test_latency_distributions(self):
+        """Test latency distributions are reproducible from a seed."""
+        assert 0.5 == delay_for(0.5, 'GetUser')
+        assert delay_for({'GetUser': 1}, 'ListUsers') is None
+
+        first = [lognormal(0.05, 0.5, seed=1)('GetUser') for _ in range(3)]
+        assert first == [lognormal(0.05, 0.5, seed=1)('GetUser')
+                         for _ in range(3)]
+        latency = lognormal(0.05, 0.5, seed=2)
+        samples = sorted(latency('GetUser') for _ in range(1001))
+        assert 0.04 < samples[500] < 0.06
+
+        latency = uniform(0.1, 0.2, seed=1)
+        assert all(0.1 <= latency('GetUser') <= 0.2 for _ in range(100))
+
+        slept = []
+        Throttle(latency=latency, sleep=slept.append)('GetUser')
+        assert 1 == len(slept)
+
+    def test_account_throttle_refund(self):
+        """Test calls throttled by the account keep operation tokens."""
+        now = [0.0]
+        throttle = Throttle(rates={'GetUser': (0.1, 2)}, account_rate=(1, 1),
+                            clock=lambda: now[0])
+
+        throttle('ListUsers')
+        for _ in range(3):
+            with pytest.raises(MockBoto3ClientError):
+                throttle('GetUser')
+
+        # The account refills, both GetUser tokens are still there
+        now[0] = 1.0
+        throttle('GetUser')
+        now[0] = 2.0
+        throttle('GetUser')
+        assert 3 == throttle.throttled
+
+
+def policy_document(*statements):
+    return json.dumps({'Version': '2012-10-17', 'Statement': statements})
+
+
+class TestPolicyEngine:
+
+    @classmethod
+    def setup_class(cls):
+        cls.arn = 'arn:aws:iam::aws:policy/%s'
+        cls.client = boto3.client('iam')
+        cls.read_only = policy_document(
+            {'Effect': 'Allow', 'Action': ['iam:Get*', 'iam:List?sers'],
+             'Resource': '*'},
+            {'Effect': 'Deny', 'Action': 'iam:GetUser',
+             'Resource': 'arn:aws:iam::123456789012:user/admin*'}
+        )
+
+    def test_evaluate(self):
+        """Test wildcards, case and explicit deny precedence."""
+        evaluator = PolicyEvaluator([('ReadOnly', 'none', self.read_only)])
+        user = 'arn:aws:iam::123456789012:user/John'
+        admin = 'arn:aws:iam::123456789012:user/admin-1'
+
+        assert (ALLOWED, [('ReadOnly', 'none', 0)]) == \
+            evaluator.evaluate('IAM:getuser', user)
+        assert (EXPLICIT_DENY, [('ReadOnly', 'none', 1)]) == \
+            evaluator.evaluate('iam:GetUser', admin)
+        assert (IMPLICIT_DENY, []) == \
+            evaluator.evaluate('iam:CreateUser', user)
+        assert [True, False, True, False] == list(evaluator.evaluate_many([
+            ('iam:ListUsers', user), ('iam:ListGroups', user),
+            ('iam:GetGroup', admin), ('iam:GetUser', admin)
+        ]))
+
+    def test_not_action_condition(self):
+        """Test NotAction, NotResource and conditional statements."""
+        document = policy_document(
+            {'Effect': 'Allow', 'NotAction': 'iam:Delete*',
+             'NotResource': 'arn:aws:iam::123456789012:group/*'},
+            {'Effect': 'Deny', 'Action': '*', 'Resource': '*',
+             'Condition': {'Bool': {'aws:SecureTransport': 'false'}}}
+        )
+        evaluator = PolicyEvaluator([('Admin', 'none', document)])
+
+        assert evaluator.is_allowed('iam:CreateUser', 'user/John')
+        assert not evaluator.is_allowed('iam:DeleteUser', 'user/John')
+        assert not evaluator.is_allowed(
+            'iam:CreateGroup', 'arn:aws:iam::123456789012:group/Admins'
+        )
+        assert compile_policy(document) is compile_policy(document)
+
+        for malformed in ('{', '{}', policy_document({'Effect': 'Maybe',
+                                                      'Action': '*'})):
+            with pytest.raises(ValueError):
+                compile_policy(malformed)
+
+    @mock_iam
+    def test_simulate_principal_policy(self):
+        """Test simulating the policies of users and groups."""
+        self.client.create_user(UserName='John')
+        self.client.create_group(GroupName='readers')
+        self.client.add_user_to_group(UserName='John', GroupName='readers')
+        self.client.create_policy(PolicyName='ReadOnly',
+                                  PolicyDocument=self.read_only)
+        self.client.create_policy(PolicyName='NoKeys',
+                                  PolicyDocument=policy_document(
+                                      {'Effect': 'Deny',
+                                       'Action': 'iam:*AccessKey*',
+                                       'Resource': '*'}))
+        self.client.attach_group_policy(GroupName='readers',
+                                        PolicyArn=self.arn % 'ReadOnly')
+        self.client.attach_user_policy(UserName='John',
+                                       PolicyArn=self.arn % 'NoKeys')
+
+        response = self.client.simulate_principal_policy(
+            PolicySourceArn='arn:aws:iam::123456789012:user/John',
+            ActionNames=['iam:GetUser', 'iam:ListAccessKeys',
+                         'iam:CreateUser']
+        )
+        results = response['EvaluationResults']
+        assert ['allowed', 'explicitDeny', 'implicitDeny'] == [
+            result['EvalDecision'] for result in results
+        ]
+        assert ['*'] * 3 == [result['EvalResourceName']
+                             for result in results]
+        assert [{'SourcePolicyId': 'ReadOnly',
+                 'SourcePolicyType': 'user-managed'}] == \
+            results[0]['MatchedStatements']
+
+        paginator = self.client.get_paginator('simulate_principal_policy')
+        pages = list(paginator.paginate(
+            PolicySourceArn='arn:aws:iam::123456789012:group/readers',
+            ActionNames=['iam:GetUser', 'iam:ListUsers'],
+            ResourceArns=['user/John', 'user/Jane'],
+            PaginationConfig={'PageSize': 3}
+        ))
+        assert [3, 1] == [len(page['EvaluationResults']) for page in pages]
+        assert all(result['EvalDecision'] == 'allowed'
+                   for page in pages for result in page['EvaluationResults'])
+
+        for arn, code in (('arn:aws:iam::123456789012:user/Jane',
+                           'NoSuchEntity'),
+                          ('arn:aws:iam::123456789012:role/Admin',
+                           'InvalidInput')):
+            with pytest.raises(ClientError) as error:
+                self.client.simulate_principal_policy(
+                    PolicySourceArn=arn, ActionNames=['iam:GetUser']
+                )
+            assert code == error.value.response['Error']['Code']
+
+    @mock_iam
+    def test_simulate_custom_policy(self):
+        """Test simulating policies given in the request."""
+        response = self.client.simulate_custom_policy(
+            PolicyInputList=[self.read_only],
+            ActionNames=['iam:GetUser'],
+            ResourceArns=['arn:aws:iam::123456789012:user/John',
+                          'arn:aws:iam::123456789012:user/admin']
+        )
+        assert [('allowed', 'PolicyInputList.1'), ('explicitDeny',
+                                                   'PolicyInputList.1')] == [
+            (result['EvalDecision'],
+             result['MatchedStatements'][0]['SourcePolicyId'])
+            for result in response['EvaluationResults']
+        ]
+
+        for document in ('{}', policy_document('Allow'),
+                         policy_document({'Effect': 'Allow', 'Action': 1}),
+                         policy_document({'Effect': 'Allow',
+                                          'Action': ['iam:*', None]}),
+                         json.dumps({'Statement': 'Allow'})):
+            with pytest.raises(ClientError) as error:
+                self.client.simulate_custom_policy(
+                    PolicyInputList=[document], ActionNames=['iam:GetUser']
+                )
+            assert 'MalformedPolicyDocument' == \
+                error.value.response['Error']['Code']
+
+    def test_policy_evaluator(self):
+        """Test evaluators of a principal built from the mock."""
+        mocker = MockIAM()
+        mocker.load({
+            'policies': [{'name': 'ReadOnly', 'document': self.read_only}],
+            'users': [{'name': 'John', 'policies': ['ReadOnly']}]
+        })
+        evaluator = mocker.policy_evaluator(
+            'arn:aws:iam::123456789012:user/John'
+        )
+        assert evaluator.is_allowed('iam:GetUser', 'user/John')
+        assert not evaluator.is_allowed('iam:CreateUser', 'user/John')
+
+
+class TestPolicyVersions:
+
+    @classmethod
+    def setup_class(cls):
+        cls.client = boto3.client('iam')
+        cls.policy = 'arn:aws:iam::aws:policy/Admins'
+        cls.read_only = policy_document(
+            {'Effect': 'Allow', 'Action': 'iam:Get*', 'Resource': '*'}
+        )
+
+    @mock_iam
+    def test_policy_versions(self):
+        """Test version lifecycle, limit and default version."""
+        self.client.create_policy(PolicyName='Admins',
+                                  PolicyDocument=POLICY_DOC)
+        response = self.client.create_policy_version(
+            PolicyArn=self.policy, PolicyDocument=self.read_only,
+            SetAsDefault=True
+        )
+        assert 'v2' == response['PolicyVersion']['VersionId']
+        assert response['PolicyVersion']['IsDefaultVersion']
+        assert 'v2' == self.client.get_policy(
+            PolicyArn=self.policy)['Policy']['DefaultVersionId']
+
+        for _ in range(3):
+            self.client.create_policy_version(PolicyArn=self.policy,
+                                              PolicyDocument=POLICY_DOC)
+        with pytest.raises(ClientError) as error:
+            self.client.create_policy_version(PolicyArn=self.policy,
+                                              PolicyDocument=POLICY_DOC)
+        assert 'LimitExceeded' == error.value.response['Error']['Code']
+
+        with pytest.raises(ClientError) as error:
+            self.client.delete_policy_version(PolicyArn=self.policy,
+                                              VersionId='v2')
+        assert 'DeleteConflict' == error.value.response['Error']['Code']
+
+        self.client.delete_policy_version(PolicyArn=self.policy,
+                                          VersionId='v3')
+        self.client.create_policy_version(PolicyArn=self.policy,
+                                          PolicyDocument=POLICY_DOC)
+        versions = self.client.list_policy_versions(
+            PolicyArn=self.policy)['Versions']
+        assert ['v1', 'v2', 'v4', 'v5', 'v6'] == [
+            version['VersionId'] for version in versions
+        ]
+        assert [False, True, False, False, False] == [
+            version['IsDefaultVersion'] for version in versions
+        ]
+
+        self.client.set_default_policy_version(PolicyArn=self.policy,
+                                               VersionId='v1')
+        version = self.client.get_policy_version(
+            PolicyArn=self.policy, VersionId='v1')['PolicyVersion']
+        assert version['IsDefaultVersion']
+        assert json.loads(POLICY_DOC) == json.loads(version['Document'])
+
+        for call in (self.client.get_policy_version,
+                     self.client.set_default_policy_version,
+                     self.client.delete_policy_version):
+            with pytest.raises(ClientError) as error:
+                call(PolicyArn=self.policy, VersionId='v3')
+            assert 'NoSuchEntity' == error.value.response['Error']['Code']
+
+    def test_shared_documents(self):
+        """Test identical documents are stored once and released."""
+        mocker = MockIAM()
+        mocker.load({'policies': [{'name': 'policy%d' % index,
+                                   'document': POLICY_DOC}
+                                  for index in range(100)]})
+        assert 1 == len(mocker.documents)
+        document = next(iter(mocker.documents.values()))
+        assert 100 == document.references
+
+        arn = 'arn:aws:iam::aws:policy/policy0'
+        mocker.create_policy_version({'PolicyArn': arn,
+                                      'PolicyDocument': self.read_only})
+        assert 2 == len(mocker.documents)
+        mocker.delete_policy_version({'PolicyArn': arn, 'VersionId': 'v2'})
+        assert [document.key] == list(mocker.documents)
+
+        mocker = MockIAM(storage=SqliteStorage())
+        mocker.load({'policies': [{'name': name, 'document': POLICY_DOC}
+                                  for name in ('Admins', 'Users')]})
+        call = mocker.mock_make_api_call
+        call('CreatePolicyVersion', {'PolicyArn': self.policy,
+                                     'PolicyDocument': self.read_only,
+                                     'SetAsDefault': True})
+        assert 2 == len(mocker.documents)
+        response = call('GetPolicyVersion', {'PolicyArn': self.policy,
+                                             'VersionId': 'v2'})
+        assert self.read_only == response['PolicyVersion']['Document']
+
+
+class MockSTS(MockService):
+    """Minimal second service for routing tests."""
+
+    service_name = 'sts'
+
+    @operation('GetCallerIdentity')
+    def get_caller_identity(self, kwargs):
+        return {'Account': '123456789012'}
+
+
+class TestRouter:
+
+    @classmethod
+    def setup_class(cls):
+        cls.client = make_client('iam')
+
+    @mock_iam
+    def test_pass_through(self):
+        """Test clients of services without a mock make real calls."""
+        s3 = boto3.client('s3', region_name='us-east-1')
+        with Stubber(s3) as stubber:
+            stubber.add_response('list_buckets', {'Buckets': []})
+            assert [] == s3.list_buckets()['Buckets']
+            stubber.assert_no_pending_responses()
+
+        self.client.create_user(UserName='John')
+        assert 'John' == self.client.get_user(
+            UserName='John')['User']['UserName']
+
+    def test_lazy_services(self):
+        """Test mocks are created on the first call of their service."""
+        router = Router(services={'iam': 'mockboto3.iam.endpoints.MockIAM',
+                                  'sts': '%s.MockSTS' % __name__},
+                        thread_safe=True)
+        assert MockIAM is import_service('mockboto3.iam.endpoints.MockIAM')
+
+        with patch('botocore.client.BaseClient._make_api_call', new=router):
+            sts = boto3.client('sts', region_name='us-east-1')
+            assert {} == router.mocks
+            assert '123456789012' == \
+                sts.get_caller_identity()['Account']
+            assert ['sts'] == list(router.mocks)
+
+            self.client.create_user(UserName='John')
+
+        assert 'John' in router.mock('iam').users
+        assert router.mock('iam').locks is not None
+        assert router.mock('s3') is None
+        assert router is Router.__get__(router, None, BaseClient)
+
+
+class TestClients:
+
+    @mock_iam
+    def test_make_client(self):
+        """Test clients are copies of one prototype per region."""
+        first = make_client('iam')
+        second = make_client('iam')
+        assert first is not second
+        assert first.meta is second.meta
+        assert first.meta is not make_client('iam', 'eu-west-1').meta
+
+        first.create_user(UserName='John')
+        assert 'John' == second.get_user(UserName='John')['User']['UserName']
+
+        with pytest.raises(ClientError):
+            second.get_user(UserName='Jane')
+
+
+class TestImports:
+
+    def test_deferred_imports(self):
+        """Test importing the mocks leaves heavy modules unloaded."""
+        script = 'import sys, pytest; before = set(sys.modules); ' \
+                 'import mockboto3.iam.endpoints, mockboto3.pytest_plugin; ' \
+                 'print(" ".join(sorted(set(sys.modules) - before)))'
+        loaded = subprocess.run([sys.executable, '-c', script],
+                                capture_output=True, check=True,
+                                text=True).stdout.split()
+
+        assert 'mockboto3.iam.endpoints' in loaded
+        for module in ('asyncio', 'boto3', 'botocore.client', 'sqlite3',
+                       'unittest.mock'):
+            assert module not in loaded
+
+    def test_lazy_package(self):
+        """Test public names are imported on first access."""
+        import mockboto3
+
+        assert mock_iam is mockboto3.mock_iam
+        assert make_client is mockboto3.make_client
+        assert 'MockIAM' in dir(mockboto3)
+        with pytest.raises(AttributeError):
+            mockboto3.MockGecko
+
+
+class TestClock:
+
+    @classmethod
+    def setup_class(cls):
+        cls.start = datetime(2017, 1, 1, tzinfo=timezone.utc)
+
+    def test_clocks(self):
+        """Test frozen and manual clocks only move when advanced."""
+        assert not Clock.virtual
+        assert Clock().now().tzinfo is not None
+
+        clock = FrozenClock(self.start)
+        clock.sleep(10)
+        assert clock.now() is clock.now()
+        assert self.start.timestamp() == clock.time() == clock.monotonic()
+
+        clock = ManualClock(self.start)
+        clock.sleep(30)
+        assert datetime(2017, 4, 1, 0, 0, 30, tzinfo=timezone.utc) == \
+            clock.advance(days=90)
+        assert clock.time() == clock.now().timestamp()
+
+        with pytest.raises(ValueError):
+            clock.advance(-1)
+        with pytest.raises(ValueError):
+            FrozenClock(datetime(2017, 1, 1))
+
+    def test_mock_clock(self):
+        """Test entities and responses use the time of the mock."""
+        clock = ManualClock(self.start)
+        mocker = MockIAM(clock=clock)
+        call = mocker.mock_make_api_call
+        mocker.load({'users': ['John', 'Jane']})
+        assert mocker.users['John'].create_date is \
+            mocker.users['Jane'].create_date
+
+        old = call('CreateAccessKey', {'UserName': 'John'})['AccessKey']
+        clock.advance(days=90)
+        response = call('CreateAccessKey', {'UserName': 'John'})
+        assert 'Sat, 01 Apr 2017 00:00:00 GMT' == \
+            response['ResponseMetadata']['HTTPHeaders']['date']
+
+        ages = dict((key.id, clock.now() - key.create_date)
+                    for key in mocker.access_keys.values())
+        assert 90 == ages[old['AccessKeyId']].days
+        assert 0 == ages[response['AccessKey']['AccessKeyId']].days
+
+        response = call('GetAccessKeyLastUsed',
+                        {'AccessKeyId': old['AccessKeyId']})
+        assert self.start == response['AccessKeyLastUsed']['LastUsedDate']
+
+    def test_throttle_clock(self):
+        """Test throttles refill in virtual time."""
+        clock = ManualClock(self.start)
+        throttle = Throttle(rates={'GetUser': 1}, latency=0.5,
+                            clock=clock.monotonic, sleep=clock.sleep)
+        mocker = MockIAM(clock=clock, throttle=throttle)
+        mocker.load({'users': ['John']})
+
+        mocker.mock_make_api_call('GetUser', {'UserName': 'John'})
+        assert 0.5 == clock.time() - self.start.timestamp()
+        with pytest.raises(ClientError):
+            mocker.mock_make_api_call('GetUser', {'UserName': 'John'})
+
+        clock.advance(1)
+        mocker.mock_make_api_call('GetUser', {'UserName': 'John'})
+
+
+class TestJournal:
+
+    def test_savepoint_diff(self):
+        """Test diffs list exactly the entities changed between points."""
+        mocker = MockIAM(journal=True)
+        call = mocker.mock_make_api_call
+        mocker.load({'users': ['John', 'Jane'], 'groups': ['Admins']})
+
+        start = mocker.savepoint()
+        for _ in range(3):
+            call('CreateAccessKey', {'UserName': 'John'})
+        call('AddUserToGroup', {'UserName': 'Jane', 'GroupName': 'Admins'})
+        middle = mocker.savepoint()
+        call('CreateLoginProfile', {'UserName': 'Jane', 'Password': 'secret'})
+        call('DeleteGroup', {'GroupName': 'Admins'})
+
+        changes = mocker.diff(start, middle)
+        assert ['access_keys', 'user_access_keys', 'user_groups'] == \
+            sorted(changes)
+        assert 3 == len(changes['access_keys'].added)
+        assert [('Jane', 'Admins')] == changes['user_groups'].added
+
+        changes = mocker.diff(middle)
+        assert ['Jane'] == changes['users'].changed
+        assert ['Admins'] == changes['groups'].removed
+        assert [('Jane', 'Admins')] == changes['user_groups'].removed
+
+        # Changes cancelling out are not reported
+        changes = mocker.diff(start)
+        assert 'user_groups' not in changes
+        assert not Changes()
+
+        with pytest.raises(ValueError):
+            mocker.diff(middle, start)
+
+    def test_diff_unchanged(self):
+        """Test entities fetched to change but left as is are not diffed."""
+        for baseline in (None, BASELINE):
+            mocker = MockIAM(journal=True)
+            if baseline is None:
+                mocker.load({'users': [{'name': 'John',
+                                        'login_profile': {'password': 'a'}}]})
+            else:
+                mocker.restore(baseline)
+
+            savepoint = mocker.savepoint()
+            with pytest.raises(MockBoto3ClientError):
+                mocker.mock_make_api_call('CreateLoginProfile',
+                                          {'UserName': 'John',
+                                           'Password': 'secret'})
+            assert {} == mocker.diff(savepoint)
+
+            mocker.mock_make_api_call('UpdateLoginProfile',
+                                      {'UserName': 'John',
+                                       'PasswordResetRequired': True})
+            assert ['John'] == mocker.diff(savepoint)['users'].changed
+
+    def test_rollback(self):
+        """Test rolling back restores the state at the savepoint."""
+        mocker = MockIAM(journal=True)
+        call = mocker.mock_make_api_call
+        mocker.load({'users': [{'name': 'John', 'access_keys': 1,
+                                'groups': ['Admins']}],
+                     'groups': ['Admins']})
+        before = mocker.snapshot()
+
+        savepoint = mocker.savepoint()
+        key_id = list(mocker.access_keys)[0]
+        call('UpdateAccessKey', {'AccessKeyId': key_id, 'Status': 'Inactive'})
+        call('CreateUser', {'UserName': 'Jane'})
+        call('AddUserToGroup', {'UserName': 'Jane', 'GroupName': 'Admins'})
+        call('RemoveUserFromGroup', {'UserName': 'John',
+                                     'GroupName': 'Admins'})
+        mocker.rollback_to(savepoint)
+
+        after = mocker.snapshot()
+        assert list(before.stores['users']) == list(after.stores['users'])
+        assert 'Active' == mocker.access_keys[key_id].status
+        assert before.relations == after.relations
+        assert not mocker.diff(savepoint)
+
+        with pytest.raises(ValueError):
+            mocker.rollback_to(savepoint + 1)
+
+    def test_rollback_baseline(self):
+        """Test rolling back a restored mock shows the baseline again."""
+        mocker = MockIAM(journal=True)
+        mocker.restore(BASELINE)
+        call = mocker.mock_make_api_call
+
+        for _ in range(3):
+            savepoint = mocker.savepoint()
+            call('CreateUser', {'UserName': 'Jane'})
+            call('DetachUserPolicy', {
+                'UserName': 'John',
+                'PolicyArn': 'arn:aws:iam::aws:policy/Admins'
+            })
+            call('DeleteGroup', {'GroupName': 'Admins'})
+            assert 0 == mocker.policies['Admins'].attachment_count
+
+            changes = mocker.diff(savepoint)
+            assert ['Admins'] == changes['groups'].removed
+            assert ['Admins'] == changes['policies'].changed
+            mocker.rollback_to(savepoint)
+
+            assert ['John'] == list(mocker.users)
+            assert ['Admins'] == list(mocker.groups)
+            assert ['John'] == list(mocker.user_groups.sources('Admins'))
+            assert mocker.policies['Admins'] is \
+                BASELINE.stores['policies']['Admins']
+            assert 1 == mocker.policies['Admins'].attachment_count
+
+        assert not mocker.journal.entries
+
+    def test_not_journaled(self):
+        """Test savepoints need an in-memory journaled mock."""
+        with pytest.raises(ValueError):
+            MockIAM().savepoint()
+        with pytest.raises(ValueError):
+            MockIAM(journal=True, storage=SqliteStorage())